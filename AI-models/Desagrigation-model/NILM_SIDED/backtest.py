@@ -0,0 +1,300 @@
+"""
+Offline backtesting of a NILM checkpoint over whole facility files.
+
+Each file (augmented CSV, or .parquet / .feather with the same columns) is
+loaded once and resampled as for training (CSV through data_loader's cache).
+Its windows are then streamed through the model in large batches: a pool of
+worker processes holds the model, and each worker gets cores // workers
+intra-op threads. Only a few batches per worker are in flight, so memory
+stays bounded however long the file is.
+
+Inputs are standardized with scaler_stats.json and outputs inverted and
+clamped to the sign conventions, exactly as the inference service does.
+Per appliance the metrics are accumulated batch by batch:
+- MAE (W)
+- NDE: sum of squared errors / sum of squared ground truth
+- sign-violation rate: share of raw outputs with the wrong sign (a load
+  below 0 or generation above 0) before the clamp
+
+--precision (fp32/bf16/fp16 autocast) and --backend (eager/torchscript)
+select the inference mode, so checkpoints and modes can be compared on the
+same data. The JSON report has the metrics per file and overall, and the
+throughput in windows/s.
+
+Usage:
+    python backtest.py AMDA_SIDED/Dealer/augmented_Dealer_Tokyo.csv
+    python backtest.py AMDA_SIDED/*/augmented_*_Tokyo.csv --checkpoint saved_models/TCN_student.pth \\
+        --precision bf16 --workers 4 --output backtest_student.json
+"""
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import torch
+
+from data_loader import load_location_file, resample_frame
+from models import build_model
+from nilm_dataset import sliding_windows
+from train import APPLIANCE_COLUMNS, DEFAULT_CONFIG
+
+LOAD_APPLIANCES = ['EVSE', 'CS', 'BA']
+GENERATION_APPLIANCES = ['PV', 'CHP']
+# Sign conventions as a clamp range per appliance: loads >= 0, generation <= 0
+OUTPUT_MIN = np.array([0.0 if name in LOAD_APPLIANCES else -np.inf for name in APPLIANCE_COLUMNS])
+OUTPUT_MAX = np.array([0.0 if name in GENERATION_APPLIANCES else np.inf for name in APPLIANCE_COLUMNS])
+
+PRECISIONS = {'fp32': None, 'bf16': torch.bfloat16, 'fp16': torch.float16}
+
+
+class StreamingMetrics:
+    """Per-appliance MAE, NDE and sign-violation rate, accumulated batch by batch."""
+    def __init__(self):
+        n = len(APPLIANCE_COLUMNS)
+        self.count = 0
+        self.abs_error = np.zeros(n)
+        self.sq_error = np.zeros(n)
+        self.sq_truth = np.zeros(n)
+        self.sign_violations = np.zeros(n, dtype=np.int64)
+
+    def update(self, raw_predictions:np.ndarray, truth:np.ndarray):
+        raw_predictions = raw_predictions.astype(np.float64)
+        self.sign_violations += ((raw_predictions < OUTPUT_MIN) | (raw_predictions > OUTPUT_MAX)).sum(axis=0)
+        error = np.clip(raw_predictions, OUTPUT_MIN, OUTPUT_MAX) - truth
+        self.abs_error += np.abs(error).sum(axis=0)
+        self.sq_error += np.square(error).sum(axis=0)
+        self.sq_truth += np.square(truth, dtype=np.float64).sum(axis=0)
+        self.count += len(truth)
+
+    def merge(self, other:'StreamingMetrics'):
+        for name in ('abs_error', 'sq_error', 'sq_truth', 'sign_violations'):
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+        self.count += other.count
+
+    def report(self):
+        count = max(1, self.count)
+        per_appliance = {
+            name: {
+                'mae': float(self.abs_error[i] / count),
+                'nde': float(self.sq_error[i] / self.sq_truth[i]) if self.sq_truth[i] > 0 else None,
+                'sign_violation_rate': float(self.sign_violations[i] / count),
+            }
+            for i, name in enumerate(APPLIANCE_COLUMNS)
+        }
+        return {
+            'windows': self.count,
+            'mean_mae': float(self.abs_error.sum() / (count * len(APPLIANCE_COLUMNS))),
+            'appliances': per_appliance,
+        }
+
+
+def load_series(file_path:Path, resample_rule='5min'):
+    """Aggregate input and appliance targets of one facility file."""
+    file_path = Path(file_path)
+    if file_path.suffix == '.parquet':
+        df = resample_frame(pd.read_parquet(file_path), resample_rule).dropna()
+    elif file_path.suffix == '.feather':
+        df = resample_frame(pd.read_feather(file_path), resample_rule).dropna()
+    else:
+        df = load_location_file(file_path, resample_rule)
+    return (df['Aggregate'].to_numpy(dtype=np.float32),
+            df[APPLIANCE_COLUMNS].to_numpy(dtype=np.float64))
+
+
+def load_model(checkpoint:Path, model_name:str, config:dict, backend:str, seq_length:int):
+    """Model from a checkpoint; a <checkpoint>.json architecture sidecar overrides `model_name`/config."""
+    checkpoint = Path(checkpoint)
+    sidecar = checkpoint.with_suffix('.json')
+    if sidecar.exists():
+        with open(sidecar) as f:
+            architecture = json.load(f)
+        model_name = architecture.pop('model', model_name)
+        config = dict(config, **architecture)
+    model = build_model(model_name, config)
+    model.load_state_dict(torch.load(checkpoint, map_location='cpu'))
+    model.eval()
+    if backend == 'torchscript':
+        with torch.no_grad():
+            model = torch.jit.freeze(torch.jit.trace(model, torch.zeros(1, seq_length, 1)))
+    return model
+
+
+class WindowPredictor:
+    """Standardize, forward and invert windows the way the inference service does."""
+    def __init__(self, model, stats:dict, precision:str='fp32'):
+        self.model = model
+        self.x_mean = torch.tensor(stats['x_mean'], dtype=torch.float32)
+        self.x_scale = torch.tensor(stats['x_scale'], dtype=torch.float32)
+        self.y_mean = torch.tensor(stats['y_mean'], dtype=torch.float32)
+        self.y_scale = torch.tensor(stats['y_scale'], dtype=torch.float32)
+        self.dtype = PRECISIONS[precision]
+
+    def __call__(self, windows:np.ndarray):
+        """(batch, seq_length) raw aggregate -> (batch, n_appliances) raw (unclamped) outputs in watts."""
+        X = (torch.from_numpy(np.ascontiguousarray(windows, dtype=np.float32)).unsqueeze(-1) - self.x_mean) / self.x_scale
+        with torch.inference_mode(), torch.autocast('cpu', dtype=self.dtype or torch.bfloat16,
+                                                    enabled=self.dtype is not None):
+            outputs = self.model(X)
+        outputs = outputs.float()
+        if outputs.dim() == 3:
+            outputs = outputs[:, -1]  # seq2seq models: the last step is the single-step prediction
+        outputs = torch.clamp(torch.nan_to_num(outputs, nan=0.0, posinf=0.0, neginf=0.0), min=-8.0, max=8.0)
+        return (outputs * self.y_scale + self.y_mean).numpy()
+
+
+# Per-process predictor used by the pool (loaded once per worker)
+_worker_predictor = None
+
+
+def _init_worker(checkpoint, model_name, config, backend, precision, stats, num_threads):
+    global _worker_predictor
+    torch.set_num_threads(num_threads)
+    model = load_model(checkpoint, model_name, config, backend, config['seq_length'])
+    _worker_predictor = WindowPredictor(model, stats, precision)
+
+
+def _predict_chunk(series_chunk, seq_length):
+    return _worker_predictor(sliding_windows(series_chunk, seq_length)[:, :, 0])
+
+
+def backtest_file(file_path, seq_length, batch_size, submit, config):
+    """Stream every window of one file through `submit` and accumulate its metrics.
+
+    Returns the metrics and the seconds spent scoring (file loading excluded).
+    """
+    aggregate, targets = load_series(file_path, config['resample_rule'])
+    num_windows = len(aggregate) - seq_length
+    metrics = StreamingMetrics()
+    if num_windows <= 0:
+        return metrics, 0.0
+
+    start_time = time.perf_counter()
+    pending = []
+    for start in range(0, num_windows, batch_size):
+        stop = min(start + batch_size, num_windows)
+        # Windows start..stop-1 plus the row after the last one (sliding_windows drops it)
+        pending.append((start, stop, submit(aggregate[start:stop + seq_length], seq_length)))
+        while pending and (len(pending) >= submit.max_in_flight or pending[0][2].done()):
+            done_start, done_stop, future = pending.pop(0)
+            metrics.update(future.result(), targets[done_start + seq_length:done_stop + seq_length])
+    for done_start, done_stop, future in pending:
+        metrics.update(future.result(), targets[done_start + seq_length:done_stop + seq_length])
+    return metrics, time.perf_counter() - start_time
+
+
+class _InProcess:
+    """submit() with the pool's interface that runs the chunk immediately."""
+    max_in_flight = 1
+
+    class _Done:
+        def __init__(self, value):
+            self.value = value
+
+        def done(self):
+            return True
+
+        def result(self):
+            return self.value
+
+    def __call__(self, series_chunk, seq_length):
+        return self._Done(_predict_chunk(series_chunk, seq_length))
+
+
+class _PoolSubmit:
+    def __init__(self, executor, workers):
+        self.executor = executor
+        self.max_in_flight = 2 * workers
+
+    def __call__(self, series_chunk, seq_length):
+        return self.executor.submit(_predict_chunk, series_chunk, seq_length)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Backtest a NILM checkpoint over full facility files')
+    parser.add_argument('files', nargs='+', type=Path, help='Augmented CSV, .parquet or .feather files')
+    parser.add_argument('--checkpoint', type=Path, default=Path('./saved_models/TCN_best.pth'))
+    parser.add_argument('--model', default='TCN', help='Model name when the checkpoint has no .json sidecar')
+    parser.add_argument('--config', type=Path, help='JSON file overriding DEFAULT_CONFIG keys (as for train.py)')
+    parser.add_argument('--scaler-stats', type=Path, help='Default: scaler_stats.json next to the checkpoint')
+    parser.add_argument('--precision', choices=list(PRECISIONS), default='fp32')
+    parser.add_argument('--backend', choices=['eager', 'torchscript'], default='eager')
+    parser.add_argument('--batch-size', type=int, default=4096, help='Windows per forward')
+    parser.add_argument('--workers', type=int, default=None, help='Worker processes (default: cores // 4, 0 = in-process)')
+    parser.add_argument('--output', type=Path, default=Path('./backtest_report.json'))
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    config = dict(DEFAULT_CONFIG)
+    if args.config:
+        with open(args.config) as f:
+            config.update(json.load(f))
+    stats_path = args.scaler_stats or args.checkpoint.parent / 'scaler_stats.json'
+    with open(stats_path) as f:
+        stats = json.load(f)
+    if stats['appliances'] != APPLIANCE_COLUMNS:
+        raise ValueError(f"Scaler stats appliances {stats['appliances']} do not match {APPLIANCE_COLUMNS}")
+    seq_length = stats.get('seq_length', config['seq_length'])
+    config['seq_length'] = seq_length
+    config['resample_rule'] = stats.get('resample_rule', config['resample_rule'])
+
+    cpu_count = os.cpu_count() or 1
+    workers = max(1, cpu_count // 4) if args.workers is None else args.workers
+    num_threads = max(1, cpu_count // max(1, workers))
+    init_args = (args.checkpoint, args.model, config, args.backend, args.precision, stats, num_threads)
+    print(f"Backtesting {args.checkpoint} | {args.precision} | {args.backend} | "
+          f"workers: {workers} | threads/worker: {num_threads} | batch: {args.batch_size}")
+
+    overall = StreamingMetrics()
+    files = {}
+    total_seconds = 0.0
+
+    def run(submit):
+        nonlocal total_seconds
+        for file_path in args.files:
+            metrics, seconds = backtest_file(file_path, seq_length, args.batch_size, submit, config)
+            overall.merge(metrics)
+            total_seconds += seconds
+            files[str(file_path)] = dict(metrics.report(), seconds=seconds,
+                                         windows_per_sec=metrics.count / max(seconds, 1e-9))
+            print(f"  {file_path}: {metrics.count:,} windows | mean MAE {files[str(file_path)]['mean_mae']:.2f} W | "
+                  f"{files[str(file_path)]['windows_per_sec']:,.0f} windows/s")
+
+    if workers:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=init_args) as executor:
+            run(_PoolSubmit(executor, workers))
+    else:
+        _init_worker(*init_args)
+        run(_InProcess())
+
+    report = {
+        'checkpoint': str(args.checkpoint),
+        'precision': args.precision,
+        'backend': args.backend,
+        'workers': workers,
+        'threads_per_worker': num_threads,
+        'batch_size': args.batch_size,
+        'seq_length': seq_length,
+        'overall': dict(overall.report(), seconds=total_seconds,
+                        windows_per_sec=overall.count / max(total_seconds, 1e-9)),
+        'files': files,
+    }
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    print(f"\n{'Appliance':<10}{'MAE (W)':>12}{'NDE':>10}{'sign viol.':>12}")
+    for name, metrics in report['overall']['appliances'].items():
+        nde = f"{metrics['nde']:.4f}" if metrics['nde'] is not None else 'n/a'
+        print(f"{name:<10}{metrics['mae']:>12.2f}{nde:>10}{metrics['sign_violation_rate'] * 100:>11.2f}%")
+    print(f"{overall.count:,} windows in {total_seconds:.1f}s "
+          f"({report['overall']['windows_per_sec']:,.0f} windows/s) -> {args.output}")
+
+
+if __name__ == "__main__":
+    main()
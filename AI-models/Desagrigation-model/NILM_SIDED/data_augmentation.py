@@ -20,6 +20,57 @@ def amda_augmentation(original_df:pd.DataFrame, s=2.5, appliance_columns=["EVSE"
     
     return augmented_df
 
+# Per-source AMDA proportions p_i = sum|P_i| / sum_j sum|P_j| (computed once, reused by AMDATransform)
+def amda_proportions(df:pd.DataFrame, appliance_columns=["EVSE","PV","CS","CHP","BA"], group_columns=None):
+    """ Returns (proportions, source_ids): one row of p_i per source group and
+      the group index of every row of df. group_columns=None treats df as one source,
+      which matches amda_augmentation applied to a single CSV."""
+    abs_power = df[appliance_columns].abs()
+    if group_columns is None:
+        totals = abs_power.sum().to_numpy()[np.newaxis, :]
+        source_ids = np.zeros(len(df), dtype=np.int64)
+    else:
+        groups = abs_power.groupby([df[c] for c in group_columns], sort=False)
+        totals = groups.sum().to_numpy()
+        source_ids = groups.ngroup().to_numpy().astype(np.int64)
+    proportions = totals / totals.sum(axis=1, keepdims=True)
+    return proportions.astype(np.float32), source_ids
+
+# On-the-fly AMDA: same scaling as amda_augmentation, applied to a batch of windows
+class AMDATransform:
+    """ Vectorized AMDA for training batches (used by nilm_dataset.AMDAWindowDataset).
+      One scale factor s is drawn per batch from s_range, S_i = s*(1-p_i) is applied
+      to the raw appliance windows/targets, the aggregate input is re-computed as the
+      sum of the scaled appliances and both are standardized with the training scalers'
+      statistics. s_range=(2.5, 2.5) reproduces the offline AMDA_SIDED dataset."""
+    def __init__(self, proportions, s_range=(1.0, 2.5), x_mean=0.0, x_scale=1.0, y_mean=0.0, y_scale=1.0, seed=None):
+        self.scale_factors = 1 - np.asarray(proportions, dtype=np.float32)
+        self.s_range = s_range
+        self.x_mean = np.float32(np.ravel(x_mean)[0])
+        self.x_scale = np.float32(np.ravel(x_scale)[0])
+        self.y_mean = np.asarray(y_mean, dtype=np.float32)
+        self.y_scale = np.asarray(y_scale, dtype=np.float32)
+        self.rng = np.random.default_rng(seed)
+
+    @classmethod
+    def from_scalers(cls, proportions, scaler_X, scaler_y, s_range=(1.0, 2.5), seed=None):
+        return cls(proportions, s_range=s_range, x_mean=scaler_X.mean_, x_scale=scaler_X.scale_,
+                   y_mean=scaler_y.mean_, y_scale=scaler_y.scale_, seed=seed)
+
+    def reseed(self, seed):
+        self.rng = np.random.default_rng(seed)
+
+    def __call__(self, appliance_windows:np.ndarray, appliance_targets:np.ndarray, source_ids:np.ndarray):
+        """ appliance_windows: (batch, seq_length, n_appliances) raw power,
+          appliance_targets: (batch, n_appliances) raw power, source_ids: (batch,)
+          Returns standardized (X, y) with shapes (batch, seq_length, 1) and (batch, n_appliances)."""
+        s = self.rng.uniform(*self.s_range)
+        S = s * self.scale_factors[source_ids]          # (batch, n_appliances)
+        aggregate = np.einsum('bla,ba->bl', appliance_windows, S)[..., np.newaxis]
+        X = (aggregate - self.x_mean) / self.x_scale
+        y = (appliance_targets * S - self.y_mean) / self.y_scale
+        return X, y
+
 # Augmented DataSet creation funcion (Assumes the original dir follows the structure of SIDED->Facilities->CSV file of different locations)
 def create_augmented_dataset(original_data_dir :Path,augmented_data_dir:Path,aug_fn=amda_augmentation):
     """ Augmented DataSet creation funcion (Assumes the original dir follows
@@ -0,0 +1,220 @@
+"""
+Knowledge distillation of the production TCN into a compact student TCN.
+
+The teacher (saved_models/TCN_best.pth, 8 levels of 64-128 channels) scores
+every training and validation window of the augmented SIDED source domain
+once. The student is a narrower TCN with the same 8 dilation levels, so it
+keeps the teacher's receptive field. It is trained with MSE against
+
+    alpha * teacher output + (1 - alpha) * ground truth
+
+which equals alpha * MSE(student, teacher) + (1 - alpha) * MSE(student, truth)
+up to a constant, so the usual distillation loss needs no second target
+tensor. The student is trained by train.py's train_model (epoch loop, LR
+schedule, early stopping and <name>_last.pt / <name>_best.pth checkpoints).
+
+The report (saved_models/<name>_report.json) covers the target-domain test
+windows. It gives per-appliance MAE in watts of the student against the
+teacher (and of both against the ground truth), CPU latency per call at a
+few batch sizes, and the parameter count and serialized size of both models.
+The student weights go to <name>.pth with its architecture in <name>.json.
+The inference service reads that file when MODEL_NAME points at the student.
+
+Usage:
+    python distill.py
+    python distill.py --student-channels 16 16 16 16 32 32 32 32 --alpha 0.8 --epochs 15
+"""
+import argparse
+import copy
+import io
+import json
+import math
+import time
+from pathlib import Path
+
+import numpy as np
+import torch
+
+from models import build_model
+from nilm_dataset import SlidingWindowDataset, make_loader
+from train import (APPLIANCE_COLUMNS, DEFAULT_CONFIG, configure_threads, model_architecture, prepare_data,
+                   train_model)
+
+DEFAULT_STUDENT_CHANNELS = [16, 16, 16, 16, 32, 32, 32, 32]
+
+
+def predict_windows(model, dataset, batch_size, device, **loader_kwargs):
+    """Standardized model outputs for every window of `dataset`, in order."""
+    model.eval()
+    outputs = []
+    with torch.no_grad():
+        for batch_X, _ in make_loader(dataset, batch_size, shuffle=False, **loader_kwargs):
+            batch_out = model(batch_X.to(device, non_blocking=True))
+            outputs.append(torch.nan_to_num(batch_out, nan=0.0, posinf=1e6, neginf=-1e6).float().cpu())
+    return torch.cat(outputs).numpy()
+
+
+def distillation_datasets(datasets, teacher_outputs, alpha):
+    """Train/val datasets whose targets blend the teacher outputs with the ground truth.
+
+    train and val are window ranges over the same series, so one copy of the
+    targets is made and both new datasets share it.
+    """
+    base = datasets['train']
+    y = np.array(base.y, dtype=np.float32)
+    for split in ('train', 'val'):
+        rows = np.arange(datasets[split].start, datasets[split].stop) + base.seq_length
+        y[rows] = alpha * teacher_outputs[split] + (1 - alpha) * y[rows]
+    blended = {split: SlidingWindowDataset(base.X, y, base.seq_length,
+                                           start=datasets[split].start, stop=datasets[split].stop)
+               for split in ('train', 'val')}
+    return blended
+
+
+def model_size(model):
+    """Parameter count and size in bytes of the saved state dict."""
+    buffer = io.BytesIO()
+    torch.save(model.state_dict(), buffer)
+    return {'parameters': sum(p.numel() for p in model.parameters()), 'bytes': buffer.getbuffer().nbytes}
+
+
+def cpu_latency_ms(model, seq_length, batch_size, repeats=30):
+    """Median wall-clock time of one CPU forward over `batch_size` windows."""
+    model = copy.deepcopy(model).cpu().eval()
+    X = torch.randn(batch_size, seq_length, 1)
+    timings = []
+    with torch.inference_mode():
+        model(X)  # warm-up
+        for _ in range(repeats):
+            start = time.perf_counter()
+            model(X)
+            timings.append(time.perf_counter() - start)
+    return float(np.median(timings) * 1000)
+
+
+def per_appliance_mae(a, b):
+    return {name: float(v) for name, v in zip(APPLIANCE_COLUMNS, np.abs(a - b).mean(axis=0))}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Distill the NILM TCN into a compact student TCN')
+    parser.add_argument('--config', type=Path, help='JSON file overriding DEFAULT_CONFIG keys (as for train.py)')
+    parser.add_argument('--teacher', type=Path, help='Teacher weights (default: <save-dir>/TCN_best.pth)')
+    parser.add_argument('--student-channels', type=int, nargs='+', default=DEFAULT_STUDENT_CHANNELS,
+                        help='Channels per level of the student TCN (8 levels keep the teacher receptive field)')
+    parser.add_argument('--student-kernel-size', type=int, help='Student kernel size (default: the teacher\'s)')
+    parser.add_argument('--alpha', type=float, default=0.8, help='Weight of the teacher outputs in the target')
+    parser.add_argument('--name', default='TCN_student', help='Output name: <name>.pth, <name>.json, <name>_report.json')
+    parser.add_argument('--data-path', help='Directory with facility sub-folders of CSVs')
+    parser.add_argument('--save-dir', help='Where the teacher is and the student goes')
+    parser.add_argument('--epochs', type=int, help='Number of epochs')
+    parser.add_argument('--batch-size', type=int, help='Batch size')
+    parser.add_argument('--num-workers', type=int, help='DataLoader worker processes')
+    parser.add_argument('--threads', type=int, help='torch intra-op threads')
+    parser.add_argument('--latency-batch-sizes', type=int, nargs='+', default=[1, 64])
+    parser.add_argument('--device', default='cuda' if torch.cuda.is_available() else 'cpu')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    config = dict(DEFAULT_CONFIG)
+    if args.config:
+        with open(args.config) as f:
+            config.update(json.load(f))
+    overrides = {
+        'data_path': args.data_path,
+        'save_dir': args.save_dir,
+        'num_epochs': args.epochs,
+        'batch_size': args.batch_size,
+        'num_workers': args.num_workers,
+        'num_threads': args.threads,
+    }
+    config.update({k: v for k, v in overrides.items() if v is not None})
+    if not 0 <= args.alpha <= 1:
+        raise ValueError(f"--alpha must be in [0, 1], got {args.alpha}")
+    if config['amda'] != 'offline':
+        # The teacher scores fixed windows once, so the inputs cannot change per batch
+        raise ValueError("distill.py needs the offline AMDA dataset (set 'amda' to 'offline')")
+
+    torch.manual_seed(config['random_state'])
+    np.random.seed(config['random_state'])
+    device = torch.device(args.device)
+    save_dir = Path(config['save_dir'])
+    save_dir.mkdir(parents=True, exist_ok=True)
+
+    teacher_path = args.teacher or save_dir / 'TCN_best.pth'
+    teacher = build_model('TCN', config).to(device)
+    teacher.load_state_dict(torch.load(teacher_path, map_location=device))
+    teacher.eval()
+
+    student_config = dict(config, num_channels=args.student_channels,
+                          kernel_size=args.student_kernel_size or config.get('kernel_size', 3))
+    student = build_model('TCN', student_config).to(device)
+
+    datasets, scaler_X, scaler_y = prepare_data(config)
+    num_workers, num_threads = configure_threads(config, device)
+    loader_kwargs = dict(num_workers=num_workers, pin_memory=config['pin_memory'] and device.type == 'cuda',
+                         persistent_workers=num_workers > 0)
+    eval_batch_size = max(config['batch_size'], 1024)
+    print(f"Teacher: {teacher_path} | student channels: {args.student_channels} | alpha: {args.alpha} | "
+          f"device: {device} | workers: {num_workers} | threads: {num_threads}")
+
+    print("🎓 Scoring training and validation windows with the teacher...")
+    teacher_outputs = {split: predict_windows(teacher, datasets[split], eval_batch_size, device, **loader_kwargs)
+                       for split in ('train', 'val')}
+    history = train_model('TCN', distillation_datasets(datasets, teacher_outputs, args.alpha), student_config,
+                          device, model=student, run_name=args.name)
+    best_val_loss = history['best_val_loss']
+    if not math.isfinite(best_val_loss):
+        raise RuntimeError("The student never reached a finite validation loss; nothing to save")
+    # train_model left the student holding the best weights of this run
+    student_path = save_dir / f"{args.name}.pth"
+    torch.save(student.state_dict(), student_path)
+
+    # Architecture sidecar read by the inference service
+    architecture = dict(model_architecture('TCN', student_config), teacher=str(teacher_path), alpha=args.alpha)
+    with open(save_dir / f"{args.name}.json", 'w') as f:
+        json.dump(architecture, f, indent=2)
+
+    # Compare on the target-domain test windows, in watts
+    print("📏 Comparing student and teacher on the test windows...")
+    test = datasets['test']
+    teacher_test = scaler_y.inverse_transform(predict_windows(teacher, test, eval_batch_size, device, **loader_kwargs))
+    student_test = scaler_y.inverse_transform(predict_windows(student, test, eval_batch_size, device, **loader_kwargs))
+    truth_test = scaler_y.inverse_transform(np.asarray(test.y[test.start + test.seq_length:test.stop + test.seq_length]))
+
+    report = {
+        'teacher': str(teacher_path),
+        'student': str(student_path),
+        'alpha': args.alpha,
+        'best_val_loss': best_val_loss,
+        'test_windows': len(test),
+        'mae_student_vs_teacher': per_appliance_mae(student_test, teacher_test),
+        'mae_student_vs_truth': per_appliance_mae(student_test, truth_test),
+        'mae_teacher_vs_truth': per_appliance_mae(teacher_test, truth_test),
+        'size': {'teacher': model_size(teacher), 'student': model_size(student)},
+        'cpu_latency_ms': {
+            str(batch_size): {'teacher': cpu_latency_ms(teacher, config['seq_length'], batch_size),
+                              'student': cpu_latency_ms(student, config['seq_length'], batch_size)}
+            for batch_size in args.latency_batch_sizes
+        },
+        'cpu_threads': torch.get_num_threads(),
+    }
+    report_path = save_dir / f"{args.name}_report.json"
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    print(f"\n{'Appliance':<10}{'student↔teacher':>18}{'student↔truth':>16}{'teacher↔truth':>16}  (MAE, W)")
+    for name in APPLIANCE_COLUMNS:
+        print(f"{name:<10}{report['mae_student_vs_teacher'][name]:>18.2f}"
+              f"{report['mae_student_vs_truth'][name]:>16.2f}{report['mae_teacher_vs_truth'][name]:>16.2f}")
+    for role in ('teacher', 'student'):
+        size = report['size'][role]
+        print(f"{role.capitalize():<8} {size['parameters']:>10,} params | {size['bytes'] / 1024:8.1f} KiB | " +
+              ' | '.join(f"batch {b}: {v[role]:.2f} ms" for b, v in report['cpu_latency_ms'].items()))
+    print(f"💾 Student: {student_path} | report: {report_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,251 @@
+"""
+NILM model architectures (moved out of workspace.ipynb so the notebook, the
+training CLI and the inference service share one definition).
+"""
+import torch
+import torch.nn as nn
+
+
+# GRU Model
+class GRUModel(nn.Module):
+    def __init__(self, input_size, hidden_size=128, num_layers=3, output_size=5):
+        super(GRUModel, self).__init__()
+        self.hidden_size = hidden_size
+        self.num_layers = num_layers
+        
+        self.gru = nn.GRU(input_size=input_size,
+                         hidden_size=hidden_size,
+                         num_layers=num_layers,
+                         batch_first=True,
+                         dropout=0.2)
+        
+        self.fc = nn.Linear(hidden_size, output_size)
+        
+    def forward(self, x):
+        gru_out, _h_n = self.gru(x)
+        out = self.fc(gru_out[:, -1, :])
+        return out
+
+# CNN-LSTM Model
+class CNN_LSTM(nn.Module):
+    def __init__(self, input_size, hidden_size=128, num_layers=2, output_size=5):
+        super(CNN_LSTM, self).__init__()
+        
+        # CNN layers
+        self.conv1 = nn.Conv1d(in_channels=input_size, out_channels=64, kernel_size=3, padding=1)
+        self.conv2 = nn.Conv1d(in_channels=64, out_channels=128, kernel_size=3, padding=1)
+        self.pool = nn.MaxPool1d(kernel_size=2)
+        self.relu = nn.ReLU()
+        
+        # LSTM layer
+        self.lstm = nn.LSTM(input_size=128,
+                           hidden_size=hidden_size,
+                           num_layers=num_layers,
+                           batch_first=True,
+                           dropout=0.2)
+        
+        self.fc = nn.Linear(hidden_size, output_size)
+        
+    def forward(self, x):
+        # x shape: (batch, seq_len, input_size)
+        x = x.permute(0, 2, 1)  # (batch, input_size, seq_len)
+        
+        x = self.relu(self.conv1(x))
+        x = self.pool(x)
+        x = self.relu(self.conv2(x))
+        x = self.pool(x)
+        
+        x = x.permute(0, 2, 1)  # (batch, seq_len, features)
+        
+        lstm_out, (_h_n, _c_n) = self.lstm(x)
+        out = self.fc(lstm_out[:, -1, :])
+        return out
+
+# Bidirectional LSTM Model
+class BiLSTMModel(nn.Module):
+    def __init__(self, input_size, hidden_size=128, num_layers=3, output_size=5):
+        super(BiLSTMModel, self).__init__()
+        self.hidden_size = hidden_size
+        self.num_layers = num_layers
+        
+        self.lstm = nn.LSTM(input_size=input_size,
+                           hidden_size=hidden_size,
+                           num_layers=num_layers,
+                           batch_first=True,
+                           bidirectional=True,
+                           dropout=0.2)
+        
+        self.fc = nn.Linear(hidden_size * 2, output_size)  # *2 for bidirectional
+        
+    def forward(self, x):
+        lstm_out, (_h_n, _c_n) = self.lstm(x)
+        out = self.fc(lstm_out[:, -1, :])
+        return out
+
+class LSTMModel(nn.Module):
+    def __init__(self, input_size, hidden_size=128, num_layers=3, output_size=5):
+        super(LSTMModel, self).__init__()
+        self.hidden_size = hidden_size
+        self.num_layers = num_layers
+        
+        self.lstm = nn.LSTM(input_size=input_size,
+                           hidden_size=hidden_size,
+                           num_layers=num_layers,
+                           batch_first=True,
+                           dropout=0.2)
+        
+        self.fc = nn.Linear(hidden_size, output_size)
+        
+    def forward(self, x):
+        # x shape: (batch, seq_len, input_size)
+        lstm_out, (_h_n, _c_n) = self.lstm(x)
+        # Use the last hidden state
+        out = self.fc(lstm_out[:, -1, :])
+        return out
+
+# Temporal Convolutional Network (TCN)
+class Chomp1d(nn.Module):
+    def __init__(self, chomp_size):
+        super(Chomp1d, self).__init__()
+        self.chomp_size = chomp_size
+
+    def forward(self, x):
+        return x[:, :, :-self.chomp_size].contiguous()
+
+class TemporalBlock(nn.Module):
+    def __init__(self, n_inputs, n_outputs, kernel_size, stride, dilation, padding, dropout=0.2):
+        super(TemporalBlock, self).__init__()
+        self.conv1 = nn.Conv1d(n_inputs, n_outputs, kernel_size,
+                               stride=stride, padding=padding, dilation=dilation)
+        self.chomp1 = Chomp1d(padding)
+        self.relu1 = nn.ReLU()
+        self.dropout1 = nn.Dropout(dropout)
+        
+        self.conv2 = nn.Conv1d(n_outputs, n_outputs, kernel_size,
+                               stride=stride, padding=padding, dilation=dilation)
+        self.chomp2 = Chomp1d(padding)
+        self.relu2 = nn.ReLU()
+        self.dropout2 = nn.Dropout(dropout)
+        
+        self.net = nn.Sequential(self.conv1, self.chomp1, self.relu1, self.dropout1,
+                                self.conv2, self.chomp2, self.relu2, self.dropout2)
+        self.downsample = nn.Conv1d(n_inputs, n_outputs, 1) if n_inputs != n_outputs else None
+        self.relu = nn.ReLU()
+
+    def forward(self, x):
+        out = self.net(x)
+        res = x if self.downsample is None else self.downsample(x)
+        return self.relu(out + res)
+
+def temporal_stack(input_size, num_channels, kernel_size=3, dropout=0.2):
+    """TemporalBlocks with dilation 2**i at level i (causal: output t sees inputs <= t)."""
+    layers = []
+    num_levels = len(num_channels)
+    
+    for i in range(num_levels):
+        dilation_size = 2 ** i
+        in_channels = input_size if i == 0 else num_channels[i-1]
+        out_channels = num_channels[i]
+        padding = (kernel_size - 1) * dilation_size
+        
+        layers.append(TemporalBlock(in_channels, out_channels, kernel_size,
+                                   stride=1, dilation=dilation_size,
+                                   padding=padding, dropout=dropout))
+    
+    return nn.Sequential(*layers)
+
+class TCNModel(nn.Module):
+    def __init__(self, input_size, num_channels=[64, 128, 128], kernel_size=3, dropout=0.2, output_size=5):
+        super(TCNModel, self).__init__()
+        self.network = temporal_stack(input_size, num_channels, kernel_size, dropout)
+        self.fc = nn.Linear(num_channels[-1], output_size)
+        
+    def forward(self, x):
+        # x shape: (batch, seq_len, input_size)
+        x = x.permute(0, 2, 1)  # (batch, input_size, seq_len)
+        x = self.network(x)
+        x = x.mean(dim=2)  # Global average pooling
+        return self.fc(x)
+
+# Sequence-to-sequence TCN: one prediction per timestep
+class TCNSeq2SeqModel(nn.Module):
+    """TCN without the global pooling: the same TemporalBlock stack, with the
+    output layer applied at every timestep.
+
+    The blocks are causal, so output t only sees inputs 0..t and is trained
+    against the appliance power of the reading after t, like the pooled TCN is
+    for the last step. One forward over a window therefore yields seq_len
+    predictions instead of one.
+    """
+    per_timestep = True
+
+    def __init__(self, input_size, num_channels=[64, 128, 128], kernel_size=3, dropout=0.2, output_size=5):
+        super(TCNSeq2SeqModel, self).__init__()
+        self.network = temporal_stack(input_size, num_channels, kernel_size, dropout)
+        self.fc = nn.Linear(num_channels[-1], output_size)
+        
+    def forward(self, x):
+        # x shape: (batch, seq_len, input_size)
+        x = x.permute(0, 2, 1)  # (batch, input_size, seq_len)
+        x = self.network(x)
+        x = x.permute(0, 2, 1)  # (batch, seq_len, channels)
+        return self.fc(x)  # (batch, seq_len, output_size)
+
+# Attention Mechanism
+class AttentionLayer(nn.Module):
+    def __init__(self, hidden_size):
+        super(AttentionLayer, self).__init__()
+        self.attention = nn.Sequential(
+            nn.Linear(hidden_size, hidden_size),
+            nn.Tanh(),
+            nn.Linear(hidden_size, 1)
+        )
+    
+    def forward(self, x):
+        # x shape: (batch, seq_len, hidden_size)
+        attention_weights = self.attention(x)  # (batch, seq_len, 1)
+        attention_weights = torch.softmax(attention_weights, dim=1)
+        weighted = x * attention_weights
+        return weighted.sum(dim=1)  # (batch, hidden_size)
+
+# Attention + TCN Model (ATCN)
+class ATCNModel(nn.Module):
+    def __init__(self, input_size, num_channels=[64, 128, 128], kernel_size=3, dropout=0.2, output_size=5):
+        super(ATCNModel, self).__init__()
+        self.network = temporal_stack(input_size, num_channels, kernel_size, dropout)
+        self.attention = AttentionLayer(num_channels[-1])
+        self.fc = nn.Linear(num_channels[-1], output_size)
+        
+    def forward(self, x):
+        # x shape: (batch, seq_len, input_size)
+        x = x.permute(0, 2, 1)  # (batch, input_size, seq_len)
+        x = self.network(x)
+        x = x.permute(0, 2, 1)  # (batch, seq_len, channels)
+        x = self.attention(x)  # Apply attention
+        return self.fc(x)
+
+
+MODELS = {
+    'GRU': GRUModel,
+    'LSTM': LSTMModel,
+    'BiLSTM': BiLSTMModel,
+    'CNN_LSTM': CNN_LSTM,
+    'TCN': TCNModel,
+    'ATCN': ATCNModel,
+    'TCN_Seq2Seq': TCNSeq2SeqModel,
+}
+
+
+def build_model(name, config):
+    """Instantiate a model from the notebook-style CONFIG dict."""
+    if name not in MODELS:
+        raise ValueError(f"Unknown model '{name}'. Available: {list(MODELS)}")
+    if name in ('TCN', 'ATCN', 'TCN_Seq2Seq'):
+        return MODELS[name](input_size=config['input_size'],
+                            num_channels=config['num_channels'],
+                            kernel_size=config.get('kernel_size', 3),
+                            dropout=config.get('dropout', 0.2),
+                            output_size=config['output_size'])
+    return MODELS[name](input_size=config['input_size'],
+                        hidden_size=config['hidden_size'],
+                        output_size=config['output_size'])
@@ -0,0 +1,235 @@
+import copy
+import numpy as np
+import torch
+from pathlib import Path
+from torch.utils.data import Dataset, DataLoader, BatchSampler, RandomSampler, SequentialSampler, get_worker_info
+
+
+def sliding_windows(X:np.ndarray, seq_length:int):
+    """Read-only strided view of every window of `X` that has a target after it.
+
+    Window i is X[i:i+seq_length] (shape: (seq_length, n_features)) and is
+    paired with the target at i+seq_length, exactly like create_sequences.
+    No data is copied: all windows share the memory of `X`.
+    """
+    if X.ndim == 1:
+        X = X.reshape(-1, 1)
+    n_windows = len(X) - seq_length
+    if n_windows <= 0:
+        raise ValueError(f"Series of length {len(X)} is too short for seq_length={seq_length}")
+    return np.lib.stride_tricks.as_strided(
+        X,
+        shape=(n_windows, seq_length, X.shape[1]),
+        strides=(X.strides[0], X.strides[0], X.strides[1]),
+        writeable=False
+    )
+
+
+class SlidingWindowDataset(Dataset):
+    """Drop-in replacement for NILMDataset(create_sequences(X, y, seq_length)).
+
+    Keeps a single (optionally memory-mapped) copy of the scaled series and
+    exposes the windows as strided views over it. `start`/`stop` select a
+    contiguous range of window indices, which is how the notebook carves the
+    validation split off the end of the training windows.
+
+    Indexing with an int returns one (window, target) pair; indexing with a
+    list/array of indices gathers the whole batch with a single fancy-index
+    copy. Use `make_loader` to get a DataLoader that fetches batches that way.
+    """
+    def __init__(self, X:np.ndarray, y:np.ndarray, seq_length:int, start:int=0, stop:int=None):
+        X = self._as_float32(X)
+        y = self._as_float32(y)
+        if y.ndim == 1:
+            y = y.reshape(-1, 1)
+        if len(X) != len(y):
+            raise ValueError(f"X and y must have the same length, got {len(X)} and {len(y)}")
+
+        self.X = X
+        self.y = y
+        self.seq_length = seq_length
+        self.windows = sliding_windows(X, seq_length)
+        self.source_paths = None
+
+        n_windows = len(self.windows)
+        stop = n_windows if stop is None else min(stop, n_windows)
+        if not 0 <= start <= stop:
+            raise ValueError(f"Invalid window range [{start}, {stop}) for {n_windows} windows")
+        self.start = start
+        self.stop = stop
+
+    @staticmethod
+    def _as_float32(arr):
+        # Memory-mapped float32 arrays are used as-is; anything else is converted once
+        if isinstance(arr, torch.Tensor):
+            arr = arr.numpy()
+        if arr.dtype == np.float32:
+            return arr
+        return np.ascontiguousarray(arr, dtype=np.float32)
+
+    @classmethod
+    def from_npy(cls, X_path:Path, y_path:Path, seq_length:int, start:int=0, stop:int=None):
+        """Build the dataset over memory-mapped .npy files (saved with np.save)."""
+        X = np.load(X_path, mmap_mode='r')
+        y = np.load(y_path, mmap_mode='r')
+        dataset = cls(X, y, seq_length, start=start, stop=stop)
+        dataset.source_paths = (str(X_path), str(y_path))
+        return dataset
+
+    def subset(self, start:int, stop:int=None):
+        """Dataset over windows [start, stop) of this one, sharing the same memory."""
+        stop = len(self) if stop is None else stop
+        if not 0 <= start <= stop <= len(self):
+            raise ValueError(f"Invalid window range [{start}, {stop}) for {len(self)} windows")
+        dataset = copy.copy(self)
+        dataset.start = self.start + start
+        dataset.stop = self.start + stop
+        return dataset
+
+    def __getstate__(self):
+        # DataLoader workers receive a pickled copy of the dataset. Pickling the
+        # strided view would materialise every window, and pickling a memmap
+        # would copy the file into each worker, so both are rebuilt instead.
+        state = self.__dict__.copy()
+        del state['windows']
+        if self.source_paths is not None:
+            state['X'] = state['y'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self.source_paths is not None:
+            self.X = np.load(self.source_paths[0], mmap_mode='r')
+            self.y = np.load(self.source_paths[1], mmap_mode='r')
+        self.windows = sliding_windows(self.X, self.seq_length)
+
+    def __len__(self):
+        return self.stop - self.start
+
+    def __getitem__(self, idx):
+        if isinstance(idx, (int, np.integer)):
+            if idx < 0:
+                idx += len(self)
+            if not 0 <= idx < len(self):
+                raise IndexError(f"Window index {idx} out of range for {len(self)} windows")
+            i = self.start + idx
+            return (torch.from_numpy(np.array(self.windows[i])),
+                    torch.from_numpy(np.array(self.y[i + self.seq_length])))
+
+        # Batched gather: one copy of (batch, seq_length, n_features)
+        indices = np.asarray(idx, dtype=np.int64) + self.start
+        return (torch.from_numpy(np.asarray(self.windows[indices])),
+                torch.from_numpy(np.asarray(self.y[indices + self.seq_length])))
+
+
+class Seq2SeqWindowDataset(SlidingWindowDataset):
+    """Windows paired with a target per timestep, for TCNSeq2SeqModel.
+
+    Window i is X[i:i+seq_length] as in SlidingWindowDataset; its target is
+    y[i+1:i+seq_length+1], the reading after each input step. The last row of
+    that target is exactly SlidingWindowDataset's target for the window, so
+    the same windows and splits are used. Both sides are strided views.
+    """
+    def __init__(self, X:np.ndarray, y:np.ndarray, seq_length:int, start:int=0, stop:int=None):
+        super().__init__(X, y, seq_length, start=start, stop=stop)
+        self.target_windows = self._target_windows()
+
+    def _target_windows(self):
+        y = self.y[1:]
+        return np.lib.stride_tricks.as_strided(
+            y,
+            shape=(len(self.windows), self.seq_length, y.shape[1]),
+            strides=(y.strides[0], y.strides[0], y.strides[1]),
+            writeable=False
+        )
+
+    @classmethod
+    def from_dataset(cls, dataset:SlidingWindowDataset):
+        """Same series and window range as `dataset`, with per-timestep targets."""
+        seq2seq = cls(dataset.X, dataset.y, dataset.seq_length, start=dataset.start, stop=dataset.stop)
+        seq2seq.source_paths = dataset.source_paths
+        return seq2seq
+
+    def __getstate__(self):
+        state = super().__getstate__()
+        del state['target_windows']
+        return state
+
+    def __setstate__(self, state):
+        super().__setstate__(state)
+        self.target_windows = self._target_windows()
+
+    def __getitem__(self, idx):
+        if isinstance(idx, (int, np.integer)):
+            if idx < 0:
+                idx += len(self)
+            if not 0 <= idx < len(self):
+                raise IndexError(f"Window index {idx} out of range for {len(self)} windows")
+            i = self.start + idx
+            return (torch.from_numpy(np.array(self.windows[i])),
+                    torch.from_numpy(np.array(self.target_windows[i])))
+
+        indices = np.asarray(idx, dtype=np.int64) + self.start
+        return (torch.from_numpy(np.asarray(self.windows[indices])),
+                torch.from_numpy(np.asarray(self.target_windows[indices])))
+
+
+class AMDAWindowDataset(SlidingWindowDataset):
+    """Windows of raw appliance power that are AMDA-augmented as they are read.
+
+    Instead of training on a second, pre-augmented copy of SIDED, this gathers
+    raw appliance windows and lets `transform` (data_augmentation.AMDATransform)
+    scale them, rebuild the aggregate input and standardize both. Fetched
+    through `make_loader`, the transform runs once per batch, so every batch
+    gets its own scale factor.
+
+    Args:
+        Y_raw: (n_samples, n_appliances) raw (unscaled) appliance power
+        source_ids: (n_samples,) index of the source file each row came from,
+            used to look up that source's AMDA proportions
+        seq_length: window length
+        transform: callable(windows, targets, source_ids) -> (X, y)
+    """
+    def __init__(self, Y_raw:np.ndarray, source_ids:np.ndarray, seq_length:int, transform, start:int=0, stop:int=None):
+        super().__init__(Y_raw, Y_raw, seq_length, start=start, stop=stop)
+        self.source_ids = np.asarray(source_ids, dtype=np.int64)
+        if len(self.source_ids) != len(self.X):
+            raise ValueError(f"source_ids must have one entry per row, got {len(self.source_ids)} for {len(self.X)} rows")
+        self.transform = transform
+        self._seeded_worker = None
+
+    def __getitem__(self, idx):
+        single = isinstance(idx, (int, np.integer))
+        if single:
+            if idx < 0:
+                idx += len(self)
+            if not 0 <= idx < len(self):
+                raise IndexError(f"Window index {idx} out of range for {len(self)} windows")
+            idx = [idx]
+
+        # Give every DataLoader worker its own augmentation stream
+        worker_info = get_worker_info()
+        if worker_info is not None and self._seeded_worker != worker_info.id:
+            self.transform.reseed(worker_info.seed)
+            self._seeded_worker = worker_info.id
+
+        indices = np.asarray(idx, dtype=np.int64) + self.start
+        target_rows = indices + self.seq_length
+        X, y = self.transform(self.windows[indices], self.y[target_rows], self.source_ids[target_rows])
+        X = torch.from_numpy(np.ascontiguousarray(X, dtype=np.float32))
+        y = torch.from_numpy(np.ascontiguousarray(y, dtype=np.float32))
+        if single:
+            return X[0], y[0]
+        return X, y
+
+
+def make_loader(dataset:SlidingWindowDataset, batch_size:int, shuffle:bool=False, drop_last:bool=False, **kwargs):
+    """DataLoader that hands whole index batches to the dataset.
+
+    Equivalent to DataLoader(dataset, batch_size, shuffle) but each batch is
+    gathered with one strided fancy-index instead of batch_size __getitem__
+    calls followed by a torch.stack collate.
+    """
+    sampler = RandomSampler(dataset) if shuffle else SequentialSampler(dataset)
+    batch_sampler = BatchSampler(sampler, batch_size=batch_size, drop_last=drop_last)
+    return DataLoader(dataset, sampler=batch_sampler, batch_size=None, **kwargs)
@@ -0,0 +1,507 @@
+"""
+Command-line NILM training (the workspace.ipynb training cells as a script).
+
+Builds the notebook models from a CONFIG (defaults below, overridable with a
+JSON file and command-line flags), trains them with multi-worker zero-copy
+window loading, checkpoints every epoch and can resume an interrupted run.
+Runs on CPU-only hosts: intra-op threads are sized to the cores left over by
+the DataLoader workers. The fitted scaler statistics are written next to the
+checkpoints as scaler_stats.json for the inference service.
+
+With --amda online the AMDA_SIDED/ copy is not needed: training batches are
+AMDA-scaled from the raw SIDED/ files as they are drawn (see
+data_augmentation.AMDATransform), with a new scale factor s per batch.
+
+Usage:
+    python train.py --models TCN BiLSTM --epochs 20
+    python train.py --config my_config.json --device cpu --threads 16
+    python train.py --models TCN --resume
+    python train.py --models TCN --amda online --raw-data-path ./SIDED
+"""
+import argparse
+import json
+import math
+import os
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import torch
+import torch.nn as nn
+import torch.optim as optim
+from sklearn.preprocessing import StandardScaler
+
+from data_augmentation import AMDATransform, amda_proportions
+from data_loader import load_data_by_location
+from models import MODELS, build_model
+from nilm_dataset import AMDAWindowDataset, Seq2SeqWindowDataset, SlidingWindowDataset, make_loader
+
+# The training profiler is shared with Failure-detection and lives there
+sys.path.append(str(Path(__file__).resolve().parents[2] / 'Failure-detection'))
+from training_profiler import NULL_PROFILER, TrainingProfiler
+
+APPLIANCE_COLUMNS = ['EVSE', 'PV', 'CS', 'CHP', 'BA']
+SCALER_STATS_VERSION = 1
+
+# Same defaults as the CONFIG cell of workspace.ipynb
+DEFAULT_CONFIG = {
+    # Data paths
+    'data_path': './AMDA_SIDED',
+    'source_locations': ['LA', 'Offenbach'],
+    'target_locations': ['Tokyo'],
+    'resample_rule': '5min',
+    'save_dir': './saved_models',
+
+    # AMDA: 'offline' trains on the pre-augmented data_path files, 'online'
+    # scales the raw_data_path files per batch with s drawn from amda_s_range.
+    # Online, the target-domain test files get the fixed amda_test_s, which is
+    # the factor the offline AMDA_SIDED files were written with
+    'amda': 'offline',
+    'raw_data_path': './SIDED',
+    'amda_s_range': [1.0, 2.5],
+    'amda_test_s': 2.5,
+
+    # Model hyperparameters
+    'input_size': 1,
+    'output_size': 5,
+    'hidden_size': 128,
+    'num_layers': 8,
+    'num_channels': [64, 64, 64, 64, 128, 128, 128, 128],
+    'kernel_size': 3,
+    'dropout': 0.33,
+
+    # Training hyperparameters
+    'num_epochs': 20,
+    'learning_rate': 0.001,
+    'batch_size': 64,
+    'seq_length': 288,
+    'validation_split': 0.1,
+    'gradient_clip': 1.0,
+
+    # Warmup scheduler settings
+    'warmup_epochs': 3,
+    'warmup_start_lr': 1e-6,
+    'min_lr': 1e-6,
+
+    'early_stopping_patience': 5,
+
+    # Loading / threading (None = derived from the host's core count)
+    'num_workers': None,
+    'num_threads': None,
+    'pin_memory': True,
+
+    'random_state': 42,
+}
+
+
+def scheduled_lr(epoch, config):
+    """Learning rate for `epoch` under the notebook's warmup + cosine schedule.
+
+    Closed form of WarmupCosineScheduler: warmup_start_lr for the first epoch,
+    a linear ramp to learning_rate over warmup_epochs, then cosine decay to
+    min_lr. Being a pure function of the epoch makes resuming trivial.
+    """
+    warmup_epochs = config['warmup_epochs']
+    base_lr = config['learning_rate']
+    if epoch == 0:
+        return config['warmup_start_lr']
+    if epoch <= warmup_epochs:
+        return base_lr * epoch / warmup_epochs
+    cosine_epochs = max(1, config['num_epochs'] - warmup_epochs)
+    progress = min(1.0, (epoch - warmup_epochs) / cosine_epochs)
+    return config['min_lr'] + (base_lr - config['min_lr']) * (1 + math.cos(math.pi * progress)) / 2
+
+
+def configure_threads(config, device):
+    """Pick DataLoader workers and torch intra-op threads for this host.
+
+    Workers only gather windows (a cheap fancy-index), so a few are enough;
+    the remaining cores go to torch's intra-op pool for the convolutions.
+    """
+    cpu_count = os.cpu_count() or 1
+    num_workers = config['num_workers']
+    if num_workers is None:
+        num_workers = min(4, max(0, cpu_count // 4))
+    num_threads = config['num_threads']
+    if num_threads is None:
+        num_threads = max(1, cpu_count - num_workers) if device.type == 'cpu' else torch.get_num_threads()
+    torch.set_num_threads(num_threads)
+    return num_workers, num_threads
+
+
+def prepare_data(config):
+    """Load the domain split, fit the scalers on the source domain and build window datasets."""
+    if config['amda'] == 'online':
+        return prepare_amda_data(config)
+    if config['amda'] != 'offline':
+        raise ValueError(f"Unknown amda mode '{config['amda']}' (expected 'offline' or 'online')")
+    train_data, test_data = load_data_by_location(
+        config['data_path'],
+        target_locations=config['target_locations'],
+        source_locations=config['source_locations'],
+        resample_rule=config['resample_rule']
+    )
+    X_train_raw = train_data['Aggregate'].values.reshape(-1, 1)
+    y_train_raw = train_data[APPLIANCE_COLUMNS].values
+    X_test_raw = test_data['Aggregate'].values.reshape(-1, 1)
+    y_test_raw = test_data[APPLIANCE_COLUMNS].values
+
+    # Fit scaler ONLY on training data to avoid data leakage
+    scaler_X = StandardScaler()
+    scaler_y = StandardScaler()
+    X_train_scaled = scaler_X.fit_transform(X_train_raw)
+    y_train_scaled = scaler_y.fit_transform(y_train_raw)
+    X_test_scaled = scaler_X.transform(X_test_raw)
+    y_test_scaled = scaler_y.transform(y_test_raw)
+
+    seq_length = config['seq_length']
+    train_windows = SlidingWindowDataset(X_train_scaled, y_train_scaled, seq_length)
+    val_size = int(len(train_windows) * config['validation_split'])
+    train_size = len(train_windows) - val_size
+
+    datasets = {
+        'train': train_windows.subset(0, train_size),
+        'val': train_windows.subset(train_size),
+        'test': SlidingWindowDataset(X_test_scaled, y_test_scaled, seq_length),
+    }
+    return datasets, scaler_X, scaler_y
+
+
+def amda_scaled(df, proportions, source_ids, s):
+    """(aggregate, appliances) of `df` AMDA-scaled with factor `s`, per source file.
+
+    Same result as amda_augmentation on each file: every appliance is scaled by
+    S_i = s * (1 - p_i) and the aggregate is re-computed as their sum.
+    """
+    appliances = df[APPLIANCE_COLUMNS].to_numpy(dtype=np.float64) * (s * (1 - proportions[source_ids]))
+    return appliances.sum(axis=1, keepdims=True), appliances
+
+
+def prepare_amda_data(config):
+    """prepare_data for on-the-fly AMDA from the raw SIDED files.
+
+    Training windows are AMDA-scaled per batch by an AMDAWindowDataset. The
+    scalers are fitted on the source domain scaled with the mid-range s, so
+    the standardized batches stay near unit variance. Validation uses that
+    same fixed s, so its loss is comparable across epochs; the target-domain
+    test windows are scaled with amda_test_s per file.
+    """
+    train_data, test_data = load_data_by_location(
+        config['raw_data_path'],
+        target_locations=config['target_locations'],
+        source_locations=config['source_locations'],
+        resample_rule=config['resample_rule'],
+        file_prefix=''
+    )
+    source_columns = ['facility', 'location']
+    proportions, source_ids = amda_proportions(train_data, APPLIANCE_COLUMNS, group_columns=source_columns)
+    s_low, s_high = config['amda_s_range']
+    s_mid = (s_low + s_high) / 2
+
+    # Fit scaler ONLY on training data to avoid data leakage
+    X_fit, y_fit = amda_scaled(train_data, proportions, source_ids, s_mid)
+    scaler_X = StandardScaler().fit(X_fit)
+    scaler_y = StandardScaler().fit(y_fit)
+
+    seq_length = config['seq_length']
+    Y_raw = train_data[APPLIANCE_COLUMNS].to_numpy(dtype=np.float32)
+    num_windows = len(Y_raw) - seq_length
+    val_size = int(num_windows * config['validation_split'])
+    train_size = num_windows - val_size
+    train_transform = AMDATransform.from_scalers(proportions, scaler_X, scaler_y, s_range=(s_low, s_high),
+                                                 seed=config['random_state'])
+    val_transform = AMDATransform.from_scalers(proportions, scaler_X, scaler_y, s_range=(s_mid, s_mid))
+
+    test_proportions, test_source_ids = amda_proportions(test_data, APPLIANCE_COLUMNS, group_columns=source_columns)
+    X_test, y_test = amda_scaled(test_data, test_proportions, test_source_ids, config['amda_test_s'])
+
+    datasets = {
+        'train': AMDAWindowDataset(Y_raw, source_ids, seq_length, train_transform, stop=train_size),
+        'val': AMDAWindowDataset(Y_raw, source_ids, seq_length, val_transform, start=train_size),
+        'test': SlidingWindowDataset(scaler_X.transform(X_test), scaler_y.transform(y_test), seq_length),
+    }
+    return datasets, scaler_X, scaler_y
+
+
+def scaler_stats(scaler_X, scaler_y, config):
+    """Fitted scaler statistics as a plain, versioned dict (the serving artifact).
+
+    The inference service standardizes inputs and inverts outputs with these
+    numbers directly, so it never needs sklearn or a pickled scaler.
+    """
+    return {
+        'version': SCALER_STATS_VERSION,
+        'appliances': APPLIANCE_COLUMNS,
+        'seq_length': config['seq_length'],
+        'resample_rule': config['resample_rule'],
+        'source_locations': config['source_locations'],
+        'x_mean': scaler_X.mean_.tolist(),
+        'x_scale': scaler_X.scale_.tolist(),
+        'y_mean': scaler_y.mean_.tolist(),
+        'y_scale': scaler_y.scale_.tolist(),
+    }
+
+
+def save_scaler_stats(path, stats):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(stats, f, indent=2)
+
+
+def model_architecture(model_name, config):
+    """Architecture of a TCN-family model as the JSON sidecar the inference service reads."""
+    return {
+        'model': model_name,
+        'input_size': config['input_size'],
+        'num_channels': config['num_channels'],
+        'kernel_size': config.get('kernel_size', 3),
+        'dropout': config.get('dropout', 0.2),
+        'output_size': config['output_size'],
+    }
+
+
+def save_checkpoint(path, model, optimizer, epoch, best_val_loss, patience_counter, history, config):
+    # Write-then-rename so an interrupted save never corrupts the last good checkpoint
+    tmp_path = path.with_suffix('.tmp')
+    torch.save({
+        'model_state_dict': model.state_dict(),
+        'optimizer_state_dict': optimizer.state_dict(),
+        'epoch': epoch,
+        'best_val_loss': best_val_loss,
+        'patience_counter': patience_counter,
+        'history': history,
+        'config': config,
+    }, tmp_path)
+    tmp_path.replace(path)
+
+
+def run_epoch(model, loader, criterion, device, optimizer=None, use_amp=False, gradient_clip=1.0, grad_scaler=None,
+              profiler=NULL_PROFILER):
+    """One pass over `loader`; trains when an optimizer is given, otherwise evaluates.
+
+    Losses are accumulated on-device and synced once at the end of the epoch.
+    Returns (mean loss, samples seen), or (nan, samples) if training diverged.
+    `profiler` (see training_profiler.py) times the phases of each step.
+    """
+    training = optimizer is not None
+    model.train(training)
+    total_loss = torch.zeros((), device=device)
+    num_batches = 0
+    num_samples = 0
+
+    with torch.set_grad_enabled(training):
+        for batch_X, batch_y in profiler.iterate(loader):
+            with profiler.phase('data'):
+                batch_X = batch_X.to(device, non_blocking=True)
+                batch_y = batch_y.to(device, non_blocking=True)
+            with profiler.phase('forward'), torch.autocast(device_type=device.type, enabled=use_amp):
+                outputs = model(batch_X)
+                outputs = torch.nan_to_num(outputs, nan=0.0, posinf=1e6, neginf=-1e6)
+                loss = criterion(outputs, batch_y)
+
+            if training:
+                with profiler.phase('backward'):
+                    optimizer.zero_grad(set_to_none=True)
+                    grad_scaler.scale(loss).backward()
+                    grad_scaler.unscale_(optimizer)
+                    torch.nn.utils.clip_grad_norm_(model.parameters(), max_norm=gradient_clip)
+                with profiler.phase('optimizer'):
+                    grad_scaler.step(optimizer)
+                    grad_scaler.update()
+
+            total_loss += loss.detach().float()
+            num_batches += 1
+            num_samples += batch_X.size(0)
+            profiler.step(batch_X.size(0))
+
+    return total_loss.item() / max(1, num_batches), num_samples
+
+
+def train_model(model_name, datasets, config, device, resume=False, profiler=None, model=None, run_name=None):
+    """Train one model with early stopping, per-epoch checkpoints and resume.
+
+    With a TrainingProfiler, every training pass is broken down by phase and
+    the summary is printed under the epoch line. `model` trains the given
+    instance instead of building `model_name` from config, and `run_name`
+    (default model_name) names the checkpoint files. On return the model holds
+    the best weights of this run (or of the run it resumed), and
+    history['best_val_loss'] is their validation loss.
+    """
+    run_name = run_name or model_name
+    save_dir = Path(config['save_dir'])
+    save_dir.mkdir(parents=True, exist_ok=True)
+    last_path = save_dir / f"{run_name}_last.pt"
+    best_path = save_dir / f"{run_name}_best.pth"
+
+    if getattr(MODELS[model_name], 'per_timestep', False):
+        if isinstance(datasets['train'], AMDAWindowDataset):
+            raise ValueError(f"{model_name} needs per-timestep targets, which on-the-fly AMDA does not provide; "
+                             f"train it with --amda offline")
+        # Seq2seq models learn the reading after every input step, not just the last
+        datasets = {split: Seq2SeqWindowDataset.from_dataset(dataset) for split, dataset in datasets.items()}
+
+    num_workers, num_threads = configure_threads(config, device)
+    pin_memory = config['pin_memory'] and device.type == 'cuda'
+    loader_kwargs = dict(num_workers=num_workers, pin_memory=pin_memory,
+                         persistent_workers=num_workers > 0)
+    train_loader = make_loader(datasets['train'], config['batch_size'], shuffle=True, **loader_kwargs)
+    val_loader = make_loader(datasets['val'], config['batch_size'], shuffle=False, **loader_kwargs)
+
+    if model is None:
+        model = build_model(model_name, config)
+    model = model.to(device)
+    optimizer = optim.Adam(model.parameters(), lr=config['warmup_start_lr'])
+    criterion = nn.MSELoss()
+    use_amp = device.type == 'cuda'
+    grad_scaler = torch.cuda.amp.GradScaler(enabled=use_amp)
+
+    history = {'train_loss': [], 'val_loss': [], 'epoch_times': [], 'learning_rates': [], 'samples_per_sec': []}
+    start_epoch = 0
+    best_val_loss = float('inf')
+    best_state = None
+    patience_counter = 0
+
+    if resume and last_path.exists():
+        checkpoint = torch.load(last_path, map_location=device)
+        model.load_state_dict(checkpoint['model_state_dict'])
+        optimizer.load_state_dict(checkpoint['optimizer_state_dict'])
+        start_epoch = checkpoint['epoch'] + 1
+        best_val_loss = checkpoint['best_val_loss']
+        patience_counter = checkpoint['patience_counter']
+        history = checkpoint['history']
+        if math.isfinite(best_val_loss) and best_path.exists():
+            best_state = torch.load(best_path, map_location=device)
+        print(f"↩️  Resuming {run_name} from epoch {start_epoch + 1} (best val loss {best_val_loss:.6f})")
+
+    print(f"\n{'='*60}\nTraining {run_name} on {device} | workers: {num_workers} | threads: {num_threads}\n{'='*60}")
+
+    num_epochs = config['num_epochs']
+    for epoch in range(start_epoch, num_epochs):
+        if patience_counter >= config['early_stopping_patience']:
+            break
+        current_lr = scheduled_lr(epoch, config)
+        for param_group in optimizer.param_groups:
+            param_group['lr'] = current_lr
+
+        epoch_start_time = time.time()
+        if profiler is not None:
+            profiler.start_epoch(run_name, epoch)
+        train_loss, train_samples = run_epoch(model, train_loader, criterion, device, optimizer=optimizer,
+                                              use_amp=use_amp, gradient_clip=config['gradient_clip'],
+                                              grad_scaler=grad_scaler, profiler=profiler or NULL_PROFILER)
+        train_time = time.time() - epoch_start_time
+        profile = profiler.end_epoch() if profiler is not None else None
+        if not math.isfinite(train_loss):
+            print(f"❌ Invalid loss (NaN/Inf) at epoch {epoch+1}. Stopping training for {run_name}.")
+            break
+        val_loss, _ = run_epoch(model, val_loader, criterion, device, use_amp=use_amp)
+        epoch_time = time.time() - epoch_start_time
+        samples_per_sec = train_samples / max(train_time, 1e-9)
+
+        history['train_loss'].append(train_loss)
+        history['val_loss'].append(val_loss)
+        history['epoch_times'].append(epoch_time)
+        history['learning_rates'].append(current_lr)
+        history['samples_per_sec'].append(samples_per_sec)
+        print(f"Epoch {epoch+1}/{num_epochs} | Train: {train_loss:.6f} | Val: {val_loss:.6f} | "
+              f"LR: {current_lr:.6f} | Time: {epoch_time:.2f}s | {samples_per_sec:,.0f} samples/s")
+        if profile is not None:
+            print(profiler.format(profile))
+
+        if val_loss < best_val_loss:
+            best_val_loss = val_loss
+            patience_counter = 0
+            best_state = {k: v.detach().clone() for k, v in model.state_dict().items()}
+            torch.save(best_state, best_path)
+        else:
+            patience_counter += 1
+            if patience_counter >= config['early_stopping_patience']:
+                print(f"⚠️ Early stopping at epoch {epoch+1}. Best val loss: {best_val_loss:.6f}")
+
+        save_checkpoint(last_path, model, optimizer, epoch, best_val_loss, patience_counter, history, config)
+
+    if best_state is None:
+        # Nothing improved (e.g. NaN loss in the first epoch); the model keeps its last weights
+        print(f"⚠️ {run_name} never reached a finite validation loss; no best model saved")
+    else:
+        model.load_state_dict(best_state)
+        if model_name in ('TCN', 'TCN_Seq2Seq'):
+            with open(best_path.with_suffix('.json'), 'w') as f:
+                json.dump(model_architecture(model_name, config), f, indent=2)
+        print(f"💾 Best model: {best_path} (val_loss: {best_val_loss:.6f})")
+    history['best_val_loss'] = best_val_loss
+    return history
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Train NILM models on (AMDA-)SIDED')
+    parser.add_argument('--config', type=Path, help='JSON file overriding DEFAULT_CONFIG keys')
+    parser.add_argument('--models', nargs='+', default=['BiLSTM', 'TCN', 'ATCN'], choices=list(MODELS))
+    parser.add_argument('--data-path', help='Directory with facility sub-folders of CSVs')
+    parser.add_argument('--amda', choices=['offline', 'online'],
+                        help="'offline': train on the AMDA_SIDED files in --data-path; "
+                             "'online': AMDA-scale the raw SIDED files per batch")
+    parser.add_argument('--raw-data-path', help='Raw SIDED directory used with --amda online')
+    parser.add_argument('--save-dir', help='Where *_best.pth and *_last.pt checkpoints go')
+    parser.add_argument('--epochs', type=int, help='Number of epochs')
+    parser.add_argument('--batch-size', type=int, help='Batch size')
+    parser.add_argument('--num-workers', type=int, help='DataLoader worker processes')
+    parser.add_argument('--threads', type=int, help='torch intra-op threads')
+    parser.add_argument('--device', default='cuda' if torch.cuda.is_available() else 'cpu')
+    parser.add_argument('--resume', action='store_true', help='Continue from <model>_last.pt if present')
+    parser.add_argument('--profile', action='store_true',
+                        help='Time data/forward/backward/optimizer per epoch; writes <save-dir>/training_profile.json')
+    parser.add_argument('--profile-trace', type=Path, metavar='DIR',
+                        help='Also capture a short torch.profiler trace into DIR (implies --profile)')
+    parser.add_argument('--profile-trace-steps', type=int, default=10, help='Steps recorded in the trace')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    config = dict(DEFAULT_CONFIG)
+    if args.config:
+        with open(args.config) as f:
+            config.update(json.load(f))
+    overrides = {
+        'data_path': args.data_path,
+        'amda': args.amda,
+        'raw_data_path': args.raw_data_path,
+        'save_dir': args.save_dir,
+        'num_epochs': args.epochs,
+        'batch_size': args.batch_size,
+        'num_workers': args.num_workers,
+        'num_threads': args.threads,
+    }
+    config.update({k: v for k, v in overrides.items() if v is not None})
+
+    torch.manual_seed(config['random_state'])
+    np.random.seed(config['random_state'])
+    device = torch.device(args.device)
+
+    datasets, scaler_X, scaler_y = prepare_data(config)
+    stats_path = Path(config['save_dir']) / 'scaler_stats.json'
+    save_scaler_stats(stats_path, scaler_stats(scaler_X, scaler_y, config))
+    print(f"💾 Scaler statistics saved: {stats_path}")
+    print(f"Training windows: {len(datasets['train']):,} | Validation: {len(datasets['val']):,} | "
+          f"Test: {len(datasets['test']):,}")
+
+    profiler = None
+    if args.profile or args.profile_trace:
+        profiler = TrainingProfiler(device, args.profile_trace, args.profile_trace_steps)
+
+    for model_name in args.models:
+        train_model(model_name, datasets, config, device, resume=args.resume, profiler=profiler)
+
+    if profiler is not None:
+        profile_path = Path(config['save_dir']) / 'training_profile.json'
+        profiler.save(profile_path)
+        print(f"⏱️  Training profile saved: {profile_path}")
+
+    print("\n✅ All Trainings completed!")
+
+
+if __name__ == "__main__":
+    main()
@@ -18,7 +18,6 @@ import logging
 from pathlib import Path
 from flask import Flask, request, jsonify
 from flask_cors import CORS
-from sklearn.preprocessing import StandardScaler
 from datetime import datetime
 
 # Configure logging
@@ -35,24 +34,47 @@ CORS(app)
 # Configuration
 MODEL_NAME = os.getenv('MODEL_NAME', 'TCN_best.pth')
 MODEL_PATH_RAW = os.getenv('MODEL_PATH', '../../NILM_SIDED/saved_models')
-SCALER_PATH = os.getenv('SCALER_PATH', '../../NILM_SIDED')
+SCALER_PATH_RAW = os.getenv('SCALER_PATH', '../../NILM_SIDED/saved_models')
+SCALER_NAME = os.getenv('SCALER_NAME', 'scaler_stats.json')
 FLASK_PORT = int(os.getenv('FLASK_PORT', 5001))
 FLASK_DEBUG = os.getenv('FLASK_DEBUG', 'False').lower() == 'true'
+# /predict/backfill: inputs kept as context when windows overlap, and windows per forward
+BACKFILL_CONTEXT = int(os.getenv('BACKFILL_CONTEXT', 32))
+BACKFILL_BATCH_SIZE = int(os.getenv('BACKFILL_BATCH_SIZE', 256))
 
 # Resolve paths relative to this script's location
 SCRIPT_DIR = Path(__file__).parent.resolve()
 MODEL_PATH = (SCRIPT_DIR / MODEL_PATH_RAW).resolve()
+SCALER_PATH = (SCRIPT_DIR / SCALER_PATH_RAW).resolve()
+
+# Version of scaler_stats.json written by NILM_SIDED/train.py that this service understands
+SCALER_STATS_VERSION = 1
 
 # Appliance configuration
 APPLIANCE_NAMES = ['EVSE', 'PV', 'CS', 'CHP', 'BA']
 LOAD_APPLIANCES = ['EVSE', 'CS', 'BA']
 GENERATION_APPLIANCES = ['PV', 'CHP']
 
+# Architecture of the production TCN; a <model>.json next to the weights
+# (written by NILM_SIDED/distill.py for a student model) overrides it
+DEFAULT_ARCHITECTURE = {
+    'input_size': 1,
+    'num_channels': [64, 64, 64, 64, 128, 128, 128, 128],
+    'kernel_size': 3,
+    'dropout': 0.33,
+    'output_size': 5,
+}
+
 # Global variables
 model = None
+model_architecture = None
 scaler_y = None
 device = None
 
+# Sign conventions as a clamp range per appliance: loads >= 0, generation <= 0
+OUTPUT_MIN = [0.0 if name in LOAD_APPLIANCES else -np.inf for name in APPLIANCE_NAMES]
+OUTPUT_MAX = [0.0 if name in GENERATION_APPLIANCES else np.inf for name in APPLIANCE_NAMES]
+
 
 class TCNModel(torch.nn.Module):
     """Temporal Convolutional Network Model"""
@@ -83,6 +105,19 @@ class TCNModel(torch.nn.Module):
         return self.fc(x)
 
 
+class TCNSeq2SeqModel(TCNModel):
+    """TCN without global pooling: one prediction per timestep (same weights layout)"""
+    per_timestep = True
+    
+    def forward(self, x):
+        x = x.permute(0, 2, 1)  # (batch, input_size, seq_len)
+        x = self.network(x)
+        return self.fc(x.permute(0, 2, 1))  # (batch, seq_len, output_size)
+
+
+MODEL_CLASSES = {'TCN': TCNModel, 'TCN_Seq2Seq': TCNSeq2SeqModel}
+
+
 class Chomp1d(torch.nn.Module):
     """Chomp padding from the end"""
     def __init__(self, chomp_size):
@@ -189,12 +224,46 @@ class AttentionLayer(torch.nn.Module):
         return weighted.sum(dim=1)
 
 
+class ScalerStats:
+    """
+    Training-time StandardScaler statistics as tensors on the inference device.
+
+    Loaded once from the scaler_stats.json artifact written by train.py, so
+    normalization and inverse normalization are plain tensor ops inside the
+    batched pipeline instead of per-request sklearn objects.
+    """
+
+    def __init__(self, x_mean, x_scale, y_mean, y_scale, device, source='artifact'):
+        self.x_mean = torch.as_tensor(x_mean, dtype=torch.float32, device=device)
+        self.x_scale = torch.as_tensor(x_scale, dtype=torch.float32, device=device)
+        self.y_mean = torch.as_tensor(y_mean, dtype=torch.float32, device=device)
+        self.y_scale = torch.as_tensor(y_scale, dtype=torch.float32, device=device)
+        self.source = source
+
+    @classmethod
+    def load(cls, path, device):
+        with open(path) as f:
+            stats = json.load(f)
+        if stats.get('version') != SCALER_STATS_VERSION:
+            raise ValueError(f'Unsupported scaler stats version {stats.get("version")} in {path} '
+                             f'(expected {SCALER_STATS_VERSION})')
+        if stats['appliances'] != APPLIANCE_NAMES:
+            raise ValueError(f'Scaler stats appliances {stats["appliances"]} do not match {APPLIANCE_NAMES}')
+        return cls(stats['x_mean'], stats['x_scale'], stats['y_mean'], stats['y_scale'], device, source=str(path))
+
+    def transform_x(self, X):
+        return (X - self.x_mean) / self.x_scale
+
+    def inverse_transform_y(self, y):
+        return y * self.y_scale + self.y_mean
+
+
 def load_model_and_scaler():
     """
     Load the trained PyTorch model and scalers from disk.
     Returns the model, scaler_y, and device.
     """
-    global model, scaler_y, device
+    global model, scaler_y, device, model_architecture
     
     logger.info('🔧 Initializing PyTorch environment...')
     
@@ -211,14 +280,20 @@ def load_model_and_scaler():
     
     logger.info(f'📂 Loading model from: {model_file}')
     
-    # Initialize model (hardcoded config matching training)
-    model = TCNModel(
-        input_size=1,
-        num_channels=[64, 64, 64, 64, 128, 128, 128, 128],
-        kernel_size=3,
-        dropout=0.33,
-        output_size=5
-    )
+    # Initialize model (production config unless the checkpoint has an architecture sidecar)
+    model_architecture = dict(DEFAULT_ARCHITECTURE)
+    model_type = 'TCN'
+    architecture_file = model_file.with_suffix('.json')
+    if architecture_file.exists():
+        with open(architecture_file) as f:
+            sidecar = json.load(f)
+        model_type = sidecar.get('model', 'TCN')
+        if model_type not in MODEL_CLASSES:
+            raise ValueError(f'Unsupported model type {model_type} in {architecture_file}')
+        model_architecture.update({k: v for k, v in sidecar.items() if k in DEFAULT_ARCHITECTURE})
+        logger.info(f'📐 {model_type} architecture from {architecture_file}: channels {model_architecture["num_channels"]}')
+    model = MODEL_CLASSES[model_type](**model_architecture)
+    model_architecture['model'] = model_type
     
     # Load weights
     model.load_state_dict(torch.load(model_file, map_location=device))
@@ -226,11 +301,15 @@ def load_model_and_scaler():
     model.eval()
     logger.info('✅ Model loaded successfully')
     
-    # Load scaler statistics
-    # In a production environment, you'd save these during training
-    # For now, we create a placeholder that will be set during inference
-    scaler_y = StandardScaler()
-    logger.info('✅ Scaler initialized')
+    # Load scaler statistics saved by NILM_SIDED/train.py
+    scaler_file = Path(SCALER_PATH) / SCALER_NAME
+    if scaler_file.exists():
+        scaler_y = ScalerStats.load(scaler_file, device)
+        logger.info(f'✅ Scaler statistics loaded from: {scaler_file}')
+    else:
+        scaler_y = None
+        logger.warning(f'⚠️  Scaler statistics not found at {scaler_file}. '
+                       'Falling back to per-window normalization and unscaled outputs (NOT accurate).')
     
     return model, scaler_y, device
 
@@ -243,6 +322,52 @@ def sanitize_array(arr, name='array'):
     return arr
 
 
+def run_inference_batch(aggregate_sequences, request_id='unknown', per_timestep=False):
+    """
+    Run model inference on a batch of aggregate power sequences.
+    
+    Normalization, the forward pass, inverse normalization and the sign
+    conventions all run as tensor ops over the whole batch.
+    
+    Args:
+        aggregate_sequences (array-like): (batch, 288) aggregate power readings
+        request_id (str): Tracking ID for logging
+        per_timestep (bool): Return every timestep of a seq2seq model
+        
+    Returns:
+        np.ndarray: (batch, 5) appliance predictions in APPLIANCE_NAMES order,
+        or (batch, 288, 5) with per_timestep
+    """
+    X_tensor = torch.as_tensor(np.asarray(aggregate_sequences, dtype=np.float32), device=device)
+    X_tensor = X_tensor.unsqueeze(-1)  # (batch, 288, 1)
+    logger.debug(f'[{request_id}] Tensor shape: {tuple(X_tensor.shape)}')
+    
+    with torch.no_grad():
+        if scaler_y is not None:
+            X_normalized = scaler_y.transform_x(X_tensor)
+        else:
+            # Legacy fallback: standardize every window with its own statistics
+            std = X_tensor.std(dim=1, unbiased=False, keepdim=True)
+            X_normalized = (X_tensor - X_tensor.mean(dim=1, keepdim=True)) / torch.where(std > 0, std, torch.ones_like(std))
+        
+        outputs = model(X_normalized)
+        if outputs.dim() == 3 and not per_timestep:
+            outputs = outputs[:, -1]  # A seq2seq model's last step is the single-step prediction
+        
+        # Sanitize outputs in standardized space
+        outputs = torch.nan_to_num(outputs, nan=0.0, posinf=0.0, neginf=0.0)
+        outputs = torch.clamp(outputs, min=-8.0, max=8.0)
+        
+        outputs_real = scaler_y.inverse_transform_y(outputs) if scaler_y is not None else outputs
+        
+        # Apply sign conventions
+        outputs_real = torch.clamp(outputs_real,
+                                   min=torch.tensor(OUTPUT_MIN, device=outputs_real.device),
+                                   max=torch.tensor(OUTPUT_MAX, device=outputs_real.device))
+    
+    return outputs_real.cpu().numpy()
+
+
 def run_inference(aggregate_sequence, request_id='unknown'):
     """
     Run model inference on the given aggregate power sequence.
@@ -257,52 +382,8 @@ def run_inference(aggregate_sequence, request_id='unknown'):
     logger.info(f'[{request_id}] Starting inference...')
     
     try:
-        # Convert to numpy array
-        X = np.array(aggregate_sequence, dtype=np.float32).reshape(-1, 1)
-        logger.debug(f'[{request_id}] Input shape: {X.shape}')
-        logger.debug(f'[{request_id}] Input range: [{X.min():.4f}, {X.max():.4f}]')
-        
-        # Normalize using StandardScaler
-        # NOTE: In production, use the scaler statistics from training data!
-        # For now, we fit on the current data (this is NOT ideal for production)
-        scaler_X = StandardScaler()
-        X_normalized = scaler_X.fit_transform(X)
-        
-        logger.debug(f'[{request_id}] Normalized range: [{X_normalized.min():.4f}, {X_normalized.max():.4f}]')
-        
-        # Convert to PyTorch tensor and add batch dimension
-        X_tensor = torch.FloatTensor(X_normalized).unsqueeze(0)  # (1, 288, 1)
-        logger.debug(f'[{request_id}] Tensor shape: {X_tensor.shape}')
-        
-        # Run inference
-        with torch.no_grad():
-            X_tensor = X_tensor.to(device)
-            outputs = model(X_tensor)
-            
-            # Sanitize outputs
-            outputs = torch.clamp(outputs, min=-8.0, max=8.0)
-            outputs = outputs.cpu().numpy()
-        
-        outputs = sanitize_array(outputs, f'[{request_id}] outputs')
-        logger.debug(f'[{request_id}] Raw output shape: {outputs.shape}')
-        logger.debug(f'[{request_id}] Raw output range: [{outputs.min():.4f}, {outputs.max():.4f}]')
-        
-        # For inverse transform, we need the scaler_y statistics from training
-        # This is a critical step that should use actual training statistics
-        # For now, create a minimal scaler (this will not be accurate)
-        scaler_y_local = StandardScaler()
-        scaler_y_local.mean_ = np.array([0.0] * 5)  # Placeholder
-        scaler_y_local.scale_ = np.array([1.0] * 5)  # Placeholder
-        
-        outputs_real = scaler_y_local.inverse_transform(outputs)
-        logger.debug(f'[{request_id}] After inverse transform: {outputs_real}')
-        
-        # Apply sign conventions
-        for i, app_name in enumerate(APPLIANCE_NAMES):
-            if app_name in LOAD_APPLIANCES:
-                outputs_real[0, i] = max(outputs_real[0, i], 0)
-            elif app_name in GENERATION_APPLIANCES:
-                outputs_real[0, i] = min(outputs_real[0, i], 0)
+        outputs_real = run_inference_batch([aggregate_sequence], request_id)
+        outputs_real = sanitize_array(outputs_real, f'[{request_id}] outputs')
         
         # Create prediction dictionary
         predictions = {
@@ -414,6 +495,115 @@ def predict():
         }), 500
 
 
+def backfill_windows(num_readings, seq_length=288, context=BACKFILL_CONTEXT):
+    """
+    Window starts covering a series, and the first output kept from each.
+    
+    Consecutive windows overlap by `context` readings so that every kept
+    output has seen at least `context` earlier readings (except at the very
+    start of the series). The last window is aligned with the end of the series.
+    """
+    stride = seq_length - context
+    starts = list(range(0, num_readings - seq_length + 1, stride))
+    if starts[-1] != num_readings - seq_length:
+        starts.append(num_readings - seq_length)
+    keep_from = [0] + [context] * (len(starts) - 1)
+    return starts, keep_from
+
+
+def run_backfill(aggregate_series, request_id='unknown', context=BACKFILL_CONTEXT):
+    """
+    Per-timestep predictions for a whole series with a seq2seq model.
+    
+    The series is cut into overlapping 288-reading windows; each forward
+    returns all 288 steps, so a series needs about len / (288 - context)
+    forwards instead of one per reading.
+    
+    Returns:
+        (np.ndarray, int): (len(series), 5) predictions, where row j is the
+        prediction for the reading after reading j; and the window count
+    """
+    series = np.asarray(aggregate_series, dtype=np.float32)
+    starts, keep_from = backfill_windows(len(series), 288, context)
+    windows = np.lib.stride_tricks.sliding_window_view(series, 288)[starts]
+    predictions = np.empty((len(series), len(APPLIANCE_NAMES)), dtype=np.float32)
+    for batch_start in range(0, len(starts), BACKFILL_BATCH_SIZE):
+        batch_end = batch_start + BACKFILL_BATCH_SIZE
+        outputs = run_inference_batch(windows[batch_start:batch_end], request_id, per_timestep=True)
+        # Later windows overwrite the short-context head of the next one
+        for start, keep, output in zip(starts[batch_start:batch_end], keep_from[batch_start:batch_end], outputs):
+            predictions[start + keep:start + 288] = output[keep:]
+    return predictions, len(starts)
+
+
+@app.route('/predict/backfill', methods=['POST'])
+def predict_backfill():
+    """
+    Bulk backfill endpoint (requires a TCN_Seq2Seq model)
+    
+    Request:
+    {
+        "aggregate_series": [at least 288 numbers, oldest first],
+        "context": optional overlap between windows (default BACKFILL_CONTEXT),
+        "request_id": "optional_request_id"
+    }
+    
+    Response:
+    {
+        "request_id": "request_id",
+        "predictions": {"EVSE": [...], "PV": [...], ...},
+        "offset": 1,
+        "windows": number of forwards,
+        "status": "success",
+        "timestamp": "ISO8601_timestamp"
+    }
+    predictions[appliance][j] is the prediction for reading j + offset,
+    the same convention as /predict (the reading after the window).
+    """
+    data = request.get_json(silent=True) or {}
+    request_id = data.get('request_id', f'req_{datetime.now().timestamp()}')
+    
+    def error(message, status=400):
+        logger.warning(f'[{request_id}] {message}')
+        return jsonify({
+            'request_id': request_id,
+            'status': 'error',
+            'error': message,
+            'timestamp': datetime.now().isoformat(),
+        }), status
+    
+    if not getattr(model, 'per_timestep', False):
+        return error('Backfill needs a seq2seq model (MODEL_NAME pointing at a TCN_Seq2Seq checkpoint)')
+    series = data.get('aggregate_series')
+    if not isinstance(series, list) or len(series) < 288:
+        return error('aggregate_series must be a list of at least 288 numbers')
+    context = data.get('context', BACKFILL_CONTEXT)
+    if not isinstance(context, int) or not 0 <= context < 288:
+        return error('context must be an integer in [0, 288)')
+    try:
+        series = np.asarray(series, dtype=np.float32)
+    except (TypeError, ValueError):
+        return error('aggregate_series contains non-numeric values')
+    if series.ndim != 1 or not np.isfinite(series).all():
+        return error('aggregate_series contains non-numeric or non-finite values')
+    
+    try:
+        predictions, num_windows = run_backfill(series, request_id, context)
+        predictions = sanitize_array(predictions, f'[{request_id}] outputs')
+        logger.info(f'[{request_id}] Backfilled {len(series)} readings with {num_windows} forwards')
+        return jsonify({
+            'request_id': request_id,
+            'predictions': {name: predictions[:, i].tolist() for i, name in enumerate(APPLIANCE_NAMES)},
+            'offset': 1,
+            'windows': num_windows,
+            'status': 'success',
+            'timestamp': datetime.now().isoformat(),
+        }), 200
+    except Exception as e:
+        logger.error(f'[{request_id}] Backfill error: {str(e)}')
+        return error(str(e), 500)
+
+
 @app.route('/info', methods=['GET'])
 def info():
     """Model information endpoint"""
@@ -423,6 +613,8 @@ def info():
         'input_length': 288,
         'input_resolution': '5min',
         'device': str(device),
+        'architecture': model_architecture,
+        'scaler': scaler_y.source if scaler_y is not None else None,
         'timestamp': datetime.now().isoformat(),
     }), 200
 
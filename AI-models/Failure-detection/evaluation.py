@@ -0,0 +1,204 @@
+"""
+Vectorized evaluation of the VAE classifier
+
+A whole split goes through one batched forward (chunked only to bound
+memory) and every metric is computed from tensors:
+- accuracy and cross-entropy loss per sample
+- the confusion matrix (one bincount)
+- per-class precision, recall, F1 and support, with macro and weighted averages
+- reconstruction-error percentiles, overall and per true class
+
+training.py uses evaluate_head on the cached validation latents every epoch
+and writes the report of the best model to Results/evaluation.json.
+
+Usage:
+    python evaluation.py                       # validation split of training.py
+    python evaluation.py --split all --output Results/evaluation_all.json
+"""
+import os
+import json
+import argparse
+import torch
+import torch.nn.functional as F
+
+ERROR_PERCENTILES = (50, 90, 95, 99)
+
+def confusion_matrix(y_true, y_pred, num_classes):
+    """(num_classes, num_classes) counts, rows = true class, columns = predicted class"""
+    flat = y_true.long() * num_classes + y_pred.long()
+    return torch.bincount(flat, minlength=num_classes * num_classes).reshape(num_classes, num_classes)
+
+def classification_metrics(confusion, class_names=None):
+    """Accuracy, per-class precision/recall/F1/support and their averages from a confusion matrix"""
+    confusion = confusion.double()
+    true_positives = confusion.diagonal()
+    predicted = confusion.sum(dim=0)
+    support = confusion.sum(dim=1)
+    # Classes never predicted / never present get 0 instead of NaN
+    precision = torch.where(predicted > 0, true_positives / predicted.clamp(min=1), torch.zeros_like(predicted))
+    recall = torch.where(support > 0, true_positives / support.clamp(min=1), torch.zeros_like(support))
+    denominator = precision + recall
+    f1 = torch.where(denominator > 0, 2 * precision * recall / denominator.clamp(min=1e-12),
+                     torch.zeros_like(denominator))
+    total = support.sum().clamp(min=1)
+    weights = support / total
+
+    names = class_names if class_names is not None else [str(i) for i in range(len(support))]
+    per_class = {
+        str(name): {'precision': p, 'recall': r, 'f1': f, 'support': int(s)}
+        for name, p, r, f, s in zip(names, precision.tolist(), recall.tolist(), f1.tolist(), support.tolist())
+    }
+    return {
+        'accuracy': float(true_positives.sum() / total),
+        'macro': {'precision': float(precision.mean()), 'recall': float(recall.mean()), 'f1': float(f1.mean())},
+        'weighted': {'precision': float((precision * weights).sum()), 'recall': float((recall * weights).sum()),
+                     'f1': float((f1 * weights).sum())},
+        'per_class': per_class,
+    }
+
+def error_percentiles(errors, y_true=None, class_names=None, percentiles=ERROR_PERCENTILES):
+    """Percentiles, mean and max of the reconstruction errors, overall and per true class"""
+    q = torch.tensor([p / 100 for p in percentiles], dtype=errors.dtype, device=errors.device)
+
+    def summary(values):
+        if len(values) == 0:
+            return None
+        stats = dict(zip((f'p{p}' for p in percentiles), torch.quantile(values, q).tolist()))
+        stats.update(mean=float(values.mean()), max=float(values.max()), count=len(values))
+        return stats
+
+    report = {'all': summary(errors)}
+    if y_true is not None:
+        names = class_names if class_names is not None else [str(i) for i in range(int(y_true.max()) + 1)]
+        report['per_class'] = {str(name): summary(errors[y_true == i]) for i, name in enumerate(names)}
+    return report
+
+def evaluate_head(head, Z, y, criterion=None, num_classes=None, batch_size=65536):
+    """
+    Loss, accuracy and confusion matrix of a classifier head on latents Z
+    Returns a dict with 'loss' (per sample, None without criterion),
+    'accuracy' (%), 'confusion' (tensor) and 'predictions'
+    """
+    head.eval()
+    with torch.no_grad():
+        logits = torch.cat([head(Z[i:i + batch_size]) for i in range(0, len(Z), batch_size)])
+    num_classes = num_classes or logits.shape[1]
+    predictions = logits.argmax(dim=1)
+    confusion = confusion_matrix(y, predictions, num_classes)
+    correct = confusion.diagonal().sum()
+    if criterion is not None:
+        # One host sync for both numbers
+        loss, correct = torch.stack([criterion(logits, y).float(), correct.float()]).tolist()
+    else:
+        loss, correct = None, correct.item()
+    return {
+        'loss': loss,
+        'accuracy': 100 * correct / max(len(y), 1),
+        'confusion': confusion,
+        'predictions': predictions,
+    }
+
+def reconstruction_errors(vae, X, batch_size=65536):
+    """Mean squared error per sample of the VAE decoding mu (as served by the API)
+
+    X must be scaled with the training StandardScaler, as the API does before
+    the VAE; on raw features the rpm column would dominate the error
+    """
+    vae.eval()
+    with torch.no_grad():
+        errors = []
+        for i in range(0, len(X), batch_size):
+            batch = X[i:i + batch_size]
+            recon = vae.decoder(vae.fc_mu(vae.encoder(batch)))
+            errors.append((recon - batch).pow(2).mean(dim=1))
+    return torch.cat(errors)
+
+def build_report(confusion, errors=None, y_true=None, class_names=None, loss=None, extra=None):
+    """Machine-readable evaluation report (JSON-serialisable dict)"""
+    report = {
+        'samples': int(confusion.sum()),
+        'classes': [str(name) for name in class_names] if class_names is not None else None,
+        'loss': loss,
+    }
+    report.update(classification_metrics(confusion, class_names))
+    report['confusion_matrix'] = confusion.tolist()
+    if errors is not None:
+        report['reconstruction_error'] = error_percentiles(errors, y_true, class_names)
+    if extra:
+        report.update(extra)
+    return report
+
+def write_report(report, path):
+    """Write the report as JSON (atomically)"""
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(report, f, indent=2)
+    os.replace(tmp_path, path)
+
+def evaluate_classifier_model(classifier, X, y, class_names=None, criterion=None, batch_size=65536):
+    """Full report of a VAEClassifier on features X scaled like the served inputs"""
+    vae = classifier.vae
+    vae.eval()
+    with torch.no_grad():
+        Z = torch.cat([vae.fc_mu(vae.encoder(X[i:i + batch_size])) for i in range(0, len(X), batch_size)])
+    num_classes = len(class_names) if class_names is not None else None
+    result = evaluate_head(classifier.classifier, Z, y, criterion, num_classes, batch_size)
+    errors = reconstruction_errors(vae, X, batch_size)
+    return build_report(result['confusion'].cpu(), errors.cpu(), y.cpu(), class_names, loss=result['loss'])
+
+def main():
+    import pickle
+    import training
+
+    parser = argparse.ArgumentParser(description='Evaluate the saved VAE classifier on a split of the dataset')
+    parser.add_argument('--data', default=os.path.join(training.BASE_DIR, 'Dataset', 'predictive_maintenance.csv'))
+    parser.add_argument('--models-dir', default=os.path.join(training.BASE_DIR, 'Models'))
+    parser.add_argument('--split', choices=['val', 'all'], default='val',
+                        help="training.py's seeded classifier validation split, or every row")
+    parser.add_argument('--seed', type=int, default=0, help='Seed used by training.py for the splits')
+    parser.add_argument('--vae-val-fraction', type=float, default=0.1, help='As passed to training.py')
+    parser.add_argument('--output', default=os.path.join(training.BASE_DIR, 'Results', 'evaluation.json'))
+    args = parser.parse_args()
+
+    # Scale with the saved scaler.pkl, so the report scores the input path that is served
+    with open(os.path.join(args.models_dir, 'scaler.pkl'), 'rb') as f:
+        scaler = pickle.load(f)
+    X_normal, X_full, y_labels, label_encoder, _ = training.load_training_data(args.data, verbose=False,
+                                                                              scaler=scaler)
+    with open(os.path.join(args.models_dir, 'label_encoder.pkl'), 'rb') as f:
+        class_names = pickle.load(f).classes_.tolist()
+
+    vae_state = torch.load(os.path.join(args.models_dir, 'vae_model.pth'), map_location='cpu')
+    classifier_state = torch.load(os.path.join(args.models_dir, 'classifier_model.pth'), map_location='cpu')
+    hidden_dim, input_dim = vae_state['encoder.0.weight'].shape
+    latent_dim = vae_state['fc_mu.weight'].shape[0]
+    head_dim = classifier_state['classifier.0.weight'].shape[0]
+    classifier = training.VAEClassifier(training.VAE(input_dim, hidden_dim, latent_dim), len(class_names), head_dim)
+    classifier.load_state_dict(classifier_state)
+
+    if args.split == 'val':
+        # Reproduce training.py's seeded splits (the VAE split draws from the generator first)
+        split_generator = torch.Generator().manual_seed(args.seed)
+        vae_val_size = int(args.vae_val_fraction * len(X_normal))
+        torch.utils.data.random_split(range(len(X_normal)), [len(X_normal) - vae_val_size, vae_val_size],
+                                      generator=split_generator)
+        train_size = int(0.9 * len(X_full))
+        _, val_split = torch.utils.data.random_split(range(len(X_full)), [train_size, len(X_full) - train_size],
+                                                     generator=split_generator)
+        idx = torch.tensor(val_split.indices)
+        X, y = X_full[idx], y_labels[idx]
+    else:
+        X, y = X_full, y_labels
+
+    report = evaluate_classifier_model(classifier, X, y, class_names, criterion=F.cross_entropy)
+    report['split'] = args.split
+    write_report(report, args.output)
+    print(f"{report['samples']} samples: accuracy {report['accuracy'] * 100:.2f}%, "
+          f"macro F1 {report['macro']['f1']:.4f}")
+    print(f"Report written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
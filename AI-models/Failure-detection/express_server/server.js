@@ -154,6 +154,10 @@ app.post('/api/predict', validatePredictionInput, async (req, res) => {
             type_L: req.body.type_L,
             type_M: req.body.type_M
         };
+        if (req.body.machine_id !== undefined) {
+            // Lets the ML service keep rolling per-machine state
+            inputData.machine_id = req.body.machine_id;
+        }
 
         const response = await axios.post(
             `${FLASK_URL}/predict`,
@@ -176,7 +180,8 @@ app.post('/api/predict', validatePredictionInput, async (req, res) => {
                 reconstruction_error: prediction.reconstruction_error,
                 all_probabilities: prediction.all_probabilities,
                 is_anomaly: prediction.reconstruction_error > 0.1, // Threshold can be adjusted
-                device_used: prediction.device_used
+                device_used: prediction.device_used,
+                machine_state: prediction.machine_state
             },
             input: inputData,
             timestamp: new Date().toISOString()
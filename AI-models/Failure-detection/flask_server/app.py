@@ -1,199 +1,22 @@
 import os
-import pickle
+import csv
+import json
+import math
+import time
+import atexit
+import signal
 import numpy as np
 import pandas as pd
-import torch
-import torch.nn as nn
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
 import sys
 
 # Add parent directory to path to import model classes
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-class VAE(nn.Module):
-    """Variational Autoencoder (VAE) for feature learning"""
-    def __init__(self, input_dim, hidden_dim, latent_dim):
-        super(VAE, self).__init__()
-        
-        # Encoder
-        self.encoder = nn.Sequential(
-            nn.Linear(input_dim, hidden_dim),
-            nn.ReLU(),
-            nn.Linear(hidden_dim, hidden_dim),
-            nn.ReLU()
-        )
-        
-        # Latent space layers
-        self.fc_mu = nn.Linear(hidden_dim, latent_dim)
-        self.fc_var = nn.Linear(hidden_dim, latent_dim)
-        
-        # Decoder
-        self.decoder = nn.Sequential(
-            nn.Linear(latent_dim, hidden_dim),
-            nn.ReLU(),
-            nn.Linear(hidden_dim, hidden_dim),
-            nn.ReLU(),
-            nn.Linear(hidden_dim, input_dim)
-        )
-    
-    def reparameterize(self, mu, log_var):
-        """Reparameterization trick to sample from N(mu, var)"""
-        std = torch.exp(0.5 * log_var)
-        eps = torch.randn_like(std)
-        return mu + eps * std
-    
-    def forward(self, x):
-        # Encode
-        h = self.encoder(x)
-        
-        # Get mu and log variance
-        mu = self.fc_mu(h)
-        log_var = self.fc_var(h)
-        
-        # Reparameterize
-        z = self.reparameterize(mu, log_var)
-        
-        # Decode
-        x_recon = self.decoder(z)
-        
-        return x_recon, mu, log_var
-
-class VAEClassifier(nn.Module):
-    """Classifier that uses VAE's latent representation"""
-    def __init__(self, vae, num_classes):
-        super(VAEClassifier, self).__init__()
-        
-        # Freeze VAE parameters
-        for param in vae.parameters():
-            param.requires_grad = False
-        
-        self.vae = vae
-        
-        # Classification layers
-        self.classifier = nn.Sequential(
-            nn.Linear(vae.fc_mu.out_features, 64),
-            nn.ReLU(),
-            nn.Linear(64, num_classes)
-        )
-    
-    def forward(self, x):
-        # Get latent representation through VAE
-        h = self.vae.encoder(x)
-        mu = self.vae.fc_mu(h)
-        
-        # Classify
-        return self.classifier(mu)
-
-class PredictiveMaintenanceModel:
-    def __init__(self, models_dir='../Models'):
-        """Initialize the Predictive Maintenance Model"""
-        # Device configuration
-        self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-        
-        # Model hyperparameters
-        self.input_dim = 8
-        self.hidden_dim = 128
-        self.latent_dim = 64
-        self.num_classes = 6
-        
-        # Load preprocessing artifacts
-        self.load_preprocessing_artifacts(models_dir)
-        
-        # Initialize and load models
-        self.load_models(models_dir)
-    
-    def load_preprocessing_artifacts(self, models_dir):
-        """Load saved preprocessing artifacts"""
-        # Load StandardScaler
-        scaler_path = os.path.join(models_dir, 'scaler.pkl')
-        if os.path.exists(scaler_path):
-            with open(scaler_path, 'rb') as f:
-                self.scaler = pickle.load(f)
-        else:
-            raise FileNotFoundError(f"StandardScaler not found at {scaler_path}")
-        
-        # Load LabelEncoder
-        label_encoder_path = os.path.join(models_dir, 'label_encoder.pkl')
-        if os.path.exists(label_encoder_path):
-            with open(label_encoder_path, 'rb') as f:
-                self.label_encoder = pickle.load(f)
-        else:
-            raise FileNotFoundError(f"Label Encoder not found at {label_encoder_path}")
-    
-    def load_models(self, models_dir):
-        """Load pre-trained VAE and Classifier models"""
-        # Initialize VAE
-        self.vae = VAE(self.input_dim, self.hidden_dim, self.latent_dim).to(self.device)
-        vae_path = os.path.join(models_dir, 'vae_model.pth')
-        if os.path.exists(vae_path):
-            self.vae.load_state_dict(torch.load(vae_path, map_location=self.device))
-        else:
-            raise FileNotFoundError(f"VAE model not found at {vae_path}")
-        
-        # Initialize Classifier
-        self.classifier = VAEClassifier(self.vae, self.num_classes).to(self.device)
-        classifier_path = os.path.join(models_dir, 'classifier_model.pth')
-        if os.path.exists(classifier_path):
-            self.classifier.load_state_dict(torch.load(classifier_path, map_location=self.device))
-        else:
-            raise FileNotFoundError(f"Classifier model not found at {classifier_path}")
-        
-        # Set models to evaluation mode
-        self.vae.eval()
-        self.classifier.eval()
-    
-    def preprocess_data(self, data):
-        """Preprocess input data"""
-        # Scale the data
-        scaled_data = self.scaler.transform(data)
-        
-        # Convert to PyTorch tensor
-        return torch.tensor(scaled_data, dtype=torch.float32).to(self.device)
-    
-    def predict_single(self, data):
-        """Predict anomaly type for a single input"""
-        # Preprocess data
-        input_tensor = self.preprocess_data(data)
-        
-        # Get classifier outputs
-        with torch.no_grad():
-            outputs = self.classifier(input_tensor)
-            probabilities = torch.softmax(outputs, dim=1)
-            predicted_class_idx = torch.argmax(outputs, dim=1).cpu().numpy()
-        
-        # Decode predictions
-        predicted_class = self.label_encoder.classes_[predicted_class_idx[0]]
-        prediction_prob = probabilities[0, predicted_class_idx[0]].item()
-        
-        # Get all class probabilities
-        all_probabilities = {}
-        for idx, class_name in enumerate(self.label_encoder.classes_):
-            all_probabilities[class_name] = float(probabilities[0, idx].item())
-        
-        # Reconstruction for anomaly detection
-        with torch.no_grad():
-            x_recon, _, _ = self.vae(input_tensor)
-            reconstruction_error = nn.functional.mse_loss(
-                x_recon, input_tensor, reduction='none'
-            ).mean(dim=1).cpu().numpy()
-        
-        return {
-            'predicted_class': predicted_class,
-            'probability': prediction_prob,
-            'all_probabilities': all_probabilities,
-            'reconstruction_error': float(reconstruction_error[0]),
-            'device_used': str(self.device)
-        }
-    
-    def predict_batch(self, data):
-        """Predict anomalies for a batch of data"""
-        results = []
-        for i in range(len(data)):
-            sample = data[i:i+1]
-            result = self.predict_single(sample)
-            results.append(result)
-        return results
+from base_model import FEATURE_NAMES
+from machine_state import MachineStateStore
+from latent_index import LatentIndex, weights_sha1
 
 # Initialize Flask app
 app = Flask(__name__)
@@ -202,19 +25,166 @@ CORS(app)  # Enable CORS for all routes
 # Global model instance
 model = None
 
+# 'torch' (default) or 'numpy'; the NumPy backend never imports torch
+INFERENCE_BACKEND = os.getenv('INFERENCE_BACKEND', 'torch').lower()
+
+# Single-file model exported by export_model.py; used instead of the .pth/.pkl files when present
+MODEL_ARTIFACT = os.getenv('MODEL_ARTIFACT', 'predictor.pt')
+
+# Two-stage cascade calibrated by cascade.py: a tiny screen answers clearly
+# normal samples without running the full classifier
+CASCADE_ENABLED = os.getenv('CASCADE', '0').lower() in ('1', 'true', 'yes')
+CASCADE_PATH = os.getenv('CASCADE_PATH', 'cascade.json')
+
+# Rows scored per vectorized forward pass by the streaming endpoint
+STREAM_CHUNK_SIZE = int(os.getenv('STREAM_CHUNK_SIZE', 1024))
+
+# Per-machine rolling state, updated when a request carries a machine_id
+# (MACHINE_STATE_CAPACITY=0 disables it)
+MACHINE_STATE_CAPACITY = int(os.getenv('MACHINE_STATE_CAPACITY', 10000))
+MACHINE_STATE_WINDOW = int(os.getenv('MACHINE_STATE_WINDOW', 64))
+MACHINE_STATE_ALPHA = float(os.getenv('MACHINE_STATE_ALPHA', 0.1))
+DRIFT_Z_THRESHOLD = float(os.getenv('DRIFT_Z_THRESHOLD', 3.0))
+ALERT_FAILURE_SHARE = float(os.getenv('ALERT_FAILURE_SHARE', 0.5))
+MACHINE_STATE_SNAPSHOT = os.getenv('MACHINE_STATE_SNAPSHOT', 'machine_state.npz')
+NORMAL_CLASS = 'No Failure'
+
+machine_states = None
+class_index = {}
+
+# Latent nearest-neighbour index built by latent_index.py
+LATENT_INDEX_DIR = os.getenv('LATENT_INDEX_DIR', os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Models', 'latent_index'))
+MAX_NEIGHBOURS = 100
+
+latent_index = None
+embedding_model = None
+
 def initialize_model():
     """Initialize the model on startup"""
     global model
     try:
         models_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Models')
-        model = PredictiveMaintenanceModel(models_dir=models_dir)
+        artifact_path = os.path.join(models_dir, MODEL_ARTIFACT)
+        if INFERENCE_BACKEND == 'numpy':
+            from numpy_backend import NumpyPredictiveMaintenanceModel
+            model = NumpyPredictiveMaintenanceModel(models_dir=models_dir)
+        elif INFERENCE_BACKEND != 'torch':
+            raise ValueError(f"Unknown INFERENCE_BACKEND '{INFERENCE_BACKEND}' (expected 'torch' or 'numpy')")
+        else:
+            model = load_compiled_artifact(artifact_path, models_dir)
+            if model is None:
+                from torch_backend import PredictiveMaintenanceModel
+                model = PredictiveMaintenanceModel(models_dir=models_dir)
+        print(f"Inference backend: {INFERENCE_BACKEND}")
+        if CASCADE_ENABLED:
+            from cascade import CascadeModel
+            model = CascadeModel.load(model, os.path.join(models_dir, CASCADE_PATH))
+            print(f"Cascade enabled (threshold {model.threshold:.4f}, calibrated short-circuit "
+                  f"fraction {model.params['calibration']['short_circuit_fraction']:.1%})")
         print("Model loaded successfully!")
         print(f"Using device: {model.device}")
-        print(f"Available classes: {model.label_encoder.classes_}")
+        print(f"Available classes: {model.classes}")
+        initialize_machine_states()
+        initialize_latent_index(models_dir)
     except Exception as e:
         print(f"Error loading model: {str(e)}")
         raise
 
+def load_compiled_artifact(artifact_path, models_dir):
+    """The export_model.py artifact, or None when absent or older than the checkpoints
+    
+    The artifact records the fingerprint of the .pth/.pkl files it was exported
+    from. After a retrain it no longer matches, and the checkpoints are served
+    instead (with a warning) until the artifact is re-exported. Without the
+    checkpoints (an artifact-only deployment) the artifact is used as is.
+    """
+    if not os.path.exists(artifact_path):
+        return None
+    from torch_backend import CompiledPredictiveMaintenanceModel
+    compiled = CompiledPredictiveMaintenanceModel(artifact_path)
+    try:
+        current_sha1 = weights_sha1(models_dir)
+    except FileNotFoundError:
+        current_sha1 = None
+    if current_sha1 is not None and compiled.weights_sha1 != current_sha1:
+        print(f"Warning: {artifact_path} was not exported from the current checkpoints in {models_dir}; "
+              f"serving the checkpoints instead (re-run export_model.py)")
+        return None
+    print(f"Loaded compiled model artifact: {artifact_path}")
+    return compiled
+
+def initialize_machine_states():
+    """Create the per-machine state store and restore the last snapshot"""
+    global machine_states, class_index
+    class_index = {name: i for i, name in enumerate(model.classes.tolist())}
+    if MACHINE_STATE_CAPACITY <= 0:
+        return
+    machine_states = MachineStateStore(
+        num_classes=len(class_index),
+        capacity=MACHINE_STATE_CAPACITY,
+        window=MACHINE_STATE_WINDOW,
+        alpha=MACHINE_STATE_ALPHA,
+        drift_z=DRIFT_Z_THRESHOLD,
+        alert_share=ALERT_FAILURE_SHARE,
+        normal_class_idx=class_index.get(NORMAL_CLASS)
+    )
+    if os.path.exists(MACHINE_STATE_SNAPSHOT):
+        try:
+            restored = machine_states.load(MACHINE_STATE_SNAPSHOT)
+            print(f"Restored state of {restored} machines from {MACHINE_STATE_SNAPSHOT}")
+        except Exception as e:
+            print(f"Ignoring machine state snapshot {MACHINE_STATE_SNAPSHOT}: {str(e)}")
+    atexit.register(save_machine_states)
+
+def initialize_latent_index(models_dir):
+    """Open the latent index (if built) and pick the model that embeds queries"""
+    global latent_index, embedding_model
+    if not os.path.exists(os.path.join(LATENT_INDEX_DIR, 'meta.json')):
+        print(f"No latent index at {LATENT_INDEX_DIR}; /similar is disabled (build it with latent_index.py)")
+        return
+    try:
+        index = LatentIndex(LATENT_INDEX_DIR)
+        if index.meta['weights_sha1'] != weights_sha1(models_dir):
+            print("Warning: the latent index was built with different model weights; rebuild it with latent_index.py")
+        # The compiled artifact only returns predictions, so queries are embedded with NumPy
+        try:
+            model.embed(np.zeros((1, len(FEATURE_NAMES))))
+            embedding_model = model
+        except NotImplementedError:
+            from numpy_backend import NumpyPredictiveMaintenanceModel
+            embedding_model = NumpyPredictiveMaintenanceModel(models_dir=models_dir)
+    except Exception as e:
+        print(f"Error loading latent index: {str(e)}; /similar is disabled")
+        return
+    latent_index = index
+    print(f"Loaded latent index: {latent_index.count} samples, {latent_index.meta['nlist']} partitions")
+
+def save_machine_states():
+    """Snapshot the per-machine state to MACHINE_STATE_SNAPSHOT"""
+    if machine_states is None:
+        return
+    try:
+        saved = machine_states.save(MACHINE_STATE_SNAPSHOT)
+        print(f"Saved state of {saved} machines to {MACHINE_STATE_SNAPSHOT}")
+    except Exception as e:
+        print(f"Error saving machine state: {str(e)}")
+
+def track_machines(machine_ids, results):
+    """Fold each result into its machine's rolling state (rows without an ID are skipped)"""
+    if machine_states is None:
+        return
+    for machine_id, result in zip(machine_ids, results):
+        if machine_id is None:
+            continue
+        result['machine_state'] = machine_states.update(
+            str(machine_id), result['reconstruction_error'], class_index[result['predicted_class']])
+
+def invalid_machine_ids(machine_ids):
+    """Positions of machine IDs that are not a string, an integer or null"""
+    return [i for i, machine_id in enumerate(machine_ids)
+            if machine_id is not None and (isinstance(machine_id, bool) or not isinstance(machine_id, (str, int)))]
+
 @app.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
@@ -238,7 +208,8 @@ def predict():
         "tool_wear": 100,
         "type_H": 0,
         "type_L": 1,
-        "type_M": 0
+        "type_M": 0,
+        "machine_id": "press-07"    (optional, enables rolling state)
     }
     """
     try:
@@ -252,10 +223,7 @@ def predict():
             return jsonify({'error': 'No data provided'}), 400
         
         # Extract features in the correct order
-        feature_names = [
-            'air_temperature', 'process_temperature', 'rotational_speed',
-            'torque', 'tool_wear', 'type_H', 'type_L', 'type_M'
-        ]
+        feature_names = FEATURE_NAMES
         
         # Validate all required features are present
         missing_features = [f for f in feature_names if f not in data]
@@ -270,6 +238,7 @@ def predict():
         
         # Make prediction
         result = model.predict_single(features)
+        track_machines([data.get('machine_id')], [result])
         
         return jsonify({
             'success': True,
@@ -283,6 +252,61 @@ def predict():
             'message': str(e)
         }), 500
 
+def parse_columnar_batch(data):
+    """Parse a columnar batch request into an (N, 8) float array.
+    
+    Accepts either a `feature_names` header plus a `rows` matrix, or a
+    `columns` object mapping each feature name to one array. Validation is
+    a handful of whole-array checks (shape, dtype, finiteness) instead of
+    per-sample key lookups.
+    
+    Returns (array, None) on success or (None, error_dict) on failure.
+    """
+    if 'columns' in data:
+        columns = data['columns']
+        if not isinstance(columns, dict):
+            return None, {'error': 'columns must be an object of feature name -> array'}
+        missing_features = [f for f in FEATURE_NAMES if f not in columns]
+        if missing_features:
+            return None, {'error': 'Missing required features', 'missing': missing_features}
+        try:
+            lengths = {len(columns[f]) for f in FEATURE_NAMES}
+        except TypeError:
+            return None, {'error': 'Every column must be an array'}
+        if len(lengths) != 1:
+            return None, {'error': 'All columns must have the same length'}
+        raw = [columns[f] for f in FEATURE_NAMES]
+        transpose = True
+    else:
+        feature_names = data.get('feature_names')
+        if (not isinstance(feature_names, list) or not all(isinstance(f, str) for f in feature_names)
+                or sorted(feature_names) != sorted(FEATURE_NAMES)):
+            return None, {'error': 'feature_names must list each of the 8 features exactly once',
+                          'feature_names': FEATURE_NAMES}
+        raw = data['rows']
+        transpose = False
+    
+    try:
+        batch_array = np.asarray(raw, dtype=np.float64)
+    except (TypeError, ValueError):
+        return None, {'error': 'Features must be numeric arrays of equal length'}
+    if transpose:
+        if batch_array.ndim != 2:
+            return None, {'error': 'Every column must be a flat array of numbers'}
+        batch_array = batch_array.T
+    else:
+        if batch_array.ndim != 2 or batch_array.shape[1] != len(FEATURE_NAMES):
+            return None, {'error': f'rows must have shape (N, {len(FEATURE_NAMES)}), got {list(batch_array.shape)}'}
+        # Reorder the columns into model order
+        batch_array = batch_array[:, [feature_names.index(f) for f in FEATURE_NAMES]]
+    
+    if batch_array.shape[0] == 0:
+        return None, {'error': 'Batch must contain at least one sample'}
+    if not np.isfinite(batch_array).all():
+        bad_rows = np.flatnonzero(~np.isfinite(batch_array).all(axis=1))
+        return None, {'error': 'Features must be finite numbers', 'invalid_samples': bad_rows[:100].tolist()}
+    return batch_array, None
+
 @app.route('/predict/batch', methods=['POST'])
 def predict_batch():
     """
@@ -299,11 +323,23 @@ def predict_batch():
                 "tool_wear": 100,
                 "type_H": 0,
                 "type_L": 1,
-                "type_M": 0
+                "type_M": 0,
+                "machine_id": "press-07"    (optional)
             },
             ...
         ]
     }
+    
+    Columnar alternatives (validated with whole-array checks):
+    {
+        "feature_names": ["air_temperature", ..., "type_M"],
+        "rows": [[300.0, 310.0, 1500, 40.0, 100, 0, 1, 0], ...]
+    }
+    {
+        "columns": {"air_temperature": [300.0, ...], ..., "type_M": [0, ...]}
+    }
+    Columnar requests may add "machine_ids": [...] with one ID (or null) per sample;
+    IDs are strings or integers, anything else is rejected with a 400.
     """
     try:
         if model is None:
@@ -312,36 +348,56 @@ def predict_batch():
         # Get JSON data
         data = request.get_json()
         
-        if not data or 'samples' not in data:
-            return jsonify({'error': 'No samples provided'}), 400
-        
-        samples = data['samples']
-        
-        if not isinstance(samples, list) or len(samples) == 0:
-            return jsonify({'error': 'Samples must be a non-empty list'}), 400
-        
-        # Extract features
-        feature_names = [
-            'air_temperature', 'process_temperature', 'rotational_speed',
-            'torque', 'tool_wear', 'type_H', 'type_L', 'type_M'
-        ]
-        
-        # Validate and prepare batch data
-        batch_features = []
-        for i, sample in enumerate(samples):
-            missing_features = [f for f in feature_names if f not in sample]
-            if missing_features:
-                return jsonify({
-                    'error': f'Missing features in sample {i}',
-                    'missing': missing_features
-                }), 400
+        if isinstance(data, dict) and ('rows' in data or 'columns' in data):
+            batch_array, error = parse_columnar_batch(data)
+            if error is not None:
+                return jsonify(error), 400
+            machine_ids = data.get('machine_ids')
+            if machine_ids is None:
+                machine_ids = [None] * len(batch_array)
+            if not isinstance(machine_ids, list) or len(machine_ids) != len(batch_array):
+                return jsonify({'error': 'machine_ids must be a list with one entry per sample'}), 400
+        else:
+            if not data or 'samples' not in data:
+                return jsonify({'error': 'No samples provided'}), 400
             
-            batch_features.append([sample[f] for f in feature_names])
-        
-        batch_array = np.array(batch_features)
+            samples = data['samples']
+            
+            if not isinstance(samples, list) or len(samples) == 0:
+                return jsonify({'error': 'Samples must be a non-empty list'}), 400
+            
+            # Validate and prepare batch data
+            batch_features = []
+            for i, sample in enumerate(samples):
+                if not isinstance(sample, dict):
+                    return jsonify({'error': f'Sample {i} must be an object of feature name -> value'}), 400
+                missing_features = [f for f in FEATURE_NAMES if f not in sample]
+                if missing_features:
+                    return jsonify({
+                        'error': f'Missing features in sample {i}',
+                        'missing': missing_features
+                    }), 400
+                
+                batch_features.append([sample[f] for f in FEATURE_NAMES])
+            
+            try:
+                batch_array = np.array(batch_features, dtype=np.float64)
+            except (TypeError, ValueError):
+                return jsonify({'error': 'Features must be numbers'}), 400
+            if not np.isfinite(batch_array).all():
+                bad_rows = np.flatnonzero(~np.isfinite(batch_array).all(axis=1))
+                return jsonify({'error': 'Features must be finite numbers',
+                                'invalid_samples': bad_rows[:100].tolist()}), 400
+            machine_ids = [sample.get('machine_id') for sample in samples]
+        
+        bad_ids = invalid_machine_ids(machine_ids)
+        if bad_ids:
+            return jsonify({'error': 'Machine IDs must be strings, integers or null',
+                            'invalid_samples': bad_ids[:100]}), 400
         
         # Make predictions
         results = model.predict_batch(batch_array)
+        track_machines(machine_ids, results)
         
         return jsonify({
             'success': True,
@@ -355,6 +411,226 @@ def predict_batch():
             'message': str(e)
         }), 500
 
+def iter_ndjson_rows(stream):
+    """Yield (features, error) for each non-empty line of an NDJSON stream.
+    
+    A line is either an object with the eight feature keys or a plain list
+    of eight values in FEATURE_NAMES order.
+    """
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield None, f'Invalid JSON: {e}'
+            continue
+        if isinstance(row, dict):
+            missing_features = [f for f in FEATURE_NAMES if f not in row]
+            if missing_features:
+                yield None, f'Missing features: {missing_features}'
+                continue
+            row = [row[f] for f in FEATURE_NAMES]
+        if not isinstance(row, list) or len(row) != len(FEATURE_NAMES):
+            yield None, f'Expected an object or a list of {len(FEATURE_NAMES)} values'
+            continue
+        # Convert here, as the CSV path does, so one bad value fails its own row
+        # instead of the whole chunk it would be scored with
+        try:
+            row = [float(value) for value in row]
+        except (TypeError, ValueError) as e:
+            yield None, f'Features must be numbers: {e}'
+            continue
+        if not all(math.isfinite(value) for value in row):
+            yield None, 'Features must be finite numbers'
+            continue
+        yield row, None
+
+def read_csv_header(stream):
+    """Read the header row of a CSV stream; returns (reader, feature column indices).
+    
+    The header must name all eight features (extra columns are ignored);
+    raises ValueError otherwise. An empty body gives an empty reader.
+    """
+    reader = csv.reader(line.decode('utf-8-sig') for line in stream)
+    header = next(reader, None)
+    if header is None:
+        return iter(()), []
+    header = [column.strip() for column in header]
+    missing_features = [f for f in FEATURE_NAMES if f not in header]
+    if missing_features:
+        raise ValueError(f'CSV header is missing features: {missing_features}')
+    return reader, [header.index(f) for f in FEATURE_NAMES]
+
+def iter_csv_rows(reader, columns):
+    """Yield (features, error) for each data row after the header (see read_csv_header)"""
+    for values in reader:
+        if not values:
+            continue
+        try:
+            row = [float(values[c]) for c in columns]
+        except (IndexError, ValueError) as e:
+            yield None, f'Invalid CSV row: {e}'
+            continue
+        if not all(math.isfinite(value) for value in row):
+            yield None, 'Features must be finite numbers'
+            continue
+        yield row, None
+
+@app.route('/predict/stream', methods=['POST'])
+def predict_stream():
+    """
+    Streaming bulk predict endpoint
+    
+    Accepts newline-delimited JSON (Content-Type: application/x-ndjson), one
+    sample per line, or CSV (Content-Type: text/csv) with a header row.
+    Rows are read incrementally and scored in vectorized chunks of
+    STREAM_CHUNK_SIZE (override with ?chunk_size=N); each result is streamed
+    back as one NDJSON line as soon as its chunk is done, so memory stays flat
+    whatever the upload size. Invalid rows are reported with their chunk, so
+    the lines come back in input order. A CSV header without the eight
+    features is rejected with a 400 before streaming starts:
+    
+        {"index": 0, "predicted_class": "No Failure", ...}
+        {"index": 1, "error": "Missing features: ['torque']"}
+        {"done": true, "count": 2, "errors": 1}
+    """
+    if model is None:
+        return jsonify({'error': 'Model not loaded'}), 500
+    
+    chunk_size = request.args.get('chunk_size', STREAM_CHUNK_SIZE, type=int)
+    if chunk_size <= 0:
+        return jsonify({'error': 'chunk_size must be a positive integer'}), 400
+    
+    if request.mimetype == 'text/csv':
+        try:
+            rows = iter_csv_rows(*read_csv_header(request.stream))
+        except (ValueError, UnicodeDecodeError, csv.Error) as e:
+            return jsonify({'error': 'Invalid CSV header', 'message': str(e)}), 400
+    else:
+        rows = iter_ndjson_rows(request.stream)
+    
+    def score(pending, features):
+        """NDJSON lines of a chunk in input order; pending holds (index, error or None)"""
+        try:
+            results = iter(model.predict_batch(np.array(features, dtype=np.float64))) if features else iter(())
+        except Exception as e:
+            failure = f'Prediction failed: {e}'
+            return [json.dumps({'index': i, 'error': error or failure}) + '\n' for i, error in pending]
+        return [json.dumps({'index': i, 'error': error} if error is not None else {'index': i, **next(results)}) + '\n'
+                for i, error in pending]
+    
+    def generate():
+        pending, features = [], []
+        count = errors = 0
+        try:
+            for index, (row, error) in enumerate(rows):
+                count += 1
+                pending.append((index, error))
+                if error is not None:
+                    errors += 1
+                else:
+                    features.append(row)
+                if len(pending) == chunk_size:
+                    yield ''.join(score(pending, features))
+                    pending, features = [], []
+            if pending:
+                yield ''.join(score(pending, features))
+        except Exception as e:
+            yield json.dumps({'error': 'Stream aborted', 'message': str(e)}) + '\n'
+            return
+        yield json.dumps({'done': True, 'count': count, 'errors': errors}) + '\n'
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@app.route('/similar', methods=['POST'])
+def similar():
+    """
+    Nearest historical samples in the VAE latent space
+    
+    Expected input format:
+    {
+        "air_temperature": 300.0, ..., "type_M": 0,
+        "k": 5,                (optional, default 5, max 100)
+        "mode": "exact",       (optional, "exact" or "approx")
+        "nprobe": 8            (optional, partitions scanned in approx mode)
+    }
+    """
+    global latent_index
+    try:
+        if latent_index is None:
+            return jsonify({'error': 'Latent index not available'}), 503
+        
+        data = request.get_json()
+        if not data:
+            return jsonify({'error': 'No data provided'}), 400
+        missing_features = [f for f in FEATURE_NAMES if f not in data]
+        if missing_features:
+            return jsonify({
+                'error': 'Missing required features',
+                'missing': missing_features
+            }), 400
+        
+        k = data.get('k', 5)
+        nprobe = data.get('nprobe', 8)
+        mode = data.get('mode', 'exact')
+        if not isinstance(k, int) or not 1 <= k <= MAX_NEIGHBOURS:
+            return jsonify({'error': f'k must be an integer between 1 and {MAX_NEIGHBOURS}'}), 400
+        if not isinstance(nprobe, int) or nprobe < 1:
+            return jsonify({'error': 'nprobe must be a positive integer'}), 400
+        if mode not in ('exact', 'approx'):
+            return jsonify({'error': "mode must be 'exact' or 'approx'"}), 400
+        
+        # Pick up rows appended by latent_index.py since the last request
+        if latent_index.is_stale():
+            latent_index = LatentIndex(LATENT_INDEX_DIR)
+        index = latent_index
+        if mode == 'approx' and index.centroids is None:
+            mode = 'exact'
+        
+        start = time.perf_counter()
+        features = np.array([[data[f] for f in FEATURE_NAMES]], dtype=np.float64)
+        neighbours = index.neighbours(embedding_model.embed(features), k=k, mode=mode, nprobe=nprobe)[0]
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        
+        return jsonify({
+            'success': True,
+            'neighbours': neighbours,
+            'mode': mode,
+            'indexed_samples': index.count,
+            'search_ms': elapsed_ms
+        }), 200
+        
+    except Exception as e:
+        return jsonify({
+            'error': 'Similarity search failed',
+            'message': str(e)
+        }), 500
+
+@app.route('/machines', methods=['GET'])
+def machines_summary():
+    """Number of tracked machines and memory used by their rolling state"""
+    if machine_states is None:
+        return jsonify({'enabled': False}), 200
+    return jsonify({
+        'enabled': True,
+        'tracked': len(machine_states.slots),
+        'capacity': machine_states.capacity,
+        'window': machine_states.window,
+        'memory_bytes': machine_states.nbytes
+    }), 200
+
+@app.route('/machines/<machine_id>', methods=['GET'])
+def machine_detail(machine_id):
+    """Rolling state of one machine: EWMA/std of the error, class share and ring buffer"""
+    if machine_states is None:
+        return jsonify({'error': 'Machine state tracking is disabled'}), 404
+    state = machine_states.get(machine_id, classes=model.classes.tolist())
+    if state is None:
+        return jsonify({'error': f'Unknown machine {machine_id}'}), 404
+    return jsonify(state), 200
+
 @app.route('/model/info', methods=['GET'])
 def model_info():
     """Get model information"""
@@ -367,12 +643,11 @@ def model_info():
             'hidden_dim': model.hidden_dim,
             'latent_dim': model.latent_dim,
             'num_classes': model.num_classes,
-            'classes': model.label_encoder.classes_.tolist(),
+            'classes': model.classes.tolist(),
             'device': str(model.device),
-            'feature_names': [
-                'air_temperature', 'process_temperature', 'rotational_speed',
-                'torque', 'tool_wear', 'type_H', 'type_L', 'type_M'
-            ]
+            'backend': INFERENCE_BACKEND,
+            'cascade': model.stats() if CASCADE_ENABLED else None,
+            'feature_names': FEATURE_NAMES
         }), 200
         
     except Exception as e:
@@ -385,5 +660,8 @@ if __name__ == '__main__':
     # Initialize model on startup
     initialize_model()
     
+    # Turn SIGTERM into a normal exit so the machine state snapshot is written
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    
     # Run Flask app
     app.run(host='0.0.0.0', port=5002, debug=False)
@@ -0,0 +1,73 @@
+"""Backend-independent parts of the failure-detection predictors.
+
+Every inference backend (torch_backend, numpy_backend) produces the same bulk
+arrays from predict_arrays; turning them into API responses and loading the
+sklearn preprocessing artifacts lives here so it never pulls in torch.
+"""
+import os
+import pickle
+import numpy as np
+
+# Input features in the order the model expects them
+FEATURE_NAMES = [
+    'air_temperature', 'process_temperature', 'rotational_speed',
+    'torque', 'tool_wear', 'type_H', 'type_L', 'type_M'
+]
+
+class BaseMaintenanceModel:
+    """Shared response building; subclasses implement predict_arrays"""
+    
+    def load_preprocessing_artifacts(self, models_dir):
+        """Load saved preprocessing artifacts"""
+        # Load StandardScaler
+        scaler_path = os.path.join(models_dir, 'scaler.pkl')
+        if os.path.exists(scaler_path):
+            with open(scaler_path, 'rb') as f:
+                self.scaler = pickle.load(f)
+        else:
+            raise FileNotFoundError(f"StandardScaler not found at {scaler_path}")
+        
+        # Load LabelEncoder
+        label_encoder_path = os.path.join(models_dir, 'label_encoder.pkl')
+        if os.path.exists(label_encoder_path):
+            with open(label_encoder_path, 'rb') as f:
+                self.label_encoder = pickle.load(f)
+            self.classes = self.label_encoder.classes_
+        else:
+            raise FileNotFoundError(f"Label Encoder not found at {label_encoder_path}")
+    
+    def predict_arrays(self, data):
+        """Return probabilities (N, num_classes), predicted class indices (N,)
+        and reconstruction errors (N,) as NumPy arrays"""
+        raise NotImplementedError
+    
+    def embed(self, data):
+        """Return the VAE latent means `mu` (N, latent_dim) of an (N, 8) feature matrix"""
+        raise NotImplementedError(f"{type(self).__name__} does not expose latent embeddings")
+    
+    def format_results(self, probabilities, predicted_class_idx, reconstruction_error):
+        """Build the per-sample response dicts from bulk prediction arrays"""
+        classes = self.classes.tolist()
+        predicted_classes = self.classes[predicted_class_idx].tolist()
+        prediction_probs = probabilities[np.arange(len(predicted_class_idx)), predicted_class_idx].tolist()
+        reconstruction_error = reconstruction_error.tolist()
+        device_used = str(self.device)
+        
+        return [
+            {
+                'predicted_class': predicted_classes[i],
+                'probability': prediction_probs[i],
+                'all_probabilities': dict(zip(classes, row)),
+                'reconstruction_error': reconstruction_error[i],
+                'device_used': device_used
+            }
+            for i, row in enumerate(probabilities.tolist())
+        ]
+    
+    def predict_single(self, data):
+        """Predict anomaly type for a single input"""
+        return self.predict_batch(data)[0]
+    
+    def predict_batch(self, data):
+        """Predict anomalies for a batch of data"""
+        return self.format_results(*self.predict_arrays(data))
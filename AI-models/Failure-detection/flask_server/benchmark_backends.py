@@ -0,0 +1,117 @@
+"""
+Compare the torch and NumPy inference backends.
+
+1. Equivalence: both backends score the same random batch; probabilities,
+   predicted classes and reconstruction errors must agree.
+2. Startup and memory: each backend is loaded in a fresh subprocess, which
+   reports its import + load time and peak RSS (and whether torch got imported).
+3. Latency: median time per call at several batch sizes.
+
+Usage:
+    python benchmark_backends.py
+    python benchmark_backends.py --models-dir ../Models --batch-sizes 1 64 1024
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+import numpy as np
+
+DEFAULT_MODELS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Models')
+
+# Run in a subprocess so the measured startup and RSS belong to one backend only
+STARTUP_SCRIPT = '''
+import json, resource, sys, time
+start = time.perf_counter()
+if sys.argv[1] == 'numpy':
+    from numpy_backend import NumpyPredictiveMaintenanceModel as Model
+else:
+    from torch_backend import PredictiveMaintenanceModel as Model
+model = Model(models_dir=sys.argv[2])
+model.predict_batch([[300.0, 310.0, 1500, 40.0, 100, 0, 1, 0]])
+elapsed = time.perf_counter() - start
+rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({'startup_s': elapsed, 'peak_rss_mb': rss_kb / 1024, 'torch_imported': 'torch' in sys.modules}))
+'''
+
+def random_features(scaler, n, seed=0):
+    """Raw feature rows spread around the training distribution"""
+    rng = np.random.default_rng(seed)
+    return scaler.mean_ + scaler.scale_ * rng.standard_normal((n, len(scaler.mean_)))
+
+def check_equivalence(torch_model, numpy_model, n=4096):
+    """Score the same rows with both backends and report the largest differences"""
+    data = random_features(torch_model.scaler, n)
+    torch_probs, torch_idx, torch_error = torch_model.predict_arrays(data)
+    numpy_probs, numpy_idx, numpy_error = numpy_model.predict_arrays(data)
+
+    max_prob_diff = float(np.abs(torch_probs - numpy_probs).max())
+    max_error_diff = float(np.abs(torch_error - numpy_error).max())
+    argmax_agreement = float((torch_idx == numpy_idx).mean())
+    print(f"Equivalence on {n} rows:")
+    print(f"  max probability diff:          {max_prob_diff:.2e}")
+    print(f"  max reconstruction error diff: {max_error_diff:.2e}")
+    print(f"  argmax agreement:              {argmax_agreement * 100:.2f}%")
+
+    if max_prob_diff > 1e-4 or max_error_diff > 1e-3 or argmax_agreement < 0.999:
+        raise AssertionError("NumPy backend disagrees with the torch backend")
+    print("  OK\n")
+
+def measure_startup(backend, models_dir):
+    """Import + load + first prediction time and peak RSS of a fresh process"""
+    output = subprocess.run(
+        [sys.executable, '-c', STARTUP_SCRIPT, backend, models_dir],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def measure_latency(model, batch_size, repeats=50):
+    """Median wall-clock time per predict_batch call, in milliseconds"""
+    data = random_features(model.scaler, batch_size, seed=1)
+    model.predict_batch(data)  # warm-up
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        model.predict_batch(data)
+        timings.append(time.perf_counter() - start)
+    return float(np.median(timings) * 1000)
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the torch and NumPy inference backends')
+    parser.add_argument('--models-dir', default=DEFAULT_MODELS_DIR)
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 64, 1024])
+    parser.add_argument('--repeats', type=int, default=50)
+    args = parser.parse_args()
+
+    print("Startup (fresh process, import + load + first prediction):")
+    for backend in ('torch', 'numpy'):
+        stats = measure_startup(backend, args.models_dir)
+        print(f"  {backend:<6} {stats['startup_s']:6.2f} s   peak RSS {stats['peak_rss_mb']:7.1f} MB   "
+              f"torch imported: {stats['torch_imported']}")
+    print()
+
+    from torch_backend import PredictiveMaintenanceModel
+    from numpy_backend import NumpyPredictiveMaintenanceModel
+    import torch
+
+    torch_model = PredictiveMaintenanceModel(models_dir=args.models_dir)
+    # Compare like for like: both on CPU, in float32
+    torch_model.device = torch.device('cpu')
+    torch_model.vae.cpu()
+    torch_model.classifier.cpu()
+    numpy_model = NumpyPredictiveMaintenanceModel(models_dir=args.models_dir)
+
+    check_equivalence(torch_model, numpy_model)
+
+    print("Latency per predict_batch call (median, ms):")
+    print(f"  {'batch':>6} {'torch':>10} {'numpy':>10}")
+    for batch_size in args.batch_sizes:
+        torch_ms = measure_latency(torch_model, batch_size, args.repeats)
+        numpy_ms = measure_latency(numpy_model, batch_size, args.repeats)
+        print(f"  {batch_size:>6} {torch_ms:>10.3f} {numpy_ms:>10.3f}")
+
+if __name__ == '__main__':
+    main()
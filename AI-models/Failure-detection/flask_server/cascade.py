@@ -0,0 +1,234 @@
+"""
+Two-stage cascade: a tiny screening model in front of the full VAE classifier.
+
+Stage 1 is a logistic regression on the scaled features and their pairwise
+products (44 inputs, one dot product per sample). It is distilled from the
+full model: it learns to predict "the VAEClassifier would flag a failure".
+Samples that score below a threshold are answered as `No Failure` right away.
+Only the rest go through the encoder, classifier head and decoder.
+
+The threshold is calibrated offline on held-out rows so that at least
+`target_recall` of the samples the full model flags still reach it. The
+calibration also reports what fraction of traffic gets short-circuited.
+
+Usage:
+    python cascade.py                          # writes ../Models/cascade.json
+    python cascade.py --target-recall 0.995 --target labels
+"""
+import os
+import json
+import argparse
+import threading
+import numpy as np
+import pandas as pd
+
+from base_model import BaseMaintenanceModel
+
+CASCADE_VERSION = 1
+NORMAL_CLASS = 'No Failure'
+
+def quadratic_features(x):
+    """Scaled features plus all pairwise products (including squares)"""
+    rows, cols = np.triu_indices(x.shape[1])
+    return np.concatenate([x, x[:, rows] * x[:, cols]], axis=1)
+
+def sigmoid(z):
+    return 1.0 / (1.0 + np.exp(-np.clip(z, -50, 50)))
+
+def fit_logistic(features, target, l2=1e-3, iterations=25):
+    """L2-regularised logistic regression by Newton's method; returns (weights, bias)"""
+    X = np.concatenate([features, np.ones((len(features), 1))], axis=1)
+    w = np.zeros(X.shape[1])
+    penalty = l2 * len(X) * np.eye(X.shape[1])
+    penalty[-1, -1] = 0  # no penalty on the bias
+    for _ in range(iterations):
+        p = sigmoid(X @ w)
+        gradient = X.T @ (p - target) + penalty @ w
+        hessian = (X * (p * (1 - p))[:, None]).T @ X + penalty
+        step = np.linalg.solve(hessian, gradient)
+        w -= step
+        if np.abs(step).max() < 1e-8:
+            break
+    return w[:-1], w[-1]
+
+def calibrate_threshold(scores, target, target_recall):
+    """Largest logit threshold that keeps `target_recall` (in (0, 1]) of the positives at or above it"""
+    if not 0 < target_recall <= 1:
+        raise ValueError(f"target_recall must be in (0, 1], got {target_recall}")
+    positives = np.sort(scores[target.astype(bool)])
+    if len(positives) == 0:
+        raise ValueError("No positive samples to calibrate the threshold on")
+    # At most floor((1 - recall) * P) positives may fall below the threshold
+    allowed_misses = int(np.floor((1 - target_recall) * len(positives) + 1e-9))
+    # The rounding slack can reach len(positives) for a recall just above 0
+    allowed_misses = min(allowed_misses, len(positives) - 1)
+    return float(positives[allowed_misses])
+
+class CascadeModel(BaseMaintenanceModel):
+    """Wraps any backend model; screens samples before calling its predict_arrays.
+
+    Screened samples get `No Failure` with the stage-1 probability, the rest
+    of the probability mass spread evenly over the failure classes, no
+    reconstruction error, and `cascade_stage: "screen"` in their result.
+    """
+    def __init__(self, model, params):
+        self.model = model
+        self.params = params
+        classes = model.classes.tolist()
+        if params['classes'] != classes:
+            raise ValueError("Cascade was calibrated for different classes; re-run cascade.py")
+        self.normal_class_idx = classes.index(params['normal_class'])
+        self.mean = np.asarray(params['mean'], dtype=np.float64)
+        self.inv_scale = 1.0 / np.asarray(params['scale'], dtype=np.float64)
+        self.weights = np.asarray(params['weights'], dtype=np.float64)
+        self.bias = float(params['bias'])
+        self.threshold = float(params['threshold'])
+
+        self.lock = threading.Lock()
+        self.samples_seen = 0
+        self.samples_screened = 0
+
+    @classmethod
+    def load(cls, model, path):
+        with open(path) as f:
+            params = json.load(f)
+        if params.get('version') != CASCADE_VERSION:
+            raise ValueError(f"Unsupported cascade version {params.get('version')} in {path}")
+        return cls(model, params)
+
+    def __getattr__(self, name):
+        # device, classes, input_dim, embed, ... come from the wrapped model
+        if name == 'model':
+            raise AttributeError(name)
+        return getattr(self.model, name)
+
+    def scores(self, data):
+        """Stage-1 logit that the full model would flag a failure"""
+        x = (np.asarray(data, dtype=np.float64) - self.mean) * self.inv_scale
+        return quadratic_features(x) @ self.weights + self.bias
+
+    def predict_arrays(self, data):
+        """Like the wrapped predict_arrays; screened rows have NaN reconstruction error"""
+        data = np.asarray(data, dtype=np.float64)
+        logits = self.scores(data)
+        suspicious = logits >= self.threshold
+
+        n, num_classes = len(data), len(self.classes)
+        p_normal = 1.0 - sigmoid(logits[~suspicious])
+        probabilities = np.empty((n, num_classes), dtype=np.float32)
+        probabilities[~suspicious] = ((1.0 - p_normal) / max(1, num_classes - 1))[:, None]
+        probabilities[~suspicious, self.normal_class_idx] = p_normal
+        predicted_class_idx = np.full(n, self.normal_class_idx, dtype=np.int64)
+        reconstruction_error = np.full(n, np.nan, dtype=np.float32)
+
+        if suspicious.any():
+            probs, idx, err = self.model.predict_arrays(data[suspicious])
+            probabilities[suspicious] = probs
+            predicted_class_idx[suspicious] = idx
+            reconstruction_error[suspicious] = err
+
+        with self.lock:
+            self.samples_seen += n
+            self.samples_screened += n - int(suspicious.sum())
+        return probabilities, predicted_class_idx, reconstruction_error
+
+    def format_results(self, probabilities, predicted_class_idx, reconstruction_error):
+        screened = np.isnan(reconstruction_error)
+        results = super(CascadeModel, self).format_results(
+            probabilities, predicted_class_idx, np.where(screened, 0.0, reconstruction_error))
+        for result, is_screened in zip(results, screened.tolist()):
+            result['cascade_stage'] = 'screen' if is_screened else 'full'
+            if is_screened:
+                result['reconstruction_error'] = None
+        return results
+
+    def stats(self):
+        """Calibration results plus the live short-circuit fraction"""
+        with self.lock:
+            seen, screened = self.samples_seen, self.samples_screened
+        return {
+            'threshold': self.threshold,
+            'target_recall': self.params['target_recall'],
+            'calibrated_short_circuit_fraction': self.params['calibration']['short_circuit_fraction'],
+            'samples_seen': seen,
+            'samples_screened': screened,
+            'short_circuit_fraction': screened / seen if seen else None
+        }
+
+def calibrate(csv_path, models_dir, output_path, target_recall=0.99, target='model',
+              calibration_fraction=0.3, seed=0):
+    """Fit stage 1, calibrate its threshold on held-out rows and save cascade.json"""
+    from numpy_backend import NumpyPredictiveMaintenanceModel
+    from latent_index import csv_features, LABEL_COLUMN
+
+    model = NumpyPredictiveMaintenanceModel(models_dir=models_dir)
+    classes = model.classes.tolist()
+    normal_class_idx = classes.index(NORMAL_CLASS)
+
+    df = pd.read_csv(csv_path, encoding='utf-8-sig')
+    features = csv_features(df).astype(np.float64)
+    _, predicted_class_idx, _ = model.predict_arrays(features)
+    flagged_by_model = predicted_class_idx != normal_class_idx
+    failure_label = (df[LABEL_COLUMN] != NORMAL_CLASS).to_numpy()
+    positives = flagged_by_model if target == 'model' else failure_label
+
+    rng = np.random.default_rng(seed)
+    held_out = rng.random(len(df)) < calibration_fraction
+
+    mean, scale = model.scaler.mean_, model.scaler.scale_
+    x = quadratic_features((features - mean) / scale)
+    weights, bias = fit_logistic(x[~held_out], positives[~held_out].astype(np.float64))
+    logits = x @ weights + bias
+    threshold = calibrate_threshold(logits[held_out], positives[held_out], target_recall)
+
+    # Report on the held-out rows only
+    suspicious = logits[held_out] >= threshold
+    cascade_idx = np.where(suspicious, predicted_class_idx[held_out], normal_class_idx)
+    def recall(positive, kept):
+        return float(kept[positive].mean()) if positive.any() else None
+    calibration = {
+        'rows': int(held_out.sum()),
+        'short_circuit_fraction': float(1 - suspicious.mean()),
+        'screen_recall_of_model_flags': recall(flagged_by_model[held_out], suspicious),
+        'screen_recall_of_labelled_failures': recall(failure_label[held_out], suspicious),
+        'full_model_recall_of_labelled_failures': recall(failure_label[held_out], flagged_by_model[held_out]),
+        'cascade_recall_of_labelled_failures': recall(failure_label[held_out], cascade_idx != normal_class_idx),
+        'agreement_with_full_model': float((cascade_idx == predicted_class_idx[held_out]).mean()),
+    }
+
+    params = {
+        'version': CASCADE_VERSION,
+        'classes': classes,
+        'normal_class': NORMAL_CLASS,
+        'mean': mean.tolist(),
+        'scale': scale.tolist(),
+        'weights': weights.tolist(),
+        'bias': float(bias),
+        'threshold': threshold,
+        'target': target,
+        'target_recall': target_recall,
+        'calibration': calibration,
+    }
+    with open(output_path, 'w') as f:
+        json.dump(params, f, indent=2)
+
+    print(f"Saved {output_path}")
+    print(f"  threshold (logit): {threshold:.4f}")
+    for key, value in calibration.items():
+        print(f"  {key}: {value}")
+    return params
+
+if __name__ == '__main__':
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    parser = argparse.ArgumentParser(description='Calibrate the stage-1 screen of the cascade')
+    parser.add_argument('--csv', default=os.path.join(base_dir, 'Dataset', 'predictive_maintenance.csv'))
+    parser.add_argument('--models-dir', default=os.path.join(base_dir, 'Models'))
+    parser.add_argument('--output', default=os.path.join(base_dir, 'Models', 'cascade.json'))
+    parser.add_argument('--target-recall', type=float, default=0.99)
+    parser.add_argument('--target', choices=['model', 'labels'], default='model',
+                        help="Positives to keep: samples the full model flags, or labelled failures")
+    parser.add_argument('--calibration-fraction', type=float, default=0.3)
+    args = parser.parse_args()
+    if not 0 < args.target_recall <= 1:
+        parser.error('--target-recall must be in (0, 1]')
+    calibrate(args.csv, args.models_dir, args.output, args.target_recall, args.target, args.calibration_fraction)
@@ -0,0 +1,114 @@
+"""
+Export the failure-detection model as a single TorchScript artifact.
+
+The StandardScaler's mean and scale are folded into the first nn.Linear of the
+VAE encoder, and the encoder, classifier head, softmax and deterministic
+reconstruction are scripted into one graph that takes raw (unscaled) features.
+Class names and feature names are stored in the file as metadata, so serving
+loads one file and never touches pickle or sklearn. The metadata also records
+the fingerprint of the .pth/.pkl files it was exported from, so the server can
+tell when a retrain has made the artifact stale.
+
+Usage:
+    python export_model.py                      # writes ../Models/predictor.pt
+    python export_model.py --output predictor.pt --models-dir ../Models
+"""
+import os
+import json
+import argparse
+import copy
+import numpy as np
+import torch
+import torch.nn as nn
+
+from base_model import FEATURE_NAMES
+from latent_index import weights_sha1
+from torch_backend import PredictiveMaintenanceModel
+
+# Name of the metadata entry stored inside the TorchScript file
+METADATA_FILE = 'metadata.json'
+ARTIFACT_VERSION = 1
+
+
+def fold_scaler_into_linear(linear, mean, scale):
+    """Return a copy of `linear` that applies StandardScaler first.
+
+    W((x - mean) / scale) + b == (W / scale) x + (b - W (mean / scale))
+    """
+    folded = copy.deepcopy(linear)
+    with torch.no_grad():
+        weight = linear.weight.double()
+        mean = torch.as_tensor(mean, dtype=torch.float64)
+        scale = torch.as_tensor(scale, dtype=torch.float64)
+        folded.weight.copy_((weight / scale).float())
+        folded.bias.copy_((linear.bias.double() - weight @ (mean / scale)).float())
+    return folded
+
+
+class FoldedPredictor(nn.Module):
+    """Raw features in; class probabilities, class index and reconstruction error out."""
+    def __init__(self, vae, classifier_head, mean, scale):
+        super(FoldedPredictor, self).__init__()
+        encoder_layers = list(copy.deepcopy(vae.encoder))
+        encoder_layers[0] = fold_scaler_into_linear(vae.encoder[0], mean, scale)
+        self.encoder = nn.Sequential(*encoder_layers)
+        self.fc_mu = copy.deepcopy(vae.fc_mu)
+        self.decoder = copy.deepcopy(vae.decoder)
+        self.classifier = copy.deepcopy(classifier_head)
+
+        # The reconstruction error is measured in scaled space, as during training
+        self.register_buffer('mean', torch.as_tensor(mean, dtype=torch.float32))
+        self.register_buffer('inv_scale', 1.0 / torch.as_tensor(scale, dtype=torch.float32))
+
+    def forward(self, x):
+        mu = self.fc_mu(self.encoder(x))
+        logits = self.classifier(mu)
+        probabilities = torch.softmax(logits, dim=1)
+        predicted_class_idx = torch.argmax(logits, dim=1)
+        x_scaled = (x - self.mean) * self.inv_scale
+        reconstruction_error = (self.decoder(mu) - x_scaled).pow(2).mean(dim=1)
+        return probabilities, predicted_class_idx, reconstruction_error
+
+
+def export(models_dir, output_path):
+    """Build, verify and save the folded TorchScript predictor."""
+    pm_model = PredictiveMaintenanceModel(models_dir=models_dir)
+    predictor = FoldedPredictor(pm_model.vae.cpu(), pm_model.classifier.classifier.cpu(),
+                                pm_model.scaler.mean_, pm_model.scaler.scale_).eval()
+    scripted = torch.jit.script(predictor)
+
+    # The folded graph must agree with the unfolded serving path
+    pm_model.device = torch.device('cpu')
+    sample = (pm_model.scaler.mean_ + pm_model.scaler.scale_ * np.random.randn(256, len(FEATURE_NAMES)))
+    expected_probs, expected_idx, expected_error = pm_model.predict_arrays(sample)
+    with torch.no_grad():
+        probs, idx, error = scripted(torch.as_tensor(sample, dtype=torch.float32))
+    max_prob_diff = np.abs(probs.numpy() - expected_probs).max()
+    max_error_diff = np.abs(error.numpy() - expected_error).max()
+    if max_prob_diff > 1e-4 or max_error_diff > 1e-3:
+        raise RuntimeError(f'Folded model disagrees with the serving path '
+                           f'(probabilities: {max_prob_diff:.2e}, reconstruction error: {max_error_diff:.2e})')
+
+    metadata = {
+        'version': ARTIFACT_VERSION,
+        'classes': pm_model.classes.tolist(),
+        'feature_names': FEATURE_NAMES,
+        'input_dim': pm_model.input_dim,
+        'hidden_dim': pm_model.hidden_dim,
+        'latent_dim': pm_model.latent_dim,
+        'num_classes': pm_model.num_classes,
+        'weights_sha1': weights_sha1(models_dir),
+    }
+    torch.jit.save(scripted, output_path, _extra_files={METADATA_FILE: json.dumps(metadata)})
+    print(f"Exported {output_path} (max prob diff {max_prob_diff:.2e}, "
+          f"max reconstruction error diff {max_error_diff:.2e}, argmax agreement "
+          f"{(idx.numpy() == expected_idx).mean() * 100:.1f}%)")
+
+
+if __name__ == '__main__':
+    default_models_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Models')
+    parser = argparse.ArgumentParser(description='Export a single TorchScript predictor with the scaler folded in')
+    parser.add_argument('--models-dir', default=default_models_dir)
+    parser.add_argument('--output', default=os.path.join(default_models_dir, 'predictor.pt'))
+    args = parser.parse_args()
+    export(args.models_dir, args.output)
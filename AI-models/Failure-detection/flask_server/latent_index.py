@@ -0,0 +1,419 @@
+"""
+Nearest-neighbour index over the VAE latent space of the labelled dataset.
+
+Every row of predictive_maintenance.csv is embedded once (the VAE latent mean
+`mu`) and stored in flat binary files that the service memory-maps:
+
+    meta.json       row count, dimensions, class names, source file state
+    embeddings.f32  (N, latent_dim) float32 latent means
+    sqnorms.f32     (N,) squared L2 norms of the embeddings
+    features.f32    (N, 8) raw input features, in FEATURE_NAMES order
+    labels.i16      (N,) Failure Type as an index into `classes`
+    row_ids.i64     (N,) UDI of each row
+    centroids.npy   (nlist, latent_dim) k-means centroids (approximate mode)
+    lists.i32       (N,) centroid each embedding is assigned to
+
+Searches run in one of two modes:
+- exact: brute-force squared L2 distance to every row, in blocks
+- approx: only rows in the `nprobe` partitions whose centroids are nearest
+  the query are scanned (an inverted-file index)
+
+Appending rows to the CSV and re-running the build embeds only the new rows.
+The index is rebuilt from scratch when earlier rows change or the model weights
+change.
+
+Usage:
+    python latent_index.py                              # build or update ../Models/latent_index
+    python latent_index.py --csv ../Dataset/predictive_maintenance.csv --rebuild
+"""
+import os
+import io
+import json
+import time
+import hashlib
+import argparse
+import numpy as np
+import pandas as pd
+
+from base_model import FEATURE_NAMES
+
+INDEX_VERSION = 1
+
+# Raw dataset columns feeding FEATURE_NAMES (the type_* columns come from Type)
+CSV_FEATURE_COLUMNS = ['Air temperature [K]', 'Process temperature [K]',
+                       'Rotational speed [rpm]', 'Torque [Nm]', 'Tool wear [min]']
+LABEL_COLUMN = 'Failure Type'
+
+# name -> (dtype, columns per row; None means latent_dim)
+ARRAY_FILES = {
+    'embeddings': ('embeddings.f32', np.float32, None),
+    'sqnorms': ('sqnorms.f32', np.float32, 1),
+    'features': ('features.f32', np.float32, len(FEATURE_NAMES)),
+    'labels': ('labels.i16', np.int16, 1),
+    'row_ids': ('row_ids.i64', np.int64, 1),
+    'lists': ('lists.i32', np.int32, 1),
+}
+
+def file_sha1(path, length=None, chunk_size=1 << 20):
+    """SHA-1 of the first `length` bytes of a file (the whole file if None)"""
+    digest = hashlib.sha1()
+    remaining = os.path.getsize(path) if length is None else length
+    with open(path, 'rb') as f:
+        while remaining > 0:
+            chunk = f.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            digest.update(chunk)
+            remaining -= len(chunk)
+    return digest.hexdigest()
+
+def weights_sha1(models_dir):
+    """Fingerprint of the checkpoints the embeddings come from"""
+    digest = hashlib.sha1()
+    for name in ('scaler.pkl', 'vae_model.pth', 'classifier_model.pth'):
+        digest.update(file_sha1(os.path.join(models_dir, name)).encode())
+    return digest.hexdigest()
+
+def csv_features(df):
+    """(N, 8) raw features in FEATURE_NAMES order from predictive_maintenance.csv rows"""
+    features = np.empty((len(df), len(FEATURE_NAMES)), dtype=np.float32)
+    for i, column in enumerate(CSV_FEATURE_COLUMNS):
+        features[:, i] = df[column].to_numpy(dtype=np.float32)
+    for i, machine_type in enumerate(['H', 'L', 'M']):
+        features[:, len(CSV_FEATURE_COLUMNS) + i] = (df['Type'] == machine_type).to_numpy()
+    return features
+
+def kmeans(data, nlist, iterations=20, sample_size=100000, seed=0):
+    """Lloyd's k-means on (a sample of) `data`; returns (nlist, dim) centroids"""
+    rng = np.random.default_rng(seed)
+    if len(data) > sample_size:
+        data = data[np.sort(rng.choice(len(data), sample_size, replace=False))]
+    data = np.asarray(data, dtype=np.float32)
+    centroids = data[rng.choice(len(data), nlist, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = nearest_centroids(data, centroids, 1)[:, 0]
+        counts = np.bincount(assignment, minlength=nlist)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, data)
+        # Empty partitions keep their previous centroid
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, None]
+    return centroids
+
+def nearest_centroids(data, centroids, n):
+    """Indices of the `n` nearest centroids of each row of `data`"""
+    distances = (np.square(centroids).sum(axis=1)[None, :] - 2 * (data @ centroids.T))
+    if n >= len(centroids):
+        return np.argsort(distances, axis=1)
+    nearest = np.argpartition(distances, n - 1, axis=1)[:, :n]
+    order = np.take_along_axis(distances, nearest, axis=1).argsort(axis=1)
+    return np.take_along_axis(nearest, order, axis=1)
+
+class LatentIndex:
+    """Memory-mapped k-NN index over latent embeddings (see module docstring)"""
+    def __init__(self, index_dir):
+        self.index_dir = index_dir
+        meta_path = os.path.join(index_dir, 'meta.json')
+        with open(meta_path) as f:
+            self.meta = json.load(f)
+        if self.meta['version'] != INDEX_VERSION:
+            raise ValueError(f"Unsupported latent index version {self.meta['version']} in {meta_path}")
+        self.meta_mtime = os.path.getmtime(meta_path)
+        self.count = self.meta['count']
+        self.latent_dim = self.meta['latent_dim']
+        self.classes = np.array(self.meta['classes'])
+
+        # Only the first `count` rows are valid; anything after is an interrupted append
+        for name, (filename, dtype, width) in ARRAY_FILES.items():
+            width = self.latent_dim if width is None else width
+            shape = (self.count, width) if width > 1 else (self.count,)
+            path = os.path.join(index_dir, filename)
+            array = np.memmap(path, dtype=dtype, mode='r', shape=shape) if self.count else np.empty(shape, dtype)
+            setattr(self, name, array)
+
+        # Inverted lists: rows grouped by partition, list p is order[offsets[p]:offsets[p + 1]]
+        centroids_path = os.path.join(index_dir, 'centroids.npy')
+        self.centroids = np.load(centroids_path) if os.path.exists(centroids_path) else None
+        if self.centroids is not None:
+            lists = np.asarray(self.lists)
+            self.order = np.argsort(lists, kind='stable')
+            self.offsets = np.concatenate([[0], np.cumsum(np.bincount(lists, minlength=len(self.centroids)))])
+
+    def is_stale(self):
+        """True when the index on disk was updated after this instance loaded it"""
+        try:
+            return os.path.getmtime(os.path.join(self.index_dir, 'meta.json')) != self.meta_mtime
+        except OSError:
+            return False
+
+    def _top_k(self, query, rows, k, block_size=65536):
+        """(rows, squared distances) of the k nearest of `rows` (None = all) to one query"""
+        query_sqnorm = float(query @ query)
+        best_rows = np.empty(0, dtype=np.int64)
+        best_distances = np.empty(0, dtype=np.float32)
+        total = self.count if rows is None else len(rows)
+        for start in range(0, total, block_size):
+            if rows is None:
+                block = np.arange(start, min(start + block_size, total))
+                embeddings = self.embeddings[start:start + block_size]
+                sqnorms = self.sqnorms[start:start + block_size]
+            else:
+                block = rows[start:start + block_size]
+                embeddings = self.embeddings[block]
+                sqnorms = self.sqnorms[block]
+            distances = sqnorms - 2 * (embeddings @ query) + query_sqnorm
+            best_rows = np.concatenate([best_rows, block])
+            best_distances = np.concatenate([best_distances, distances])
+            if len(best_rows) > k:
+                keep = np.argpartition(best_distances, k - 1)[:k]
+                best_rows, best_distances = best_rows[keep], best_distances[keep]
+        order = np.argsort(best_distances, kind='stable')
+        return best_rows[order], np.maximum(best_distances[order], 0)
+
+    def search(self, queries, k=5, mode='exact', nprobe=8):
+        """k nearest indexed rows of each query embedding.
+
+        Returns a list (one per query) of (rows, squared distances) arrays.
+        """
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        if mode not in ('exact', 'approx'):
+            raise ValueError(f"Unknown search mode '{mode}' (expected 'exact' or 'approx')")
+        if mode == 'approx' and self.centroids is None:
+            raise ValueError("This index was built without partitions; use mode='exact'")
+        k = min(k, self.count)
+        if k == 0:
+            return [(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)) for _ in queries]
+
+        if mode == 'exact':
+            return [self._top_k(query, None, k) for query in queries]
+        probes = nearest_centroids(queries, self.centroids, min(nprobe, len(self.centroids)))
+        results = []
+        for query, lists in zip(queries, probes):
+            rows = np.concatenate([self.order[self.offsets[p]:self.offsets[p + 1]] for p in lists])
+            results.append(self._top_k(query, np.sort(rows), k))
+        return results
+
+    def neighbours(self, queries, k=5, mode='exact', nprobe=8):
+        """search() results as JSON-ready dicts with the historical samples"""
+        response = []
+        for rows, distances in self.search(queries, k, mode, nprobe):
+            response.append([
+                {
+                    'rank': rank + 1,
+                    'row_id': int(self.row_ids[row]),
+                    'failure_type': str(self.classes[self.labels[row]]),
+                    'distance': float(np.sqrt(distance)),
+                    'features': dict(zip(FEATURE_NAMES, self.features[row].tolist()))
+                }
+                for rank, (row, distance) in enumerate(zip(rows.tolist(), distances.tolist()))
+            ])
+        return response
+
+def _write_meta(index_dir, meta):
+    tmp_path = os.path.join(index_dir, 'meta.json.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(meta, f, indent=2)
+    os.replace(tmp_path, os.path.join(index_dir, 'meta.json'))
+
+def _read_new_rows(csv_path, offset):
+    """Rows that start at byte `offset`, up to the end of the file.
+
+    Returns (DataFrame, end offset, start of the last row if it has no line
+    break yet, else None). End of file ends the last line, so a CSV without
+    a trailing newline is read in full; the caller re-checks that row at the
+    next build in case a writer was still appending to it. The header is
+    always read from the top of the file.
+    """
+    with open(csv_path, 'rb') as f:
+        header = f.readline()
+        if offset == 0:
+            offset = len(header)
+        f.seek(offset)
+        data = f.read()
+    end = data.rfind(b'\n') + 1
+    unterminated_start = None
+    if data[end:].strip():
+        unterminated_start = offset + end
+        end = len(data)
+    if end == 0:
+        return None, offset, None
+    df = pd.read_csv(io.BytesIO(header + data[:end]), encoding='utf-8-sig')
+    return df, offset + end, unterminated_start
+
+def _continued_last_row(csv_path, meta):
+    """True when the last indexed row had no line break and the file now continues it"""
+    if meta.get('source_unterminated_start') is None:
+        return False
+    with open(csv_path, 'rb') as f:
+        f.seek(meta['source_bytes'])
+        next_byte = f.read(1)
+    return next_byte not in (b'', b'\n', b'\r')
+
+def csv_row_count(csv_path):
+    """Number of data rows in the CSV (what a complete index holds)"""
+    return len(pd.read_csv(csv_path, encoding='utf-8-sig', usecols=[0]))
+
+def build_index(csv_path, index_dir, model, models_dir, nlist=None, rebuild=False, chunk_size=65536):
+    """Build the index, or extend it with rows appended to the CSV since the last build.
+
+    Args:
+        csv_path: labelled dataset (predictive_maintenance.csv layout)
+        index_dir: output directory
+        model: backend model with embed() and classes (e.g. NumpyPredictiveMaintenanceModel)
+        models_dir: directory of the checkpoints the model was loaded from
+        nlist: partitions for approximate search (default ~sqrt(N), 0 disables)
+        rebuild: ignore any existing index
+
+    Returns the number of rows embedded by this call.
+    """
+    os.makedirs(index_dir, exist_ok=True)
+    meta_path = os.path.join(index_dir, 'meta.json')
+    classes = model.classes.tolist()
+    weights = weights_sha1(models_dir)
+
+    meta = None
+    if not rebuild and os.path.exists(meta_path):
+        with open(meta_path) as f:
+            meta = json.load(f)
+        unchanged = (
+            meta.get('version') == INDEX_VERSION
+            and meta['classes'] == classes
+            and meta['weights_sha1'] == weights
+            and meta['source_bytes'] <= os.path.getsize(csv_path)
+            and file_sha1(csv_path, meta['source_bytes']) == meta['source_sha1']
+        )
+        if not unchanged:
+            print("Dataset prefix or model weights changed; rebuilding the index")
+            meta = None
+
+    if meta is None:
+        meta = {
+            'version': INDEX_VERSION,
+            'count': 0,
+            'latent_dim': model.latent_dim,
+            'classes': classes,
+            'weights_sha1': weights,
+            'source': os.path.abspath(csv_path),
+            'source_bytes': 0,
+            'source_sha1': hashlib.sha1().hexdigest(),
+            'source_unterminated_start': None,
+            'nlist': 0
+        }
+        centroids_path = os.path.join(index_dir, 'centroids.npy')
+        if os.path.exists(centroids_path):
+            os.remove(centroids_path)
+
+    elif _continued_last_row(csv_path, meta):
+        # The last row was read up to end of file while it was still being
+        # written; drop it and read it again in full
+        print("Last indexed row was incomplete; re-reading it")
+        meta['count'] -= 1
+        meta['source_bytes'] = meta['source_unterminated_start']
+        meta['source_unterminated_start'] = None
+
+    df, end_offset, unterminated_start = _read_new_rows(csv_path, meta['source_bytes'])
+    if df is None or len(df) == 0:
+        print(f"Index is up to date ({meta['count']} rows)")
+        return 0
+
+    unknown = sorted(set(df[LABEL_COLUMN]) - set(classes))
+    if unknown:
+        raise ValueError(f"Unknown {LABEL_COLUMN} values (not in label_encoder.pkl): {unknown}")
+    class_index = {name: i for i, name in enumerate(classes)}
+
+    features = csv_features(df)
+    embeddings = np.concatenate([
+        np.asarray(model.embed(features[start:start + chunk_size]), dtype=np.float32)
+        for start in range(0, len(features), chunk_size)
+    ])
+    new_arrays = {
+        'embeddings': embeddings,
+        'sqnorms': np.square(embeddings).sum(axis=1),
+        'features': features,
+        'labels': df[LABEL_COLUMN].map(class_index).to_numpy(dtype=np.int16),
+        'row_ids': (df['UDI'].to_numpy(dtype=np.int64) if 'UDI' in df.columns
+                    else meta['count'] + np.arange(len(df), dtype=np.int64)),
+    }
+
+    count = meta['count']
+    new_count = count + len(df)
+    centroids_path = os.path.join(index_dir, 'centroids.npy')
+    if count == 0:
+        # Full build: train the partitions on all embeddings
+        if nlist is None:
+            nlist = int(np.sqrt(new_count))
+        nlist = min(nlist, new_count)
+        if nlist > 1:
+            centroids = kmeans(embeddings, nlist)
+            np.save(centroids_path, centroids)
+            meta['nlist'] = nlist
+        else:
+            centroids = None
+            meta['nlist'] = 0
+    else:
+        centroids = np.load(centroids_path) if meta['nlist'] else None
+    # Appended rows join the nearest existing partition; rebuild to retrain them
+    new_arrays['lists'] = (nearest_centroids(embeddings, centroids, 1)[:, 0].astype(np.int32)
+                           if centroids is not None else np.zeros(len(df), dtype=np.int32))
+
+    for name, (filename, dtype, width) in ARRAY_FILES.items():
+        width = meta['latent_dim'] if width is None else width
+        path = os.path.join(index_dir, filename)
+        with open(path, 'ab' if count else 'wb') as f:
+            # Drop whatever an interrupted append left after the last committed row
+            f.truncate(count * width * np.dtype(dtype).itemsize)
+            f.write(np.ascontiguousarray(new_arrays[name], dtype=dtype).tobytes())
+
+    # meta.json is written last, so a crash before this point leaves the old index valid
+    meta['count'] = new_count
+    meta['source_bytes'] = end_offset
+    meta['source_sha1'] = file_sha1(csv_path, end_offset)
+    meta['source_unterminated_start'] = unterminated_start
+    _write_meta(index_dir, meta)
+    print(f"Indexed {len(df)} new rows ({new_count} total, {meta['nlist']} partitions)")
+    return len(df)
+
+def main():
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    parser = argparse.ArgumentParser(description='Build or update the latent nearest-neighbour index')
+    parser.add_argument('--csv', default=os.path.join(base_dir, 'Dataset', 'predictive_maintenance.csv'))
+    parser.add_argument('--models-dir', default=os.path.join(base_dir, 'Models'))
+    parser.add_argument('--index-dir', default=os.path.join(base_dir, 'Models', 'latent_index'))
+    parser.add_argument('--nlist', type=int, default=None, help='k-means partitions (default: sqrt(N), 0 disables)')
+    parser.add_argument('--rebuild', action='store_true', help='Ignore the existing index and rebuild it')
+    parser.add_argument('--benchmark', type=int, default=200, help='Queries timed after the build (0 to skip)')
+    parser.add_argument('--skip-verify', action='store_true',
+                        help="Don't check the index row count against the CSV after the build")
+    args = parser.parse_args()
+
+    from numpy_backend import NumpyPredictiveMaintenanceModel
+    model = NumpyPredictiveMaintenanceModel(models_dir=args.models_dir)
+    build_index(args.csv, args.index_dir, model, args.models_dir, nlist=args.nlist, rebuild=args.rebuild)
+
+    if not args.skip_verify:
+        with open(os.path.join(args.index_dir, 'meta.json')) as f:
+            indexed = json.load(f)['count']
+        expected = csv_row_count(args.csv)
+        if indexed != expected:
+            raise SystemExit(f"Index holds {indexed} rows but {args.csv} has {expected}; rebuild with --rebuild")
+        print(f"Verified: index and CSV both hold {indexed} rows")
+
+    if args.benchmark:
+        index = LatentIndex(args.index_dir)
+        sample = np.asarray(index.embeddings[np.random.default_rng(0).choice(index.count, args.benchmark)])
+        modes = ['exact', 'approx'] if index.centroids is not None else ['exact']
+        exact = None
+        for mode in modes:
+            start = time.perf_counter()
+            results = index.search(sample, k=10, mode=mode)
+            elapsed_ms = (time.perf_counter() - start) * 1000 / len(sample)
+            if mode == 'exact':
+                exact = results
+                print(f"  {mode:<6} {elapsed_ms:.3f} ms/query")
+            else:
+                recall = np.mean([len(np.intersect1d(a[0], e[0])) / max(1, len(e[0]))
+                                  for a, e in zip(results, exact)])
+                print(f"  {mode:<6} {elapsed_ms:.3f} ms/query, recall@10 vs exact {recall * 100:.1f}%")
+
+if __name__ == '__main__':
+    main()
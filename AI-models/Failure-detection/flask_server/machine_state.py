@@ -0,0 +1,199 @@
+"""
+Per-machine rolling anomaly state for the failure-detection service.
+
+Every machine gets one slot in a set of preallocated arrays:
+- EWMA and exponentially weighted variance of the reconstruction error
+- exponentially weighted share of each predicted class
+- a fixed-size ring buffer of the latest reconstruction errors and classes
+
+An update touches one slot only, so it costs O(1) (O(num_classes + 1) work)
+no matter how many machines are tracked. When all slots are taken, the least
+recently updated machine is evicted. The whole store can be saved to and
+restored from a single .npz file.
+"""
+import os
+import threading
+from collections import OrderedDict
+import numpy as np
+
+def _json_float(value):
+    """float(value), or None for NaN (no error seen yet), which JSON cannot encode"""
+    value = float(value)
+    return None if np.isnan(value) else value
+
+class MachineStateStore:
+    """Fixed-capacity, LRU-evicted rolling statistics keyed by machine ID.
+
+    Args:
+        num_classes: number of classifier outputs
+        capacity: maximum number of machines kept in memory
+        window: length of the per-machine ring buffer
+        alpha: EWMA smoothing factor (higher reacts faster)
+        drift_z: |z-score| of a new reconstruction error, against the
+            machine's own EWMA and variance, that raises the drift flag
+        alert_share: share of recent predictions that are failure classes
+            which raises the alert flag
+        warmup: updates before drift is evaluated for a machine
+        normal_class_idx: index of the "no failure" class (None if unknown)
+    """
+    def __init__(self, num_classes, capacity=10000, window=64, alpha=0.1, drift_z=3.0,
+                 alert_share=0.5, warmup=10, normal_class_idx=None):
+        if capacity < 1 or window < 1:
+            raise ValueError("capacity and window must be at least 1")
+        if not 0 < alpha <= 1:
+            raise ValueError("alpha must be in (0, 1]")
+        self.num_classes = num_classes
+        self.capacity = capacity
+        self.window = window
+        self.alpha = alpha
+        self.drift_z = drift_z
+        self.alert_share = alert_share
+        self.warmup = warmup
+        self.normal_class_idx = normal_class_idx
+
+        self.ewma = np.zeros(capacity, dtype=np.float64)
+        self.ewvar = np.zeros(capacity, dtype=np.float64)
+        self.count = np.zeros(capacity, dtype=np.int64)
+        self.class_share = np.zeros((capacity, num_classes), dtype=np.float32)
+        self.ring_error = np.zeros((capacity, window), dtype=np.float32)
+        self.ring_class = np.zeros((capacity, window), dtype=np.int16)
+
+        # machine_id -> slot, least recently used first
+        self.slots = OrderedDict()
+        self.free_slots = list(range(capacity - 1, -1, -1))
+        self.lock = threading.Lock()
+
+    @property
+    def nbytes(self):
+        """Memory held by the state arrays"""
+        return sum(a.nbytes for a in (self.ewma, self.ewvar, self.count, self.class_share,
+                                      self.ring_error, self.ring_class))
+
+    def _slot_for(self, machine_id):
+        """Slot of machine_id, marked most recently used; allocates (and evicts) if new"""
+        slot = self.slots.get(machine_id)
+        if slot is not None:
+            self.slots.move_to_end(machine_id)
+            return slot
+        if self.free_slots:
+            slot = self.free_slots.pop()
+        else:
+            _, slot = self.slots.popitem(last=False)
+        self.ewma[slot] = np.nan
+        self.ewvar[slot] = 0.0
+        self.count[slot] = 0
+        self.class_share[slot] = 0.0
+        self.slots[machine_id] = slot
+        return slot
+
+    def update(self, machine_id, reconstruction_error, predicted_class_idx):
+        """Fold one prediction into the machine's state and return its flags.
+
+        reconstruction_error may be None (a sample the cascade screened out);
+        the error statistics are then left as they are.
+        """
+        error = np.nan if reconstruction_error is None else float(reconstruction_error)
+        with self.lock:
+            slot = self._slot_for(machine_id)
+            n = int(self.count[slot])
+
+            # Score the new error against the state *before* it is included
+            if np.isnan(error):
+                z_score = 0.0
+            elif n == 0 or np.isnan(self.ewma[slot]):
+                z_score = 0.0
+                self.ewma[slot] = error
+            else:
+                std = np.sqrt(self.ewvar[slot])
+                z_score = (error - self.ewma[slot]) / std if std > 0 else 0.0
+                # Incremental exponentially weighted mean and variance
+                diff = error - self.ewma[slot]
+                increment = self.alpha * diff
+                self.ewma[slot] += increment
+                self.ewvar[slot] = (1 - self.alpha) * (self.ewvar[slot] + diff * increment)
+
+            share = self.class_share[slot]
+            if n == 0:
+                share[predicted_class_idx] = 1.0
+            else:
+                share *= 1 - self.alpha
+                share[predicted_class_idx] += self.alpha
+
+            position = n % self.window
+            self.ring_error[slot, position] = error
+            self.ring_class[slot, position] = predicted_class_idx
+            self.count[slot] = n + 1
+
+            failure_share = 1.0 - float(share[self.normal_class_idx]) if self.normal_class_idx is not None else 0.0
+            return {
+                'machine_id': machine_id,
+                'updates': n + 1,
+                'error_ewma': _json_float(self.ewma[slot]),
+                'error_std': float(np.sqrt(self.ewvar[slot])),
+                'z_score': float(z_score),
+                'failure_share': failure_share,
+                'drift': bool(n >= self.warmup and abs(z_score) >= self.drift_z),
+                'alert': bool(failure_share >= self.alert_share)
+            }
+
+    def get(self, machine_id, classes=None):
+        """Full state of one machine (ring buffer oldest first), or None if unknown"""
+        with self.lock:
+            slot = self.slots.get(machine_id)
+            if slot is None:
+                return None
+            n = int(self.count[slot])
+            order = np.arange(max(0, n - self.window), n) % self.window
+            share = self.class_share[slot].tolist()
+            recent_classes = self.ring_class[slot, order].tolist()
+            if classes is not None:
+                share = dict(zip(classes, share))
+                recent_classes = [classes[i] for i in recent_classes]
+            return {
+                'machine_id': machine_id,
+                'updates': n,
+                'error_ewma': _json_float(self.ewma[slot]),
+                'error_std': float(np.sqrt(self.ewvar[slot])),
+                'class_share': share,
+                'recent_errors': [_json_float(e) for e in self.ring_error[slot, order].tolist()],
+                'recent_classes': recent_classes
+            }
+
+    def save(self, path):
+        """Write every tracked machine to an .npz file (atomically)"""
+        with self.lock:
+            ids = list(self.slots.keys())
+            slots = np.array(list(self.slots.values()), dtype=np.int64)
+            tmp_path = f'{path}.tmp'
+            with open(tmp_path, 'wb') as f:
+                np.savez(f,
+                         machine_ids=np.array(ids, dtype=str),
+                         window=self.window,
+                         num_classes=self.num_classes,
+                         ewma=self.ewma[slots],
+                         ewvar=self.ewvar[slots],
+                         count=self.count[slots],
+                         class_share=self.class_share[slots],
+                         ring_error=self.ring_error[slots],
+                         ring_class=self.ring_class[slots])
+            os.replace(tmp_path, path)
+        return len(ids)
+
+    def load(self, path):
+        """Restore machines from a snapshot written by save (most recent ones win if over capacity)"""
+        with np.load(path) as snapshot:
+            # NpzFile reads an array from disk on every access, so read each once
+            arrays = {name: snapshot[name] for name in snapshot.files}
+        if int(arrays['window']) != self.window or int(arrays['num_classes']) != self.num_classes:
+            raise ValueError(f"Snapshot {path} has window={int(arrays['window'])}, "
+                             f"num_classes={int(arrays['num_classes'])}; expected "
+                             f"window={self.window}, num_classes={self.num_classes}")
+        machine_ids = arrays['machine_ids'].tolist()
+        # Saved least recently used first, so keep the tail
+        keep = range(max(0, len(machine_ids) - self.capacity), len(machine_ids))
+        with self.lock:
+            for i in keep:
+                slot = self._slot_for(machine_ids[i])
+                for name in ('ewma', 'ewvar', 'count', 'class_share', 'ring_error', 'ring_class'):
+                    getattr(self, name)[slot] = arrays[name][i]
+        return len(keep)
@@ -0,0 +1,152 @@
+"""
+Pure-NumPy inference backend for the failure-detection service.
+
+The network is small (8 -> 128 -> 128 -> 64 encoder, 64 -> 64 -> 6 head and a
+64 -> 128 -> 128 -> 8 decoder with the default hyperparameters; the sizes are
+read from the checkpoints), so it is evaluated here with a handful of batched
+matrix multiplications. The .pth checkpoints are read straight from their zip
+archives, which means a serving process using this backend never imports
+torch.
+"""
+import os
+import pickle
+import zipfile
+import collections
+import numpy as np
+
+from base_model import BaseMaintenanceModel
+
+# Storage classes that can appear in a state_dict saved by torch.save
+STORAGE_DTYPES = {
+    'FloatStorage': np.float32,
+    'DoubleStorage': np.float64,
+    'HalfStorage': np.float16,
+    'LongStorage': np.int64,
+    'IntStorage': np.int32,
+    'ShortStorage': np.int16,
+    'CharStorage': np.int8,
+    'ByteStorage': np.uint8,
+    'BoolStorage': np.bool_,
+}
+
+def _rebuild_tensor(storage, storage_offset, size, stride, *args):
+    """NumPy stand-in for torch._utils._rebuild_tensor_v2"""
+    itemsize = storage.itemsize
+    return np.lib.stride_tricks.as_strided(
+        storage[storage_offset:],
+        shape=tuple(size),
+        strides=tuple(s * itemsize for s in stride)
+    ).copy()
+
+class _StateDictUnpickler(pickle.Unpickler):
+    """Unpickle a torch state_dict into NumPy arrays without importing torch"""
+    def __init__(self, file, archive, prefix):
+        super(_StateDictUnpickler, self).__init__(file)
+        self.archive = archive
+        self.prefix = prefix
+
+    def find_class(self, module, name):
+        if module == 'collections' and name == 'OrderedDict':
+            return collections.OrderedDict
+        if module == 'torch._utils' and name == '_rebuild_tensor_v2':
+            return _rebuild_tensor
+        if module == 'torch' and name in STORAGE_DTYPES:
+            return STORAGE_DTYPES[name]
+        raise pickle.UnpicklingError(f"Unsupported global in checkpoint: {module}.{name}")
+
+    def persistent_load(self, pid):
+        # ('storage', storage_type, key, location, numel)
+        _, dtype, key, _, numel = pid
+        data = self.archive.read(f'{self.prefix}/data/{key}')
+        return np.frombuffer(data, dtype=dtype, count=numel)
+
+def load_state_dict(path):
+    """Read a state_dict saved with torch.save (zip format) as NumPy arrays"""
+    with zipfile.ZipFile(path) as archive:
+        pickle_name = next(name for name in archive.namelist() if name.endswith('/data.pkl'))
+        prefix = pickle_name[:-len('/data.pkl')]
+        with archive.open(pickle_name) as f:
+            return _StateDictUnpickler(f, archive, prefix).load()
+
+class NumpyPredictiveMaintenanceModel(BaseMaintenanceModel):
+    """Same predictions as torch_backend.PredictiveMaintenanceModel, in NumPy"""
+    def __init__(self, models_dir='../Models'):
+        """Initialize the Predictive Maintenance Model"""
+        self.device = 'cpu'
+
+        # Load preprocessing artifacts
+        self.load_preprocessing_artifacts(models_dir)
+        self.mean = self.scaler.mean_.astype(np.float32)
+        self.inv_scale = (1.0 / self.scaler.scale_).astype(np.float32)
+
+        # Load weights
+        self.load_models(models_dir)
+
+    def load_models(self, models_dir):
+        """Load the VAE and classifier checkpoints as float32 arrays"""
+        vae_path = os.path.join(models_dir, 'vae_model.pth')
+        if not os.path.exists(vae_path):
+            raise FileNotFoundError(f"VAE model not found at {vae_path}")
+        classifier_path = os.path.join(models_dir, 'classifier_model.pth')
+        if not os.path.exists(classifier_path):
+            raise FileNotFoundError(f"Classifier model not found at {classifier_path}")
+
+        # The classifier checkpoint embeds the VAE it was trained on (vae.*),
+        # which is what the torch backend ends up serving as well
+        state = {f'vae.{k}': v for k, v in load_state_dict(vae_path).items()}
+        state.update(load_state_dict(classifier_path))
+
+        def linear(name):
+            # nn.Linear stores (out, in); keep (in, out) so a batch is x @ W + b
+            weight = np.ascontiguousarray(state[f'{name}.weight'].T, dtype=np.float32)
+            bias = np.asarray(state[f'{name}.bias'], dtype=np.float32)
+            return weight, bias
+
+        self.encoder = [linear('vae.encoder.0'), linear('vae.encoder.2')]
+        self.fc_mu = linear('vae.fc_mu')
+        self.decoder = [linear('vae.decoder.0'), linear('vae.decoder.2'), linear('vae.decoder.4')]
+        self.head = [linear('classifier.0'), linear('classifier.2')]
+
+        # Model hyperparameters, from the weight shapes (in, out)
+        self.input_dim, self.hidden_dim = self.encoder[0][0].shape
+        self.latent_dim = self.fc_mu[0].shape[1]
+        self.num_classes = self.head[1][0].shape[1]
+
+    @staticmethod
+    def _mlp(x, layers, relu_last=False):
+        """Linear layers with ReLU in between (and after the last one if relu_last)"""
+        for i, (weight, bias) in enumerate(layers):
+            x = x @ weight
+            x += bias
+            if relu_last or i < len(layers) - 1:
+                np.maximum(x, 0, out=x)
+        return x
+
+    def embed(self, data):
+        """Latent means `mu` (N, latent_dim) of an (N, 8) feature matrix"""
+        x = (np.asarray(data, dtype=np.float32) - self.mean) * self.inv_scale
+        return self._mlp(self._mlp(x, self.encoder, relu_last=True), [self.fc_mu])
+
+    def predict_arrays(self, data):
+        """Run the network on an (N, 8) feature matrix in one pass.
+
+        Mirrors VAEClassifier.infer: one encoder pass, mu is classified and
+        decoded directly. Returns NumPy arrays: probabilities (N, num_classes),
+        predicted class indices (N,) and reconstruction errors (N,).
+        """
+        x = (np.asarray(data, dtype=np.float32) - self.mean) * self.inv_scale
+
+        mu = self._mlp(self._mlp(x, self.encoder, relu_last=True), [self.fc_mu])
+
+        logits = self._mlp(mu, self.head)
+        predicted_class_idx = np.argmax(logits, axis=1)
+
+        # Numerically stable softmax
+        probabilities = logits - logits.max(axis=1, keepdims=True)
+        np.exp(probabilities, out=probabilities)
+        probabilities /= probabilities.sum(axis=1, keepdims=True)
+
+        x_recon = self._mlp(mu, self.decoder)
+        reconstruction_error = np.square(x_recon - x).mean(axis=1)
+
+        return probabilities, predicted_class_idx, reconstruction_error
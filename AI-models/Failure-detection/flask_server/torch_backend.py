@@ -0,0 +1,212 @@
+"""PyTorch inference backend for the failure-detection service."""
+import os
+import json
+import numpy as np
+import torch
+import torch.nn as nn
+
+from base_model import BaseMaintenanceModel
+
+class VAE(nn.Module):
+    """Variational Autoencoder (VAE) for feature learning"""
+    def __init__(self, input_dim, hidden_dim, latent_dim):
+        super(VAE, self).__init__()
+        
+        # Encoder
+        self.encoder = nn.Sequential(
+            nn.Linear(input_dim, hidden_dim),
+            nn.ReLU(),
+            nn.Linear(hidden_dim, hidden_dim),
+            nn.ReLU()
+        )
+        
+        # Latent space layers
+        self.fc_mu = nn.Linear(hidden_dim, latent_dim)
+        self.fc_var = nn.Linear(hidden_dim, latent_dim)
+        
+        # Decoder
+        self.decoder = nn.Sequential(
+            nn.Linear(latent_dim, hidden_dim),
+            nn.ReLU(),
+            nn.Linear(hidden_dim, hidden_dim),
+            nn.ReLU(),
+            nn.Linear(hidden_dim, input_dim)
+        )
+    
+    def reparameterize(self, mu, log_var):
+        """Reparameterization trick to sample from N(mu, var)"""
+        std = torch.exp(0.5 * log_var)
+        eps = torch.randn_like(std)
+        return mu + eps * std
+    
+    def forward(self, x):
+        # Encode
+        h = self.encoder(x)
+        
+        # Get mu and log variance
+        mu = self.fc_mu(h)
+        log_var = self.fc_var(h)
+        
+        # Reparameterize
+        z = self.reparameterize(mu, log_var)
+        
+        # Decode
+        x_recon = self.decoder(z)
+        
+        return x_recon, mu, log_var
+
+class VAEClassifier(nn.Module):
+    """Classifier that uses VAE's latent representation"""
+    def __init__(self, vae, num_classes, head_dim=64):
+        super(VAEClassifier, self).__init__()
+        
+        # Freeze VAE parameters
+        for param in vae.parameters():
+            param.requires_grad = False
+        
+        self.vae = vae
+        
+        # Classification layers
+        self.classifier = nn.Sequential(
+            nn.Linear(vae.fc_mu.out_features, head_dim),
+            nn.ReLU(),
+            nn.Linear(head_dim, num_classes)
+        )
+    
+    def forward(self, x):
+        # Get latent representation through VAE
+        h = self.vae.encoder(x)
+        mu = self.vae.fc_mu(h)
+        
+        # Classify
+        return self.classifier(mu)
+    
+    def infer(self, x):
+        """Fused inference: one encoder pass feeds both heads.
+        
+        The latent mean `mu` is classified and also decoded directly (no
+        reparameterization noise), so the reconstruction error is
+        deterministic and the encoder runs once instead of twice.
+        
+        Returns logits, probabilities and per-sample reconstruction error.
+        """
+        h = self.vae.encoder(x)
+        mu = self.vae.fc_mu(h)
+        logits = self.classifier(mu)
+        probabilities = torch.softmax(logits, dim=1)
+        x_recon = self.vae.decoder(mu)
+        reconstruction_error = (x_recon - x).pow(2).mean(dim=1)
+        return logits, probabilities, reconstruction_error
+
+class PredictiveMaintenanceModel(BaseMaintenanceModel):
+    def __init__(self, models_dir='../Models'):
+        """Initialize the Predictive Maintenance Model"""
+        # Device configuration
+        self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+        
+        # Load preprocessing artifacts
+        self.load_preprocessing_artifacts(models_dir)
+        
+        # Initialize and load models
+        self.load_models(models_dir)
+    
+    def load_models(self, models_dir):
+        """Load pre-trained VAE and Classifier models
+        
+        The layer sizes are read from the checkpoint shapes, so models trained
+        with other hyperparameters (e.g. sweep.py's best_config.json) load too.
+        """
+        vae_path = os.path.join(models_dir, 'vae_model.pth')
+        if not os.path.exists(vae_path):
+            raise FileNotFoundError(f"VAE model not found at {vae_path}")
+        classifier_path = os.path.join(models_dir, 'classifier_model.pth')
+        if not os.path.exists(classifier_path):
+            raise FileNotFoundError(f"Classifier model not found at {classifier_path}")
+        vae_state = torch.load(vae_path, map_location=self.device)
+        classifier_state = torch.load(classifier_path, map_location=self.device)
+        
+        # Model hyperparameters
+        self.hidden_dim, self.input_dim = vae_state['encoder.0.weight'].shape
+        self.latent_dim = vae_state['fc_mu.weight'].shape[0]
+        head_dim = classifier_state['classifier.0.weight'].shape[0]
+        self.num_classes = classifier_state['classifier.2.weight'].shape[0]
+        
+        # Initialize VAE
+        self.vae = VAE(self.input_dim, self.hidden_dim, self.latent_dim).to(self.device)
+        self.vae.load_state_dict(vae_state)
+        
+        # Initialize Classifier
+        self.classifier = VAEClassifier(self.vae, self.num_classes, head_dim).to(self.device)
+        self.classifier.load_state_dict(classifier_state)
+        
+        # Set models to evaluation mode
+        self.vae.eval()
+        self.classifier.eval()
+    
+    def preprocess_data(self, data):
+        """Preprocess input data"""
+        # Scale the data
+        scaled_data = self.scaler.transform(data)
+        
+        # Convert to PyTorch tensor
+        return torch.tensor(scaled_data, dtype=torch.float32).to(self.device)
+    
+    def predict_arrays(self, data):
+        """Run the models on an (N, 8) feature matrix in one pass.
+        
+        Returns NumPy arrays: probabilities (N, num_classes), predicted class
+        indices (N,) and reconstruction errors (N,).
+        """
+        # Preprocess data
+        input_tensor = self.preprocess_data(data)
+        
+        with torch.no_grad():
+            # Classifier outputs and reconstruction error from a single encoder pass
+            outputs, probabilities, reconstruction_error = self.classifier.infer(input_tensor)
+            predicted_class_idx = torch.argmax(outputs, dim=1)
+        
+        return (probabilities.cpu().numpy(),
+                predicted_class_idx.cpu().numpy(),
+                reconstruction_error.cpu().numpy())
+
+    def embed(self, data):
+        """Latent means `mu` (N, latent_dim) of an (N, 8) feature matrix"""
+        input_tensor = self.preprocess_data(data)
+        with torch.no_grad():
+            mu = self.vae.fc_mu(self.vae.encoder(input_tensor))
+        return mu.cpu().numpy()
+
+class CompiledPredictiveMaintenanceModel(PredictiveMaintenanceModel):
+    """Serve the single TorchScript artifact written by export_model.py.
+    
+    The scaler is folded into the graph, so raw features go straight in as a
+    float32 tensor (no sklearn transform, no pickle) and the class names come
+    from the artifact's metadata.
+    """
+    def __init__(self, artifact_path):
+        self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+        extra_files = {'metadata.json': ''}
+        self.predictor = torch.jit.load(artifact_path, map_location=self.device, _extra_files=extra_files)
+        self.predictor.eval()
+        metadata = json.loads(extra_files['metadata.json'])
+        
+        self.input_dim = metadata['input_dim']
+        self.hidden_dim = metadata['hidden_dim']
+        self.latent_dim = metadata['latent_dim']
+        self.num_classes = metadata['num_classes']
+        self.classes = np.array(metadata['classes'])
+        # Fingerprint of the checkpoints it was exported from (None for older artifacts)
+        self.weights_sha1 = metadata.get('weights_sha1')
+    
+    def embed(self, data):
+        """The compiled graph only returns predictions"""
+        return BaseMaintenanceModel.embed(self, data)
+    
+    def predict_arrays(self, data):
+        """Run the compiled graph on an (N, 8) matrix of raw features"""
+        input_tensor = torch.as_tensor(np.asarray(data, dtype=np.float32), device=self.device)
+        with torch.no_grad():
+            probabilities, predicted_class_idx, reconstruction_error = self.predictor(input_tensor)
+        return (probabilities.cpu().numpy(),
+                predicted_class_idx.cpu().numpy(),
+                reconstruction_error.cpu().numpy())
@@ -1,47 +1,28 @@
 """
 Script to generate scaler.pkl from the training data
-This needs to be run once before starting the Flask server
+training.py already writes Models/scaler.pkl next to the weights; this script
+is only needed when the model files come without it. It fits the scaler with
+the same preprocessing.fit_scaler on the same data, so the result is identical
 """
-import pandas as pd
-from sklearn.preprocessing import StandardScaler
 import pickle
 import os
 
+from preprocessing import load_dataset, fit_scaler, BASE_DIR
+
 def generate_scaler():
     """Generate and save StandardScaler from training data"""
-    print("Loading dataset...")
-    df = pd.read_csv('Dataset/predictive_maintenance.csv')
-    
-    # Apply same preprocessing as in training.py
-    print("Preprocessing data...")
-    df_failure = df[df['Target'] == 1]
-    index_possible_failure = df_failure[df_failure['Failure Type'] == 'No Failure'].index
-    df.drop(index_possible_failure, axis=0, inplace=True)
-    
-    df.drop(["UDI", "Product ID"], axis=1, inplace=True)
-    df = pd.get_dummies(df, columns=['Type'], prefix='', prefix_sep='', drop_first=False)
-    
-    dummy_columns = [col for col in df.columns if col in ['H', 'L', 'M']]
-    df[dummy_columns] = df[dummy_columns].astype(float)
-    
-    # Extract features from normal behavior data
-    feature_columns = [
-        'Air temperature [K]', 'Process temperature [K]', 
-        'Rotational speed [rpm]', 'Torque [Nm]', 
-        'Tool wear [min]', 'H', 'L', 'M'
-    ]
-    
-    normal_behaviour_data = df[df['Target'] == 0]
-    X = normal_behaviour_data[feature_columns].values
+    # Same preprocessing as training.py (cached by preprocessing.load_dataset)
+    print("Loading preprocessed dataset...")
+    data = load_dataset(os.path.join(BASE_DIR, 'Dataset', 'predictive_maintenance.csv'))
     
-    # Fit StandardScaler
+    # Fit StandardScaler on the normal behavior data, as training.py does
     print("Fitting StandardScaler...")
-    scaler = StandardScaler()
-    scaler.fit(X)
+    scaler = fit_scaler(data)
     
     # Save scaler
-    output_path = 'Models/scaler.pkl'
-    os.makedirs('Models', exist_ok=True)
+    models_dir = os.path.join(BASE_DIR, 'Models')
+    output_path = os.path.join(models_dir, 'scaler.pkl')
+    os.makedirs(models_dir, exist_ok=True)
     
     print(f"Saving scaler to {output_path}...")
     with open(output_path, 'wb') as f:
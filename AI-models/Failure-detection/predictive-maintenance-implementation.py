@@ -1,10 +1,14 @@
 import os
+import time
 import pickle
+import argparse
 import numpy as np
 import pandas as pd
 import torch
 import torch.nn as nn
-from sklearn.preprocessing import StandardScaler, LabelEncoder
+from concurrent.futures import ProcessPoolExecutor
+
+from preprocessing import FEATURE_COLUMNS, feature_matrix, read_csv
 
 class VAE(nn.Module):
     """Variational Autoencoder (VAE) for feature learning"""
@@ -58,7 +62,7 @@ class VAE(nn.Module):
 
 class VAEClassifier(nn.Module):
     """Classifier that uses VAE's latent representation"""
-    def __init__(self, vae, num_classes):
+    def __init__(self, vae, num_classes, head_dim=64):
         super(VAEClassifier, self).__init__()
         
         # Freeze VAE parameters
@@ -69,9 +73,9 @@ class VAEClassifier(nn.Module):
         
         # Classification layers
         self.classifier = nn.Sequential(
-            nn.Linear(vae.fc_mu.out_features, 64),
+            nn.Linear(vae.fc_mu.out_features, head_dim),
             nn.ReLU(),
-            nn.Linear(64, num_classes)
+            nn.Linear(head_dim, num_classes)
         )
     
     def forward(self, x):
@@ -93,12 +97,6 @@ class PredictiveMaintenance:
         # Device configuration
         self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
         
-        # Model hyperparameters (should match training configuration)
-        self.input_dim = 8
-        self.hidden_dim = 128
-        self.latent_dim = 64
-        self.num_classes = 6
-        
         # Load preprocessing artifacts
         self.load_preprocessing_artifacts(models_dir)
         
@@ -112,13 +110,13 @@ class PredictiveMaintenance:
         Args:
             models_dir (str): Directory containing saved preprocessing artifacts
         """
-        # Load StandardScaler
+        # Load StandardScaler (saved by training.py; generate_scaler.py rebuilds the same one)
         scaler_path = os.path.join(models_dir, 'scaler.pkl')
         if os.path.exists(scaler_path):
             with open(scaler_path, 'rb') as f:
                 self.scaler = pickle.load(f)
         else:
-            self.scaler = StandardScaler()
+            raise FileNotFoundError(f"StandardScaler not found at {scaler_path} (run generate_scaler.py)")
         # Load LabelEncoder
         label_encoder_path = os.path.join(models_dir, 'label_encoder.pkl')
         if os.path.exists(label_encoder_path):
@@ -133,22 +131,32 @@ class PredictiveMaintenance:
         
         Args:
             models_dir (str): Directory containing saved model weights
+        
+        The layer sizes are read from the checkpoint shapes, so they always
+        match the training configuration.
         """
-        # Initialize VAE
-        self.vae = VAE(self.input_dim, self.hidden_dim, self.latent_dim).to(self.device)
         vae_path = os.path.join(models_dir, 'vae_model.pth')
-        if os.path.exists(vae_path):
-            self.vae.load_state_dict(torch.load(vae_path, map_location=self.device))
-        else:
+        if not os.path.exists(vae_path):
             raise FileNotFoundError(f"VAE model not found at {vae_path}")
-        
-        # Initialize Classifier
-        self.classifier = VAEClassifier(self.vae, self.num_classes).to(self.device)
         classifier_path = os.path.join(models_dir, 'classifier_model.pth')
-        if os.path.exists(classifier_path):
-            self.classifier.load_state_dict(torch.load(classifier_path, map_location=self.device))
-        else:
+        if not os.path.exists(classifier_path):
             raise FileNotFoundError(f"Classifier model not found at {classifier_path}")
+        vae_state = torch.load(vae_path, map_location=self.device)
+        classifier_state = torch.load(classifier_path, map_location=self.device)
+        
+        # Model hyperparameters
+        self.hidden_dim, self.input_dim = vae_state['encoder.0.weight'].shape
+        self.latent_dim = vae_state['fc_mu.weight'].shape[0]
+        head_dim = classifier_state['classifier.0.weight'].shape[0]
+        self.num_classes = classifier_state['classifier.2.weight'].shape[0]
+        
+        # Initialize VAE
+        self.vae = VAE(self.input_dim, self.hidden_dim, self.latent_dim).to(self.device)
+        self.vae.load_state_dict(vae_state)
+        
+        # Initialize Classifier
+        self.classifier = VAEClassifier(self.vae, self.num_classes, head_dim).to(self.device)
+        self.classifier.load_state_dict(classifier_state)
         
         # Set models to evaluation mode
         self.vae.eval()
@@ -164,46 +172,53 @@ class PredictiveMaintenance:
         Returns:
             torch.Tensor: Preprocessed and scaled data
         """
+        if isinstance(data, pd.DataFrame):
+            data = data[FEATURE_COLUMNS].values
         
-        # Scale the data
-        scaled_data = self.scaler.fit_transform(data)
+        # Scale the data with the training statistics (never refit on the input)
+        scaled_data = self.scaler.transform(np.asarray(data, dtype=np.float64))
                 
         # Convert to PyTorch tensor
         return torch.tensor(scaled_data, dtype=torch.float32).to(self.device)
     
-    def predict_anomaly(self, data):
+    def predict_arrays(self, data):
         """
-        Predict anomaly type for input data
+        Run the models on a whole feature matrix at once
         
         Args:
-            data (pd.DataFrame or np.ndarray): Input data to predict
+            data (pd.DataFrame or np.ndarray): (N, 8) input data
         
         Returns:
-            dict: Prediction results including class, probability, and decoded details
+            tuple: probabilities (N, num_classes), predicted class indices (N,)
+                and reconstruction errors (N,) as NumPy arrays
         """
-        # Preprocess data
         input_tensor = self.preprocess_data(data)
         
-        # Get classifier outputs
         with torch.no_grad():
-            outputs = self.classifier(input_tensor)
+            # One encoder pass feeds the classifier and a deterministic reconstruction
+            h = self.vae.encoder(input_tensor)
+            mu = self.vae.fc_mu(h)
+            outputs = self.classifier.classifier(mu)
             probabilities = torch.softmax(outputs, dim=1)
-            predicted_class_idx = torch.argmax(outputs, dim=1).cpu().numpy()
+            predicted_class_idx = torch.argmax(outputs, dim=1)
+            x_recon = self.vae.decoder(mu)
+            reconstruction_error = (x_recon - input_tensor).pow(2).mean(dim=1)
         
-        # Decode predictions
-        predicted_class = self.label_encoder.classes_[predicted_class_idx[0]]
-        prediction_prob = probabilities[0, predicted_class_idx[0]].item()
+        return (probabilities.cpu().numpy(),
+                predicted_class_idx.cpu().numpy(),
+                reconstruction_error.cpu().numpy())
+    
+    def predict_anomaly(self, data):
+        """
+        Predict anomaly type for input data
         
-        # Optional: Reconstruction for anomaly detection
-        with torch.no_grad():
-            x_recon, _, _ = self.vae(input_tensor)
-            reconstruction_error = nn.functional.mse_loss(x_recon, input_tensor, reduction='none').mean(dim=1).cpu().numpy()
+        Args:
+            data (pd.DataFrame or np.ndarray): Input data to predict
         
-        return {
-            'predicted_class': predicted_class,
-            'probability': prediction_prob,
-            'reconstruction_error': reconstruction_error[0]
-        }
+        Returns:
+            dict: Prediction results including class, probability, and decoded details
+        """
+        return self.batch_predict(data)[0]
     
     def batch_predict(self, data):
         """
@@ -215,40 +230,133 @@ class PredictiveMaintenance:
         Returns:
             list: List of prediction results for each input
         """
-        # Ensure input is a numpy array
-        if isinstance(data, pd.DataFrame):
-            feature_columns = ['Air temperature [K]', 'Process temperature [K]', 
-                               'Rotational speed [rpm]', 'Torque [Nm]', 
-                               'Tool wear [min]', 'H', 'L', 'M']
-            data = data[feature_columns].values
+        probabilities, predicted_class_idx, reconstruction_error = self.predict_arrays(data)
+        predicted_classes = self.label_encoder.classes_[predicted_class_idx]
+        prediction_probs = probabilities[np.arange(len(predicted_class_idx)), predicted_class_idx]
         
-        return [self.predict_anomaly(sample.reshape(1, -1)) for sample in data]
+        return [
+            {
+                'predicted_class': predicted_class,
+                'probability': float(prob),
+                'reconstruction_error': error
+            }
+            for predicted_class, prob, error in zip(predicted_classes, prediction_probs, reconstruction_error)
+        ]
 
-def main():
-    # Example usage
+def prepare_features(df):
+    """Build the 8 model features from raw predictive_maintenance.csv rows"""
+    return feature_matrix(df)
+
+# Per-process model used by the scoring pool (loaded once per worker)
+_worker_model = None
+
+def _init_worker(models_dir, num_threads):
+    global _worker_model
+    torch.set_num_threads(num_threads)
+    _worker_model = PredictiveMaintenance(models_dir)
+
+def _score_chunk(features):
+    return _worker_model.predict_arrays(features)
+
+def _results_frame(chunk, probabilities, predicted_class_idx, reconstruction_error, classes, id_columns):
+    results = chunk[[c for c in id_columns if c in chunk.columns]].reset_index(drop=True)
+    results['predicted_class'] = classes[predicted_class_idx]
+    results['probability'] = probabilities[np.arange(len(predicted_class_idx)), predicted_class_idx]
+    results['reconstruction_error'] = reconstruction_error
+    for idx, class_name in enumerate(classes):
+        results[f'prob_{class_name}'] = probabilities[:, idx]
+    return results
+
+def score_file(input_path, output_path, models_dir='Models', chunk_size=10000, workers=None,
+               id_columns=('UDI', 'Product ID')):
+    """
+    Score a CSV dataset offline in chunks
+    
+    The CSV is read chunk_size rows at a time; each chunk is scaled with the
+    saved scaler and scored with one batched forward in a pool of worker
+    processes, and results are appended to output_path (.csv or .parquet) in
+    input order. At most two chunks per worker are in flight, so memory stays
+    bounded whatever the file size.
     
-    # Initialize the predictive maintenance model
-    pm_model = PredictiveMaintenance()
+    Args:
+        input_path (str): CSV with the predictive_maintenance.csv columns
+        output_path (str): Destination .csv or .parquet file
+        models_dir (str): Directory containing saved models and preprocessing artifacts
+        chunk_size (int): Rows per chunk / forward pass
+        workers (int): Worker processes (default: all cores, 0 = score in-process)
+        id_columns (tuple): Input columns copied to the output to identify rows
     
-    # Load some sample data (replace with your actual data loading)
-    sample_data = pd.read_csv('Dataset/predictive_maintenance.csv')
+    Returns:
+        dict: Rows scored, elapsed seconds and rows per second
+    """
+    workers = os.cpu_count() if workers is None else workers
+    with open(os.path.join(models_dir, 'label_encoder.pkl'), 'rb') as f:
+        classes = pickle.load(f).classes_
+    writer = None
+    parquet = str(output_path).endswith('.parquet')
+    if os.path.dirname(output_path):
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    if os.path.exists(output_path):
+        os.remove(output_path)
     
-    sample_data.drop(["UDI", "Product ID","Target","Failure Type"], axis=1, inplace=True)
-    sample_data = pd.get_dummies(sample_data, columns=['Type'], prefix='', prefix_sep='', drop_first=False)
+    def write(results):
+        nonlocal writer
+        if parquet:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            table = pa.Table.from_pandas(results, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(output_path, table.schema)
+            writer.write_table(table)
+        else:
+            results.to_csv(output_path, mode='a', header=writer is None, index=False)
+            writer = True
+    
+    total_rows = 0
+    start_time = time.time()
+    chunks = read_csv(input_path, chunksize=chunk_size)
+    
+    if workers:
+        num_threads = max(1, (os.cpu_count() or 1) // workers)
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(models_dir, num_threads)) as executor:
+            pending = []
+            for chunk in chunks:
+                pending.append((chunk, executor.submit(_score_chunk, prepare_features(chunk))))
+                # Write finished chunks in order, keeping at most 2 per worker in flight
+                while pending and (len(pending) >= 2 * workers or pending[0][1].done()):
+                    done_chunk, future = pending.pop(0)
+                    write(_results_frame(done_chunk, *future.result(), classes, id_columns))
+                    total_rows += len(done_chunk)
+            for done_chunk, future in pending:
+                write(_results_frame(done_chunk, *future.result(), classes, id_columns))
+                total_rows += len(done_chunk)
+    else:
+        pm_model = PredictiveMaintenance(models_dir)
+        for chunk in chunks:
+            arrays = pm_model.predict_arrays(prepare_features(chunk))
+            write(_results_frame(chunk, *arrays, classes, id_columns))
+            total_rows += len(chunk)
     
-    dummy_columns = [col for col in sample_data.columns if col in ['H', 'L', 'M']]  # Adjust based on your specific column names
-    sample_data[dummy_columns] = sample_data[dummy_columns].astype(float)
+    if parquet and writer is not None:
+        writer.close()
     
-    # Predict for a single sample
-    single_sample_result = pm_model.predict_anomaly(sample_data.iloc[0:1])
-    print("Single Sample Prediction:")
-    print(single_sample_result)
+    elapsed = time.time() - start_time
+    return {'rows': total_rows, 'seconds': elapsed, 'rows_per_sec': total_rows / max(elapsed, 1e-9)}
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline chunked scoring of a predictive maintenance dataset')
+    parser.add_argument('--input', default='Dataset/predictive_maintenance.csv', help='CSV file to score')
+    parser.add_argument('--output', default='Results/scores.csv', help='Output .csv or .parquet file')
+    parser.add_argument('--models-dir', default='Models', help='Directory with the saved models and scaler')
+    parser.add_argument('--chunk-size', type=int, default=10000, help='Rows per chunk')
+    parser.add_argument('--workers', type=int, default=None, help='Worker processes (0 = in-process)')
+    args = parser.parse_args()
     
-    # Predict for multiple samples
-    batch_results = pm_model.batch_predict(sample_data)
-    print("\nBatch Predictions:")
-    for i, result in enumerate(batch_results):
-        print(f"Sample {i+1}: {result}")
+    stats = score_file(args.input, args.output, models_dir=args.models_dir,
+                       chunk_size=args.chunk_size, workers=args.workers)
+    print(f"Scored {stats['rows']} rows in {stats['seconds']:.2f}s "
+          f"({stats['rows_per_sec']:.0f} rows/s) -> {args.output}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,163 @@
+"""
+Shared preprocessing of predictive_maintenance.csv
+
+One definition of the model inputs, used by training.py, generate_scaler.py
+and the offline scoring in predictive-maintenance-implementation.py:
+
+- the CSV is read with explicit column dtypes
+- the "unlogical" rows (Target == 1 but Failure Type == 'No Failure') are dropped
+- the 8 features are built in FEATURE_COLUMNS order, with an explicit H/L/M one-hot
+- the Failure Type labels are encoded in sorted order (same as LabelEncoder)
+- the StandardScaler is fitted on the normal-behaviour rows (fit_scaler);
+  training.py saves it as Models/scaler.pkl and every model input, for the VAE
+  and the classifier alike, is scaled with it
+
+load_dataset caches the result as an .npz keyed by the SHA-1 of the CSV
+contents, so a repeated run skips parsing and only hashes the file. Editing
+the CSV (or bumping PREPROCESSING_VERSION) gives a new key and a fresh cache.
+
+Usage:
+    python preprocessing.py                    # build / refresh the cache
+    python preprocessing.py --no-cache         # time the uncached path
+"""
+import os
+import time
+import hashlib
+import argparse
+from collections import namedtuple
+import numpy as np
+import pandas as pd
+from sklearn.preprocessing import StandardScaler
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DATA_PATH = os.path.join(BASE_DIR, 'Dataset', 'predictive_maintenance.csv')
+DEFAULT_CACHE_DIR = os.path.join(BASE_DIR, 'Dataset', '.cache')
+
+# Bump when the steps below change, so stale caches are not reused
+PREPROCESSING_VERSION = 1
+
+MACHINE_TYPES = ['H', 'L', 'M']
+NUMERIC_COLUMNS = ['Air temperature [K]', 'Process temperature [K]',
+                   'Rotational speed [rpm]', 'Torque [Nm]', 'Tool wear [min]']
+FEATURE_COLUMNS = NUMERIC_COLUMNS + MACHINE_TYPES
+LABEL_COLUMN = 'Failure Type'
+NORMAL_CLASS = 'No Failure'
+
+# Dtypes of the raw CSV columns (columns missing from a file are ignored)
+CSV_DTYPES = {
+    'UDI': np.int64,
+    'Product ID': str,
+    'Type': str,
+    'Air temperature [K]': np.float64,
+    'Process temperature [K]': np.float64,
+    'Rotational speed [rpm]': np.float64,
+    'Torque [Nm]': np.float64,
+    'Tool wear [min]': np.float64,
+    'Target': np.int8,
+    'Failure Type': str,
+}
+
+# features: (N, 8) float64 in FEATURE_COLUMNS order
+# labels: (N,) int64 codes into classes; normal_mask: (N,) bool, Target == 0
+PreprocessedData = namedtuple('PreprocessedData', ['features', 'labels', 'classes', 'normal_mask'])
+
+def read_csv(csv_path, **kwargs):
+    """pd.read_csv with the explicit dtypes (the dataset starts with a UTF-8 BOM)"""
+    return pd.read_csv(csv_path, dtype=CSV_DTYPES, encoding='utf-8-sig', **kwargs)
+
+def drop_unlogical_rows(df):
+    """Drop rows flagged as failures whose Failure Type is still 'No Failure'"""
+    unlogical = (df['Target'] == 1) & (df[LABEL_COLUMN] == NORMAL_CLASS)
+    return df[~unlogical]
+
+def feature_matrix(df):
+    """
+    Build the 8 model features from raw predictive_maintenance.csv rows
+
+    The Type one-hot columns are built explicitly, so a chunk that happens to
+    contain only some machine types still gets all of H, L and M.
+    """
+    features = np.empty((len(df), len(FEATURE_COLUMNS)), dtype=np.float64)
+    for i, column in enumerate(NUMERIC_COLUMNS):
+        features[:, i] = df[column].to_numpy(dtype=np.float64)
+    for i, machine_type in enumerate(MACHINE_TYPES, start=len(NUMERIC_COLUMNS)):
+        if machine_type in df.columns:
+            features[:, i] = df[machine_type].to_numpy(dtype=np.float64)
+        else:
+            features[:, i] = (df['Type'] == machine_type).to_numpy(dtype=np.float64)
+    return features
+
+def preprocess(df):
+    """Raw CSV frame -> PreprocessedData"""
+    df = drop_unlogical_rows(df)
+    classes, labels = np.unique(df[LABEL_COLUMN].to_numpy(dtype=str), return_inverse=True)
+    return PreprocessedData(
+        features=feature_matrix(df),
+        labels=labels.astype(np.int64),
+        classes=classes,
+        normal_mask=(df['Target'] == 0).to_numpy(),
+    )
+
+def fit_scaler(data):
+    """StandardScaler fitted on the normal-behaviour rows of a PreprocessedData"""
+    return StandardScaler().fit(data.features[data.normal_mask])
+
+def file_sha1(path, chunk_size=1 << 20):
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(chunk_size), b''):
+            sha1.update(block)
+    return sha1.hexdigest()
+
+def cache_path(csv_path, cache_dir=DEFAULT_CACHE_DIR):
+    """Cache file of csv_path: <stem>-<content sha1>-v<version>.npz"""
+    stem = os.path.splitext(os.path.basename(csv_path))[0]
+    return os.path.join(cache_dir, f'{stem}-{file_sha1(csv_path)}-v{PREPROCESSING_VERSION}.npz')
+
+def load_dataset(csv_path=DEFAULT_DATA_PATH, cache_dir=DEFAULT_CACHE_DIR, use_cache=True):
+    """
+    Preprocessed features, labels and normal-behaviour mask of csv_path
+
+    Args:
+        csv_path (str): predictive_maintenance.csv (or a file with the same columns)
+        cache_dir (str): Directory of the cached .npz files
+        use_cache (bool): Read / write the cache (False always re-parses the CSV)
+
+    Returns:
+        PreprocessedData: features, labels, classes and normal_mask
+    """
+    if not use_cache:
+        return preprocess(read_csv(csv_path))
+
+    path = cache_path(csv_path, cache_dir)
+    if os.path.exists(path):
+        with np.load(path) as cached:
+            return PreprocessedData(**{name: cached[name] for name in PreprocessedData._fields})
+
+    data = preprocess(read_csv(csv_path))
+    os.makedirs(cache_dir, exist_ok=True)
+    # Write to a temporary file first so a concurrent reader never sees half a cache
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        np.savez(f, **data._asdict())
+    os.replace(tmp_path, path)
+    return data
+
+def main():
+    parser = argparse.ArgumentParser(description='Build the preprocessed-dataset cache')
+    parser.add_argument('--data', default=DEFAULT_DATA_PATH)
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR)
+    parser.add_argument('--no-cache', action='store_true', help='Parse the CSV without using the cache')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    data = load_dataset(args.data, args.cache_dir, use_cache=not args.no_cache)
+    elapsed = time.perf_counter() - start
+    print(f"{len(data.features)} rows ({int(data.normal_mask.sum())} normal), "
+          f"{len(data.classes)} classes in {elapsed * 1000:.1f} ms")
+    if not args.no_cache:
+        print(f"Cache: {cache_path(args.data, args.cache_dir)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,306 @@
+"""
+Parallel hyperparameter sweep for the VAE + classifier in training.py
+
+Trials run in a pool of worker processes. Each worker loads the dataset once
+and gets cpu_count // workers torch threads, so the pool uses every core
+without oversubscribing them. Every --report-every epochs a trial records its
+validation loss; a trial whose loss is worse than the median of the other
+trials of the same sweep at the same stage and epoch is pruned (median
+pruning).
+
+Results go to a SQLite table (sweep.db) plus results.csv, and the best trial
+is exported as best_config.json, which training.py accepts with --config.
+
+Usage:
+    python sweep.py --trials 24 --workers 4
+    python sweep.py --space space.json --grid
+    python training.py --fast --config Results/sweep/best_config.json
+
+A search space is a JSON object; each entry is a fixed value, a list to choose
+from, or {"log_uniform": [low, high]} / {"uniform": [low, high]}.
+"""
+import os
+import json
+import time
+import random
+import sqlite3
+import argparse
+import itertools
+import statistics
+import numpy as np
+import pandas as pd
+import torch
+import torch.nn as nn
+import torch.optim as optim
+from torch.utils.data import random_split
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import training
+
+DEFAULT_SPACE = {
+    'hidden_dim': [64, 128, 256],
+    'latent_dim': [16, 32, 64],
+    'head_dim': [32, 64],
+    'learning_rate': {'log_uniform': [1e-4, 3e-3]},
+    'batch_size': [64, 128, 256],
+    'epochs_vae': 300,
+    'epochs_classifier': 150,
+}
+
+def sample_configs(space, n_trials, seed=0, grid=False):
+    """Trial configurations drawn from the search space (or its full grid)"""
+    unknown = sorted(set(space) - set(training.DEFAULT_HYPERPARAMETERS))
+    if unknown:
+        raise ValueError(f"Unknown hyperparameters in search space: {unknown}")
+    base = dict(training.DEFAULT_HYPERPARAMETERS)
+    if grid:
+        if any(isinstance(v, dict) for v in space.values()):
+            raise ValueError("--grid needs every entry to be a fixed value or a list")
+        keys = list(space)
+        values = [v if isinstance(v, list) else [v] for v in space.values()]
+        return [{**base, **dict(zip(keys, combo))} for combo in itertools.product(*values)]
+
+    rng = random.Random(seed)
+    configs = []
+    for _ in range(n_trials):
+        config = dict(base)
+        for key, value in space.items():
+            if isinstance(value, list):
+                config[key] = rng.choice(value)
+            elif isinstance(value, dict) and 'log_uniform' in value:
+                low, high = value['log_uniform']
+                config[key] = float(np.exp(rng.uniform(np.log(low), np.log(high))))
+            elif isinstance(value, dict) and 'uniform' in value:
+                config[key] = rng.uniform(*value['uniform'])
+            else:
+                config[key] = value
+        configs.append(config)
+    return configs
+
+def connect(db_path):
+    conn = sqlite3.connect(db_path, timeout=60)
+    conn.execute('PRAGMA journal_mode=WAL')
+    return conn
+
+def create_tables(db_path):
+    with connect(db_path) as conn:
+        conn.execute('''CREATE TABLE IF NOT EXISTS trials (
+            trial_id INTEGER PRIMARY KEY, sweep TEXT, config TEXT, status TEXT,
+            vae_val_loss REAL, val_loss REAL, val_accuracy REAL,
+            epochs_vae_run INTEGER, epochs_classifier_run INTEGER,
+            pruned_at TEXT, seconds REAL, error TEXT)''')
+        conn.execute('''CREATE TABLE IF NOT EXISTS reports (
+            trial_id INTEGER, sweep TEXT, stage TEXT, epoch INTEGER, value REAL)''')
+        # Databases from before reports were tagged with their sweep and failures recorded
+        for table, column in (('reports', 'sweep'), ('trials', 'error')):
+            columns = [row[1] for row in conn.execute(f'PRAGMA table_info({table})')]
+            if column not in columns:
+                conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} TEXT')
+        conn.execute('CREATE INDEX IF NOT EXISTS reports_by_sweep ON reports (sweep, stage, epoch)')
+
+class TrialPruned(Exception):
+    pass
+
+# Per-process state of the sweep workers
+_worker = {}
+
+def _init_worker(data_path, num_threads, db_path):
+    torch.set_num_threads(num_threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        pass
+    _worker['data'] = training.load_training_data(data_path, verbose=False)
+    _worker['db_path'] = db_path
+
+def _report(trial_id, stage, epoch, value, settings):
+    """Record an intermediate validation loss; raise TrialPruned if it is worse than the
+    median of the other trials of the same sweep"""
+    with connect(_worker['db_path']) as conn:
+        others = [row[0] for row in conn.execute(
+            'SELECT value FROM reports WHERE sweep = ? AND stage = ? AND epoch = ? AND trial_id != ?',
+            (settings['sweep_id'], stage, epoch, trial_id))]
+        conn.execute('INSERT INTO reports (trial_id, sweep, stage, epoch, value) VALUES (?, ?, ?, ?, ?)',
+                     (trial_id, settings['sweep_id'], stage, epoch, value))
+    if (epoch >= settings['prune_warmup'] and len(others) >= settings['prune_min_trials']
+            and value > statistics.median(others)):
+        raise TrialPruned(f'{stage} epoch {epoch}')
+
+def run_trial(trial_id, config, settings):
+    """Train one configuration like `training.py --fast`; returns its metrics"""
+    start = time.perf_counter()
+    torch.manual_seed(settings['seed'] + trial_id)
+    X_normal, X_full, y_labels, label_encoder, _ = _worker['data']
+
+    # Same seeded splits as training.py, so every trial is scored on the same rows
+    split_generator = torch.Generator().manual_seed(settings['seed'])
+    vae_val_size = int(settings['vae_val_fraction'] * len(X_normal))
+    normal_train, normal_val = random_split(
+        range(len(X_normal)), [len(X_normal) - vae_val_size, vae_val_size], generator=split_generator)
+    X_normal_train = X_normal[torch.tensor(normal_train.indices)]
+    X_normal_val = X_normal[torch.tensor(normal_val.indices)]
+    train_size = int(0.9 * len(X_full))
+    train_split, val_split = random_split(
+        range(len(X_full)), [train_size, len(X_full) - train_size], generator=split_generator)
+
+    result = {'trial_id': trial_id, 'status': 'complete', 'vae_val_loss': None, 'val_loss': None,
+              'val_accuracy': None, 'epochs_vae_run': 0, 'epochs_classifier_run': 0, 'pruned_at': None,
+              'error': None}
+    report_every = settings['report_every']
+    try:
+        vae = training.VAE(X_normal.shape[1], config['hidden_dim'], config['latent_dim'])
+        optimizer = optim.Adam(vae.parameters(), lr=config['learning_rate'])
+        stopper = training.EarlyStopping(settings['patience_vae'])
+        best_state = None
+        for epoch in range(config['epochs_vae']):
+            training.train_vae_fast(vae, X_normal_train, optimizer, config['batch_size'])
+            val_loss = training.vae_loss_per_sample(vae, X_normal_val)
+            result['epochs_vae_run'] = epoch + 1
+            if stopper.step(val_loss, epoch):
+                best_state = {k: v.clone() for k, v in vae.state_dict().items()}
+            if stopper.should_stop:
+                break
+            if (epoch + 1) % report_every == 0:
+                _report(trial_id, 'vae', epoch + 1, val_loss, settings)
+        if best_state is not None:
+            vae.load_state_dict(best_state)
+        result['vae_val_loss'] = stopper.best_loss
+
+        classifier = training.VAEClassifier(vae, len(label_encoder.classes_), config['head_dim'])
+        optimizer = optim.Adam(classifier.parameters(), lr=config['learning_rate'])
+        criterion = nn.CrossEntropyLoss()
+        latents = training.compute_latents(vae, X_full)
+        train_idx, val_idx = torch.tensor(train_split.indices), torch.tensor(val_split.indices)
+        Z_train, y_train = latents[train_idx], y_labels[train_idx]
+        Z_val, y_val = latents[val_idx], y_labels[val_idx]
+        stopper = training.EarlyStopping(settings['patience_classifier'])
+        for epoch in range(config['epochs_classifier']):
+            training.train_classifier_fast(classifier.classifier, Z_train, y_train, optimizer,
+                                           criterion, config['batch_size'])
+            val_loss, val_accuracy = training.evaluate_classifier(classifier.classifier, Z_val, y_val, criterion)
+            result['epochs_classifier_run'] = epoch + 1
+            if stopper.step(val_loss, epoch):
+                result['val_loss'], result['val_accuracy'] = val_loss, val_accuracy
+            if stopper.should_stop:
+                break
+            if (epoch + 1) % report_every == 0:
+                _report(trial_id, 'classifier', epoch + 1, val_loss, settings)
+    except TrialPruned as e:
+        result['status'] = 'pruned'
+        result['pruned_at'] = str(e)
+    except Exception as e:
+        # One bad configuration (e.g. out of memory) must not stop the sweep
+        result['status'] = 'failed'
+        result['error'] = f'{type(e).__name__}: {e}'
+
+    result['seconds'] = time.perf_counter() - start
+    with connect(_worker['db_path']) as conn:
+        conn.execute('''UPDATE trials SET status = ?, vae_val_loss = ?, val_loss = ?, val_accuracy = ?,
+                        epochs_vae_run = ?, epochs_classifier_run = ?, pruned_at = ?, seconds = ?, error = ?
+                        WHERE trial_id = ?''',
+                     (result['status'], result['vae_val_loss'], result['val_loss'], result['val_accuracy'],
+                      result['epochs_vae_run'], result['epochs_classifier_run'], result['pruned_at'],
+                      result['seconds'], result['error'], trial_id))
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description='Parallel hyperparameter sweep for training.py')
+    parser.add_argument('--data', default=os.path.join(training.BASE_DIR, 'Dataset', 'predictive_maintenance.csv'))
+    parser.add_argument('--space', default=None, help='JSON search space (default: DEFAULT_SPACE)')
+    parser.add_argument('--trials', type=int, default=16, help='Random trials to draw (ignored with --grid)')
+    parser.add_argument('--grid', action='store_true', help='Run every combination of the list-valued entries')
+    parser.add_argument('--workers', type=int, default=None, help='Worker processes (default: min(trials, cores))')
+    parser.add_argument('--output-dir', default=os.path.join(training.BASE_DIR, 'Results', 'sweep'))
+    parser.add_argument('--report-every', type=int, default=10, help='Epochs between pruning checks')
+    parser.add_argument('--prune-warmup', type=int, default=20, help='No pruning before this epoch of a stage')
+    parser.add_argument('--prune-min-trials', type=int, default=3,
+                        help='Reports needed from other trials before a trial can be pruned')
+    parser.add_argument('--patience-vae', type=int, default=30)
+    parser.add_argument('--patience-classifier', type=int, default=15)
+    parser.add_argument('--vae-val-fraction', type=float, default=0.1)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    space = DEFAULT_SPACE
+    if args.space:
+        with open(args.space) as f:
+            space = json.load(f)
+    configs = sample_configs(space, args.trials, args.seed, args.grid)
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    db_path = os.path.join(args.output_dir, 'sweep.db')
+    create_tables(db_path)
+    sweep_id = time.strftime('%Y%m%d-%H%M%S')
+    with connect(db_path) as conn:
+        first_id = conn.execute('SELECT COALESCE(MAX(trial_id), 0) + 1 FROM trials').fetchone()[0]
+        trial_ids = list(range(first_id, first_id + len(configs)))
+        conn.executemany('INSERT INTO trials (trial_id, sweep, config, status) VALUES (?, ?, ?, ?)',
+                         [(tid, sweep_id, json.dumps(config), 'running') for tid, config in zip(trial_ids, configs)])
+
+    # Split the cores between the workers so torch never oversubscribes them
+    cores = os.cpu_count() or 1
+    workers = args.workers or min(len(configs), cores)
+    threads = max(1, cores // workers)
+    settings = {
+        'sweep_id': sweep_id,
+        'seed': args.seed,
+        'report_every': args.report_every,
+        'prune_warmup': args.prune_warmup,
+        'prune_min_trials': args.prune_min_trials,
+        'patience_vae': args.patience_vae,
+        'patience_classifier': args.patience_classifier,
+        'vae_val_fraction': args.vae_val_fraction,
+    }
+    print(f"Sweep {sweep_id}: {len(configs)} trials, {workers} workers x {threads} torch threads")
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(args.data, threads, db_path)) as executor:
+        futures = {executor.submit(run_trial, tid, config, settings): tid
+                   for tid, config in zip(trial_ids, configs)}
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                # The worker itself failed (e.g. it crashed or could not write to the database)
+                tid = futures[future]
+                error = f'{type(e).__name__}: {e}'
+                with connect(db_path) as conn:
+                    conn.execute("UPDATE trials SET status = 'failed', error = ? WHERE trial_id = ?", (error, tid))
+                print(f"  trial {tid}: failed ({error})")
+                continue
+            detail = (f"val loss {result['val_loss']:.4f}, val acc {result['val_accuracy']:.2f}%"
+                      if result['val_loss'] is not None else result['status'])
+            if result['status'] == 'pruned':
+                detail = f"pruned at {result['pruned_at']}"
+            elif result['status'] == 'failed':
+                detail = f"failed ({result['error']})"
+            print(f"  trial {result['trial_id']}: {detail} ({result['seconds']:.0f}s)")
+    print(f"Sweep finished in {time.perf_counter() - start:.0f}s")
+
+    with connect(db_path) as conn:
+        table = pd.read_sql_query('SELECT * FROM trials WHERE sweep = ?', conn, params=(sweep_id,))
+    table = pd.concat([table.drop(columns='config'),
+                       pd.DataFrame([json.loads(c) for c in table['config']])], axis=1)
+    table = table.sort_values('val_loss', na_position='last')
+    table.to_csv(os.path.join(args.output_dir, 'results.csv'), index=False)
+    print(table.head(10).to_string(index=False))
+
+    complete = table[table['status'] == 'complete']
+    if complete.empty:
+        print("No trial completed; nothing to export")
+        return
+    best = complete.iloc[0]
+    best_config = {key: best[key].item() if hasattr(best[key], 'item') else best[key]
+                   for key in training.DEFAULT_HYPERPARAMETERS}
+    with open(os.path.join(args.output_dir, 'best_config.json'), 'w') as f:
+        json.dump({
+            'config': best_config,
+            'metrics': {key: float(best[key]) for key in ('vae_val_loss', 'val_loss', 'val_accuracy')},
+            'trial_id': int(best['trial_id']),
+            'sweep': sweep_id
+        }, f, indent=2)
+    print(f"Best trial {int(best['trial_id'])}: {best_config}")
+
+if __name__ == '__main__':
+    main()
@@ -1,3 +1,7 @@
+import os
+import json
+import pickle
+import argparse
 import torch
 import torch.nn as nn
 import torch.optim as optim
@@ -5,9 +9,26 @@ import numpy as np
 from torch.utils.data import DataLoader, TensorDataset
 import pandas as pd
 import matplotlib.pyplot as plt
-from sklearn.preprocessing import StandardScaler,LabelEncoder
+from sklearn.preprocessing import LabelEncoder
 from torch.utils.data import random_split
 
+from preprocessing import load_dataset, fit_scaler, FEATURE_COLUMNS
+from training_profiler import NULL_PROFILER, TrainingProfiler
+from evaluation import evaluate_head, classification_metrics, reconstruction_errors, build_report, write_report
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Hyperparameters of the shipped model (vae_model.pth / classifier_model.pth)
+DEFAULT_HYPERPARAMETERS = {
+    'hidden_dim': 128,
+    'latent_dim': 64,
+    'head_dim': 64,
+    'learning_rate': 5*1e-5,
+    'batch_size': 8,
+    'epochs_vae': 1000,
+    'epochs_classifier': 200,
+}
+
 class VAE(nn.Module):
     def __init__(self, input_dim, hidden_dim, latent_dim):
         super(VAE, self).__init__()
@@ -58,7 +79,7 @@ class VAE(nn.Module):
         return x_recon, mu, log_var
 
 class VAEClassifier(nn.Module):
-    def __init__(self, vae, num_classes):
+    def __init__(self, vae, num_classes, head_dim=64):
         super(VAEClassifier, self).__init__()
         
         # Freeze VAE parameters
@@ -69,9 +90,9 @@ class VAEClassifier(nn.Module):
         
         # Classification layers
         self.classifier = nn.Sequential(
-            nn.Linear(vae.fc_mu.out_features, 32),
+            nn.Linear(vae.fc_mu.out_features, head_dim),
             nn.ReLU(),
-            nn.Linear(32, num_classes)
+            nn.Linear(head_dim, num_classes)
         )
     
     def forward(self, x):
@@ -81,6 +102,18 @@ class VAEClassifier(nn.Module):
         # Classify
         return self.classifier(mu)
 
+def compute_latents(vae, X, batch_size=4096):
+    """
+    Latent means mu of every row of X, computed once
+    The VAE is frozen while the classifier head trains, so VAEClassifier's
+    encoder + fc_mu pass gives the same mu every epoch; the head can train and
+    be validated on these cached tensors instead
+    """
+    vae.eval()
+    with torch.no_grad():
+        return torch.cat([vae.fc_mu(vae.encoder(X[i:i + batch_size]))
+                          for i in range(0, len(X), batch_size)])
+
 def vae_loss(recon_x, x, mu, log_var):
     """
     VAE Loss function:
@@ -94,133 +127,488 @@ def vae_loss(recon_x, x, mu, log_var):
     
     return recon_loss + kl_loss
 
-def train_vae(model, train_loader, optimizer, device):
+def train_vae(model, train_loader, optimizer, device, profiler=NULL_PROFILER):
     model.train()
     total_loss = 0
     
-    for batch in train_loader:
-        if len(batch) == 1:  # If it's the normal data
-            x = batch[0].to(device)
-        else:  # If it's the full data with labels
-            x, _ = batch  # Ignore the labels for the VAE
-            x = x.to(device)
-        
-        optimizer.zero_grad()
+    for batch in profiler.iterate(train_loader):
+        with profiler.phase('data'):
+            if len(batch) == 1:  # If it's the normal data
+                x = batch[0].to(device)
+            else:  # If it's the full data with labels
+                x, _ = batch  # Ignore the labels for the VAE
+                x = x.to(device)
         
         # Forward pass
-        x_recon, mu, log_var = model(x)
-        
-        # Compute loss
-        loss = vae_loss(x_recon, x, mu, log_var)
+        with profiler.phase('forward'):
+            x_recon, mu, log_var = model(x)
+            
+            # Compute loss
+            loss = vae_loss(x_recon, x, mu, log_var)
         
         # Backward pass
-        loss.backward()
-        optimizer.step()
+        with profiler.phase('backward'):
+            optimizer.zero_grad()
+            loss.backward()
+        with profiler.phase('optimizer'):
+            optimizer.step()
         
         total_loss += loss.item()
+        profiler.step(len(x))
     
     return total_loss / len(train_loader)
 
-def train_classifier(model, train_loader, optimizer, criterion, device):
+def train_classifier(model, train_loader, optimizer, criterion, device, profiler=NULL_PROFILER):
     model.train()
     total_loss = 0
     
-    for batch, labels in train_loader:
-        batch, labels = batch.to(device), labels.to(device)
-        
-        optimizer.zero_grad()
+    for batch, labels in profiler.iterate(train_loader):
+        with profiler.phase('data'):
+            batch, labels = batch.to(device), labels.to(device)
         
         # Forward pass
-        outputs = model(batch)
-        
-        # Compute loss
-        loss = criterion(outputs, labels)
+        with profiler.phase('forward'):
+            outputs = model(batch)
+            
+            # Compute loss
+            loss = criterion(outputs, labels)
         
         # Backward pass
-        loss.backward()
-        optimizer.step()
+        with profiler.phase('backward'):
+            optimizer.zero_grad()
+            loss.backward()
+        with profiler.phase('optimizer'):
+            optimizer.step()
         
         total_loss += loss.item()
+        profiler.step(len(batch))
     
     return total_loss / len(train_loader)
 
-def main():
-    # Hyperparameters
-    input_dim = 8  # Adjust based on your dataset
-    hidden_dim = 128
-    latent_dim = 64
-    num_classes = 6
-    learning_rate = 5*1e-5
-    epochs_vae = 1000
-    epochs_classifier = 200
-    
-    # Device configuration
-    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-    
-    df = pd.read_csv('Dataset/predictive_maintenance.csv')
-    
-    #deleting unlogical data
-    df_failure = df[df['Target'] == 1]
-    df_failure[df_failure['Failure Type'] == 'No Failure']
-    index_possible_failure = df_failure[df_failure['Failure Type'] == 'No Failure'].index
-    df.drop(index_possible_failure, axis=0, inplace=True)
-    
-    df.drop(["UDI", "Product ID"], axis=1, inplace=True)
-    df = pd.get_dummies(df, columns=['Type'], prefix='', prefix_sep='', drop_first=False)
+def scaled_learning_rate(base_lr, batch_size, base_batch_size=8, rule='sqrt'):
+    """
+    Learning rate for a larger batch than the one base_lr was tuned for
+    'linear' scales with the batch size, 'sqrt' with its square root (usually
+    the better fit for Adam), 'none' keeps base_lr
+    """
+    ratio = batch_size / base_batch_size
+    if rule == 'linear':
+        return base_lr * ratio
+    if rule == 'sqrt':
+        return base_lr * ratio ** 0.5
+    return base_lr
+
+def iterate_minibatches(num_samples, batch_size, shuffle=True, device='cpu'):
+    """Index batches over an in-memory dataset (a new permutation every epoch)"""
+    if shuffle:
+        indices = torch.randperm(num_samples, device=device)
+    else:
+        indices = torch.arange(num_samples, device=device)
+    return indices.split(batch_size)
+
+def train_vae_fast(model, X, optimizer, batch_size, profiler=NULL_PROFILER):
+    """
+    One VAE epoch over a tensor already on the training device
+    Batches are gathered by index instead of through a DataLoader and the
+    loss is accumulated on-tensor, so the only host sync is the final .item()
+    Returns the mean loss per sample
+    """
+    model.train()
+    total_loss = torch.zeros((), device=X.device)
     
-    dummy_columns = [col for col in df.columns if col in ['H', 'L', 'M']]  # Adjust based on your specific column names
-    df[dummy_columns] = df[dummy_columns].astype(float)
+    for idx in iterate_minibatches(len(X), batch_size, device=X.device):
+        with profiler.phase('data'):
+            x = X[idx]
         
-    feature_columns = ['Air temperature [K]', 'Process temperature [K]', 'Rotational speed [rpm]', 'Torque [Nm]', 'Tool wear [min]', 'H', 'L', 'M']
-    normal_behaviour_data = df[df['Target']==0]
-    print(normal_behaviour_data.head(5))
-    
-    X = normal_behaviour_data[feature_columns].values
+        with profiler.phase('forward'):
+            x_recon, mu, log_var = model(x)
+            loss = vae_loss(x_recon, x, mu, log_var)
+        with profiler.phase('backward'):
+            optimizer.zero_grad(set_to_none=True)
+            loss.backward()
+        with profiler.phase('optimizer'):
+            optimizer.step()
+        
+        total_loss += loss.detach()
+        profiler.step(len(idx))
     
+    return total_loss.item() / len(X)
+
+def train_classifier_fast(model, X, y, optimizer, criterion, batch_size, profiler=NULL_PROFILER):
+    """
+    One classifier epoch over tensors already on the training device
+    Returns the mean loss per sample (one host sync per epoch)
+    """
+    model.train()
+    total_loss = torch.zeros((), device=X.device)
+    
+    for idx in iterate_minibatches(len(X), batch_size, device=X.device):
+        with profiler.phase('data'):
+            x, labels = X[idx], y[idx]
+        with profiler.phase('forward'):
+            outputs = model(x)
+            loss = criterion(outputs, labels)
+        with profiler.phase('backward'):
+            optimizer.zero_grad(set_to_none=True)
+            loss.backward()
+        with profiler.phase('optimizer'):
+            optimizer.step()
+        
+        total_loss += loss.detach() * len(idx)
+        profiler.step(len(idx))
     
-    scaler = StandardScaler()
-    X = scaler.fit_transform(X)
+    return total_loss.item() / len(X)
+
+def evaluate_classifier(model, X, y, criterion, batch_size=4096):
+    """Validation loss per sample and accuracy (%) in one batched forward"""
+    result = evaluate_head(model, X, y, criterion, batch_size=batch_size)
+    return result['loss'], result['accuracy']
+
+def vae_loss_per_sample(model, X):
+    """
+    Mean VAE loss per sample over X, to compare runs and early-stop
+    Decodes mu instead of a sampled z, so the value is deterministic
+    """
+    model.eval()
+    with torch.no_grad():
+        h = model.encoder(X)
+        mu, log_var = model.fc_mu(h), model.fc_var(h)
+        return vae_loss(model.decoder(mu), X, mu, log_var).item() / len(X)
+
+def compare_training_loops(X_normal, device, epochs, batch_size, base_lr, lr_scaling, max_fast_epochs=None):
+    """
+    Wall-clock comparison of the DataLoader loop and the in-memory loop
+    The DataLoader loop (batch_size=8) runs for `epochs`; the in-memory loop
+    then trains a fresh VAE until it reaches the same final loss per sample
+    (or max_fast_epochs), and the times to get there are compared
+    """
+    import time
+    input_dim = X_normal.shape[1]
+    X_device = X_normal.to(device)
+    
+    torch.manual_seed(0)
+    reference = VAE(input_dim, 128, 64).to(device)
+    optimizer = optim.Adam(reference.parameters(), lr=base_lr)
+    loader = DataLoader(TensorDataset(X_normal), batch_size=8, shuffle=True)
+    start = time.perf_counter()
+    for epoch in range(epochs):
+        train_vae(reference, loader, optimizer, device)
+    reference_time = time.perf_counter() - start
+    target_loss = vae_loss_per_sample(reference, X_device)
+    print(f"DataLoader loop: {epochs} epochs (batch 8) in {reference_time:.1f}s, loss/sample {target_loss:.4f}")
+    
+    torch.manual_seed(0)
+    fast = VAE(input_dim, 128, 64).to(device)
+    lr = scaled_learning_rate(base_lr, batch_size, rule=lr_scaling)
+    optimizer = optim.Adam(fast.parameters(), lr=lr)
+    max_fast_epochs = max_fast_epochs or epochs * 10
+    fast_time = 0.0
+    fast_loss = float('inf')
+    epoch = 0
+    while epoch < max_fast_epochs:
+        start = time.perf_counter()
+        train_vae_fast(fast, X_device, optimizer, batch_size)
+        fast_time += time.perf_counter() - start
+        epoch += 1
+        # The comparison loss is evaluated outside the timed region
+        fast_loss = vae_loss_per_sample(fast, X_device)
+        if fast_loss <= target_loss:
+            break
+    reached = 'reached' if fast_loss <= target_loss else 'did not reach'
+    print(f"In-memory loop:  {epoch} epochs (batch {batch_size}, lr {lr:.2e}) in {fast_time:.1f}s, "
+          f"loss/sample {fast_loss:.4f} ({reached} the DataLoader loss)")
+    if fast_time > 0:
+        print(f"Speed-up at equal loss: {reference_time / fast_time:.1f}x")
+
+class EarlyStopping:
+    """
+    Tracks the best validation loss; should_stop once it has not improved by
+    more than min_delta for `patience` epochs (patience 0 never stops)
+    """
+    def __init__(self, patience=0, min_delta=0.0):
+        self.patience = patience
+        self.min_delta = min_delta
+        self.best_loss = float('inf')
+        self.best_epoch = -1
+        self.bad_epochs = 0
+    
+    def step(self, loss, epoch):
+        """Record one epoch; returns True if it is the new best"""
+        if loss < self.best_loss - self.min_delta:
+            self.best_loss = loss
+            self.best_epoch = epoch
+            self.bad_epochs = 0
+            return True
+        self.bad_epochs += 1
+        return False
+    
+    @property
+    def should_stop(self):
+        return self.patience > 0 and self.bad_epochs >= self.patience
+    
+    # Progress restored on resume; patience and min_delta come from the current run
+    STATE_KEYS = ('best_loss', 'best_epoch', 'bad_epochs')
+    
+    def state_dict(self):
+        return {key: getattr(self, key) for key in self.STATE_KEYS}
+    
+    def load_state_dict(self, state):
+        for key in self.STATE_KEYS:
+            setattr(self, key, state[key])
+
+def save_atomic(obj, path):
+    """torch.save through a temp file, so a crash never leaves a truncated checkpoint"""
+    tmp_path = path + '.tmp'
+    torch.save(obj, tmp_path)
+    os.replace(tmp_path, path)
+
+def fit(name, model, optimizer, run_epoch, epochs, stopper, best_path, state_path,
+        resume=False, checkpoint_every=1, device='cpu'):
+    """
+    Train `model` with early stopping, best-model and resumable checkpointing
+    run_epoch() trains one epoch and returns (train_loss, val_loss, extra dict).
+    The best weights are saved to best_path whenever the validation loss
+    improves; state_path holds everything needed to resume (weights, optimizer,
+    epoch, early-stopping state, history, best weights). On return the model
+    holds the best weights and the history is returned. A resumed run is
+    skipped only if it stopped early or already ran `epochs` epochs, so
+    resuming with a larger epoch budget keeps training
+    """
+    history = {'train_loss': [], 'val_loss': []}
+    best_state = None
+    start_epoch = 0
+    if resume and os.path.exists(state_path):
+        state = torch.load(state_path, map_location=device)
+        model.load_state_dict(state['model'])
+        optimizer.load_state_dict(state['optimizer'])
+        stopper.load_state_dict(state['stopper'])
+        history = state['history']
+        best_state = state['best_state']
+        start_epoch = state['epoch']
+        if stopper.should_stop or start_epoch >= epochs:
+            print(f"{name}: already finished (best epoch {stopper.best_epoch + 1}), skipping")
+            if best_state is not None:
+                model.load_state_dict(best_state)
+            return history
+        print(f"{name}: resuming at epoch {start_epoch + 1}")
+    
+    def checkpoint(next_epoch, finished):
+        save_atomic({
+            'model': model.state_dict(),
+            'optimizer': optimizer.state_dict(),
+            'stopper': stopper.state_dict(),
+            'history': history,
+            'best_state': best_state,
+            'epoch': next_epoch,
+            'finished': finished
+        }, state_path)
+    
+    epoch = start_epoch - 1
+    for epoch in range(start_epoch, epochs):
+        train_loss, val_loss, extra = run_epoch()
+        history['train_loss'].append(train_loss)
+        history['val_loss'].append(val_loss)
+        for key, value in extra.items():
+            history.setdefault(key, []).append(value)
+        
+        improved = stopper.step(val_loss, epoch)
+        if improved:
+            best_state = {k: v.detach().clone() for k, v in model.state_dict().items()}
+            save_atomic(best_state, best_path)
+        
+        extra_text = ''.join(f", {key}: {value:.2f}" for key, value in extra.items())
+        print(f"Epoch [{epoch+1}/{epochs}], Train Loss: {train_loss:.4f}, Val Loss: {val_loss:.4f}{extra_text}"
+              f"{' *' if improved else ''}")
+        
+        if stopper.should_stop:
+            print(f"{name}: early stopping, no improvement for {stopper.patience} epochs "
+                  f"(best epoch {stopper.best_epoch + 1}, val loss {stopper.best_loss:.4f})")
+            break
+        if checkpoint_every and (epoch + 1) % checkpoint_every == 0:
+            checkpoint(epoch + 1, finished=False)
+    
+    # 'finished' means stopped early; running out of epochs can be resumed with a larger budget
+    checkpoint(epoch + 1, finished=stopper.should_stop)
+    if best_state is not None:
+        model.load_state_dict(best_state)
+    return history
+
+def resolve_hyperparameters(config_path=None, overrides=None):
+    """
+    DEFAULT_HYPERPARAMETERS updated with a JSON file (either a plain dict or
+    sweep.py's best_config.json, which nests it under "config") and then with
+    the non-None overrides
+    """
+    hyperparameters = dict(DEFAULT_HYPERPARAMETERS)
+    from_config = {}
+    if config_path:
+        with open(config_path) as f:
+            from_config = json.load(f)
+        from_config = from_config.get('config', from_config)
+        unknown = sorted(set(from_config) - set(DEFAULT_HYPERPARAMETERS))
+        if unknown:
+            raise ValueError(f"Unknown hyperparameters in {config_path}: {unknown}")
+        hyperparameters.update(from_config)
+    hyperparameters.update({k: v for k, v in (overrides or {}).items() if v is not None})
+    # A tuned learning rate is used as-is; the default one is rescaled for bigger batches
+    hyperparameters['learning_rate_from_config'] = 'learning_rate' in from_config
+    return hyperparameters
+
+def load_training_data(data_path, verbose=True, use_cache=True, scaler=None):
+    """
+    Read predictive_maintenance.csv and build the training tensors
+    Returns (X_normal, X_full, y_labels, label_encoder, scaler): the scaled
+    features of the normal rows (VAE training), the scaled features of every
+    row (classifier training), their encoded Failure Type, the fitted
+    LabelEncoder and the StandardScaler both feature sets were scaled with.
+    The scaler is fitted on the normal rows, and the served model scales its
+    inputs with it (scaler.pkl) before both the VAE and the classifier; pass
+    an already fitted one (e.g. the saved scaler.pkl) to use it instead
+    Parsing goes through preprocessing.load_dataset, which caches the result
+    """
+    data = load_dataset(data_path, use_cache=use_cache)
+    if verbose:
+        print(pd.DataFrame(data.features[data.normal_mask][:5], columns=FEATURE_COLUMNS))
     
-    # Prepare your dataset (example)
-    # Replace this with your actual data loading
-    X_normal = torch.tensor(X, dtype=torch.float32)  # Normal behavior data
+    if scaler is None:
+        scaler = fit_scaler(data)
+    X = scaler.transform(data.features)
     
-    x_full = df[feature_columns].values
-    X_full = torch.tensor(x_full, dtype=torch.float32)    # Full dataset
+    X_normal = torch.tensor(X[data.normal_mask], dtype=torch.float32)  # Normal behavior data
+    X_full = torch.tensor(X, dtype=torch.float32)    # Full dataset
     
-    # Initialize the encoder
+    # Same encoding as LabelEncoder.fit_transform: classes in sorted order
     label_encoder = LabelEncoder()
+    label_encoder.classes_ = data.classes
+    if verbose:
+        print(label_encoder.classes_)
 
-    # Fit and transform the 'Failure Type' column
-    df['Failure Type Encoded'] = label_encoder.fit_transform(df['Failure Type'])
-    import pickle
-
-    with open('label_encoder.pkl', 'wb') as f:
-        pickle.dump(label_encoder, f)
-    print(label_encoder.classes_)
+    y_labels = torch.tensor(data.labels, dtype=torch.long)
+    
+    return X_normal, X_full, y_labels, label_encoder, scaler
 
-    y_labels = torch.tensor(df['Failure Type Encoded'].values, dtype=torch.long)
+def main():
+    parser = argparse.ArgumentParser(description='Train the VAE and the failure-type classifier')
+    parser.add_argument('--data', default=os.path.join(BASE_DIR, 'Dataset', 'predictive_maintenance.csv'))
+    parser.add_argument('--models-dir', default=os.path.join(BASE_DIR, 'Models'))
+    parser.add_argument('--results-dir', default=os.path.join(BASE_DIR, 'Results'))
+    parser.add_argument('--checkpoint-dir', default=None,
+                        help='Where resumable training state is kept (default: <models-dir>/checkpoints)')
+    parser.add_argument('--resume', action='store_true', help='Continue from the last checkpoint')
+    parser.add_argument('--checkpoint-every', type=int, default=1, help='Epochs between resumable checkpoints')
+    parser.add_argument('--patience-vae', type=int, default=50,
+                        help='Stop VAE training after this many epochs without improvement (0 disables)')
+    parser.add_argument('--patience-classifier', type=int, default=20,
+                        help='Stop classifier training after this many epochs without improvement (0 disables)')
+    parser.add_argument('--min-delta', type=float, default=0.0, help='Smallest decrease that counts as improvement')
+    parser.add_argument('--vae-val-fraction', type=float, default=0.1,
+                        help='Share of the normal data held out to early-stop the VAE')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the train/validation splits')
+    parser.add_argument('--no-data-cache', action='store_true',
+                        help='Re-parse the CSV instead of using the preprocessed-dataset cache')
+    parser.add_argument('--no-plots', action='store_true', help='Save the plots without showing them')
+    parser.add_argument('--fast', action='store_true',
+                        help='Train from in-memory tensors with index permutations instead of DataLoaders')
+    parser.add_argument('--config', default=None,
+                        help='JSON hyperparameters (e.g. best_config.json from sweep.py); flags below override it')
+    parser.add_argument('--batch-size', type=int, default=None)
+    parser.add_argument('--lr-scaling', choices=['sqrt', 'linear', 'none'], default='sqrt',
+                        help='How the default learning rate follows --batch-size (relative to batch 8)')
+    parser.add_argument('--epochs-vae', type=int, default=None)
+    parser.add_argument('--epochs-classifier', type=int, default=None)
+    parser.add_argument('--compare-loops', type=int, default=0, metavar='EPOCHS',
+                        help='Only time the DataLoader loop against the in-memory loop on the VAE and exit')
+    parser.add_argument('--profile', action='store_true',
+                        help='Time the data/forward/backward/optimizer phases of every training epoch')
+    parser.add_argument('--profile-trace', metavar='DIR',
+                        help='Also capture a short torch.profiler trace into DIR (implies --profile)')
+    parser.add_argument('--profile-trace-steps', type=int, default=10, help='Steps recorded in the trace')
+    args = parser.parse_args()
+    
+    # Hyperparameters: defaults, then --config, then explicit flags
+    hyperparameters = resolve_hyperparameters(args.config, {
+        'batch_size': args.batch_size,
+        'epochs_vae': args.epochs_vae,
+        'epochs_classifier': args.epochs_classifier
+    })
+    print(f"Hyperparameters: {hyperparameters}")
+    input_dim = 8  # Adjust based on your dataset
+    hidden_dim = hyperparameters['hidden_dim']
+    latent_dim = hyperparameters['latent_dim']
+    head_dim = hyperparameters['head_dim']
+    num_classes = 6
+    learning_rate = hyperparameters['learning_rate']
+    epochs_vae = hyperparameters['epochs_vae']
+    epochs_classifier = hyperparameters['epochs_classifier']
+    batch_size = hyperparameters['batch_size']
+    if args.fast and not hyperparameters['learning_rate_from_config']:
+        learning_rate = scaled_learning_rate(learning_rate, batch_size, rule=args.lr_scaling)
     
-    # Create DataLoaders
-    normal_dataset = TensorDataset(X_normal)
+    checkpoint_dir = args.checkpoint_dir or os.path.join(args.models_dir, 'checkpoints')
+    for directory in (args.models_dir, args.results_dir, checkpoint_dir):
+        os.makedirs(directory, exist_ok=True)
+    
+    # Device configuration
+    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
     
+    profiler = NULL_PROFILER
+    if args.profile or args.profile_trace:
+        profiler = TrainingProfiler(device, args.profile_trace, args.profile_trace_steps)
+    
+    def profiled(name, train_epoch):
+        # Phase timings cover the training pass only, not validation
+        if profiler is NULL_PROFILER:
+            return train_epoch()
+        profiler.start_epoch(name)
+        loss = train_epoch()
+        print(profiler.format(profiler.end_epoch()))
+        return loss
+    
+    X_normal, X_full, y_labels, label_encoder, scaler = load_training_data(args.data,
+                                                                            use_cache=not args.no_data_cache)
+    with open(os.path.join(args.models_dir, 'label_encoder.pkl'), 'wb') as f:
+        pickle.dump(label_encoder, f)
+    # The scaler the models are trained with is the one served
+    with open(os.path.join(args.models_dir, 'scaler.pkl'), 'wb') as f:
+        pickle.dump(scaler, f)
     
-    normal_loader = DataLoader(normal_dataset, batch_size=8, shuffle=True)
-    import os
+    if args.compare_loops:
+        compare_training_loops(X_normal, device, args.compare_loops, max(batch_size, 8),
+                               5*1e-5, args.lr_scaling)
+        return
     
+    # Fixed-seed splits, so a resumed run trains and validates on the same rows
+    split_generator = torch.Generator().manual_seed(args.seed)
+    normal_dataset = TensorDataset(X_normal)
+    vae_val_size = int(args.vae_val_fraction * len(normal_dataset))
+    normal_train_dataset, normal_val_dataset = random_split(
+        normal_dataset, [len(normal_dataset) - vae_val_size, vae_val_size], generator=split_generator)
+    
+    # Create DataLoaders
+    normal_loader = DataLoader(normal_train_dataset, batch_size=batch_size, shuffle=True)
+    X_normal_train = X_normal[torch.tensor(normal_train_dataset.indices)].to(device)
+    X_normal_val = X_normal[torch.tensor(normal_val_dataset.indices)].to(device)
     
     # Initialize VAE
     vae = VAE(input_dim, hidden_dim, latent_dim).to(device)
     vae_optimizer = optim.Adam(vae.parameters(), lr=learning_rate)
     
-    # Train VAE on normal data
-    print("Training VAE...")
-    for epoch in range(epochs_vae):
-        loss = train_vae(vae, normal_loader, vae_optimizer, device)
-        print(f"Epoch [{epoch+1}/{epochs_vae}], Loss: {loss:.4f}")
+    def run_vae_epoch():
+        if args.fast:
+            loss = profiled('VAE', lambda: train_vae_fast(vae, X_normal_train, vae_optimizer, batch_size, profiler))
+        else:
+            loss = profiled('VAE', lambda: train_vae(vae, normal_loader, vae_optimizer, device, profiler))
+        # Without a held-out set, early stopping falls back to the training loss
+        val_loss = vae_loss_per_sample(vae, X_normal_val) if len(X_normal_val) else loss
+        return loss, val_loss, {}
     
-    # Save VAE model
-    torch.save(vae.state_dict(), 'Models\vae_model.pth')
+    # Train VAE on normal data (vae_model.pth holds the best epoch so far)
+    print("Training VAE...")
+    fit('VAE', vae, vae_optimizer, run_vae_epoch, epochs_vae,
+        EarlyStopping(args.patience_vae, args.min_delta),
+        best_path=os.path.join(args.models_dir, 'vae_model.pth'),
+        state_path=os.path.join(checkpoint_dir, 'vae_last.pt'),
+        resume=args.resume, checkpoint_every=args.checkpoint_every, device=device)
 
     full_dataset = TensorDataset(X_full, y_labels)
     # Set the proportions for train and validation splits
@@ -228,84 +616,90 @@ def main():
     val_size = len(full_dataset) - train_size
 
     # Split the dataset
-    train_dataset, val_dataset = random_split(full_dataset, [train_size, val_size])
+    train_dataset, val_dataset = random_split(full_dataset, [train_size, val_size], generator=split_generator)
 
-    # Create DataLoaders
-    train_loader = DataLoader(train_dataset, batch_size=8, shuffle=True)
-    val_loader = DataLoader(val_dataset, batch_size=8, shuffle=False)
-    
     # Create Classifier
-    classifier = VAEClassifier(vae, num_classes).to(device)
+    classifier = VAEClassifier(vae, num_classes, head_dim).to(device)
     classifier_optimizer = optim.Adam(classifier.parameters(), lr=learning_rate)
     criterion = nn.CrossEntropyLoss()
     
+    # The VAE is frozen: embed the full dataset once and train/validate the
+    # head on the cached latents (the saved checkpoint is still the full VAEClassifier)
+    latents = compute_latents(vae, X_full.to(device))
+    train_idx = torch.tensor(train_dataset.indices, device=device)
+    val_idx = torch.tensor(val_dataset.indices, device=device)
+    Z_train, y_train = latents[train_idx], y_labels.to(device)[train_idx]
+    Z_val, y_val = latents[val_idx], y_labels.to(device)[val_idx]
+    head = classifier.classifier
     
-    
-
-    train_losses = []
-    val_losses = []
-    val_accuracies = []
-    # Train Classifier
+    # Create DataLoaders
+    train_loader = DataLoader(TensorDataset(Z_train, y_train), batch_size=batch_size, shuffle=True)
+    class_names = label_encoder.classes_.tolist()
+    
+    def run_classifier_epoch():
+        if args.fast:
+            train_loss = profiled('Classifier', lambda: train_classifier_fast(
+                head, Z_train, y_train, classifier_optimizer, criterion, batch_size, profiler))
+        else:
+            train_loss = profiled('Classifier', lambda: train_classifier(
+                head, train_loader, classifier_optimizer, criterion, device, profiler))
+        # The whole validation split in one forward; metrics come from the confusion matrix
+        result = evaluate_head(head, Z_val, y_val, criterion, num_classes)
+        macro_f1 = classification_metrics(result['confusion'].cpu())['macro']['f1']
+        return train_loss, result['loss'], {'Val Accuracy': result['accuracy'], 'Val Macro F1': 100 * macro_f1}
+    
+    # Train Classifier (classifier_model.pth holds the best epoch so far)
     print("\nTraining Classifier...")
-    for epoch in range(epochs_classifier):
-        train_loss = train_classifier(classifier, train_loader, classifier_optimizer, criterion, device)
-        train_losses.append(train_loss) 
-               
-        # Evaluate on the validation set
-        classifier.eval()  # Set the model to evaluation mode
-        val_loss = 0
-        correct = 0
-        total = 0
-        with torch.no_grad():
-            for batch, labels in val_loader:
-                batch, labels = batch.to(device), labels.to(device)
-                # Forward pass
-                outputs = classifier(batch)
-                # Compute validation loss
-                val_loss += criterion(outputs, labels).item()
-                    
-                                # Calculate accuracy
-                _, predicted = torch.max(outputs, 1)
-                correct += (predicted == labels).sum().item()
-                total += labels.size(0)
-        val_loss /= len(val_loader)
-        val_losses.append(val_loss)
-
-        val_accuracy = 100 * correct / total
-        val_accuracies.append(val_accuracy)
-
-        # Print epoch stats
-        print(f"Epoch [{epoch+1}/{epochs_classifier}], Train Loss: {train_loss:.4f}, Val Loss: {val_loss:.4f}, Val Accuracy: {val_accuracy:.2f}%")
-    # Save Classifier
-    torch.save(classifier.state_dict(), 'Models\classifier_model.pth')
+    history = fit('Classifier', classifier, classifier_optimizer, run_classifier_epoch, epochs_classifier,
+                  EarlyStopping(args.patience_classifier, args.min_delta),
+                  best_path=os.path.join(args.models_dir, 'classifier_model.pth'),
+                  state_path=os.path.join(checkpoint_dir, 'classifier_last.pt'),
+                  resume=args.resume, checkpoint_every=args.checkpoint_every, device=device)
+    train_losses = history['train_loss']
+    val_losses = history['val_loss']
+    val_accuracies = history.get('Val Accuracy', [])
+    epochs_run = range(1, len(train_losses) + 1)
+    
+    # Report of the best classifier on the validation split (X_full is scaled,
+    # so the reconstruction errors are on the scale the VAE was trained and is served on)
+    result = evaluate_head(head, Z_val, y_val, criterion, num_classes)
+    errors = reconstruction_errors(vae, X_full.to(device)[val_idx])
+    report = build_report(result['confusion'].cpu(), errors.cpu(), y_val.cpu(), class_names, loss=result['loss'],
+                          extra={'split': 'val', 'history': history})
+    write_report(report, os.path.join(args.results_dir, 'evaluation.json'))
+    if profiler is not NULL_PROFILER:
+        profiler.save(os.path.join(args.results_dir, 'training_profile.json'))
+        print(f"Training profile written to {os.path.join(args.results_dir, 'training_profile.json')}")
+    print(f"Validation: accuracy {report['accuracy'] * 100:.2f}%, macro F1 {report['macro']['f1']:.4f} "
+          f"(report in {os.path.join(args.results_dir, 'evaluation.json')})")
     
     # Plot training and validation loss
     plt.figure(figsize=(10, 5))
-    plt.plot(range(1, epochs_classifier + 1), train_losses, label='Train Loss')
-    plt.plot(range(1, epochs_classifier + 1), val_losses, label='Validation Loss')
+    plt.plot(epochs_run, train_losses, label='Train Loss')
+    plt.plot(epochs_run, val_losses, label='Validation Loss')
     plt.xlabel('Epoch')
     plt.ylabel('Loss')
     plt.title('Loss Variation Over Epochs')
     plt.legend()
     plt.grid()
     # Save the figure
-    plt.savefig('Results\loss_variation.png', dpi=300)  # Specify the file name and DPI for quality
-    plt.show()
+    plt.savefig(os.path.join(args.results_dir, 'loss_variation.png'), dpi=300)  # Specify the file name and DPI for quality
+    if not args.no_plots:
+        plt.show()
     
     # Plot Validation Accuracy
     plt.figure(figsize=(10, 5))
-    plt.plot(range(1, epochs_classifier + 1), val_accuracies, label='Validation Accuracy')
+    plt.plot(epochs_run, val_accuracies, label='Validation Accuracy')
     plt.xlabel('Epoch')
     plt.ylabel('Accuracy (%)')
     plt.title('Validation Accuracy Over Epochs')
     plt.legend()
     plt.grid()
     # Save the figure
-    plt.savefig('Results\accuracy_variation.png', dpi=300)
-    plt.show()
- 
-    
+    plt.savefig(os.path.join(args.results_dir, 'accuracy_variation.png'), dpi=300)
+    if not args.no_plots:
+        plt.show()
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,196 @@
+"""
+Opt-in throughput profiling of the training loops
+
+Used by both Failure-detection/training.py and
+Desagrigation-model/NILM_SIDED/train.py (which adds this directory to
+sys.path), so both projects write the same summary schema.
+
+TrainingProfiler splits every training step into phases:
+- data: waiting for the next batch and moving it to the device
+- forward: model forward pass and loss
+- backward: zero_grad, backward and (where the loop does it) unscaling and
+  gradient clipping
+- optimizer: optimizer (and grad-scaler) step
+Whatever is left of a step (loss bookkeeping, host syncs) is reported as
+'other'. Per epoch it reports samples per second, step-time percentiles and
+the seconds and share of each phase. On request the first steps of the first
+profiled epoch are captured with torch.profiler into a trace directory, with
+the phases labelled, for TensorBoard or chrome://tracing.
+
+Epoch summary schema (one entry of the saved 'epochs' list):
+    stage            what was trained, e.g. 'VAE', 'Classifier' or a model name
+    epoch            1-based epoch within the stage
+    seconds, steps, samples, samples_per_sec
+    step_ms          {'p50', 'p90', 'p99'} step time in milliseconds
+    phase_seconds    {phase: seconds} for data/forward/backward/optimizer/other
+    phase_share      {phase: share of the epoch time}
+
+On CUDA every phase boundary synchronizes the device so the times are real;
+that slows training down a little, which is why profiling is opt-in.
+NULL_PROFILER has the same interface and does nothing.
+"""
+import os
+import json
+import time
+from contextlib import nullcontext
+import numpy as np
+import torch
+
+PHASES = ('data', 'forward', 'backward', 'optimizer')
+STEP_PERCENTILES = (50, 90, 99)
+SCHEMA_VERSION = 1
+
+class NullProfiler:
+    """Profiler interface that records nothing (the default in the training loops)"""
+    def iterate(self, loader):
+        return loader
+
+    def phase(self, name):
+        return nullcontext()
+
+    def step(self, batch_size):
+        pass
+
+NULL_PROFILER = NullProfiler()
+
+class _Phase:
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+        self.label = None
+
+    def __enter__(self):
+        self.profiler._sync()
+        if self.profiler.trace is not None:
+            self.label = torch.profiler.record_function(self.name)
+            self.label.__enter__()
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.profiler._sync()
+        self.profiler.phase_seconds[self.name] += time.perf_counter() - self.start
+        if self.label is not None:
+            self.label.__exit__(*exc)
+        return False
+
+class TrainingProfiler(NullProfiler):
+    """
+    Per-epoch phase timing of a training loop
+
+    Args:
+        device: training device (CUDA is synchronized at phase boundaries)
+        trace_dir: if set, capture a torch.profiler trace into this directory
+        trace_steps: number of steps recorded in the trace (after 1 wait and 1 warm-up step)
+    """
+    def __init__(self, device='cpu', trace_dir=None, trace_steps=10):
+        self.device = torch.device(device)
+        self.trace_dir = str(trace_dir) if trace_dir else None
+        self.trace_steps = trace_steps
+        self.trace = None
+        self.traced = trace_dir is None
+        self.epochs = []
+        self.stage = None
+
+    def _sync(self):
+        if self.device.type == 'cuda':
+            torch.cuda.synchronize(self.device)
+
+    def start_epoch(self, stage, epoch=None):
+        """
+        Reset the per-epoch counters
+        `stage` tags the summary (e.g. 'VAE' or a model name); `epoch` is the
+        0-based epoch index, counted per stage when not given
+        """
+        self.stage = stage
+        if epoch is None:
+            epoch = sum(1 for e in self.epochs if e['stage'] == stage)
+        self.epoch = epoch
+        self.phase_seconds = dict.fromkeys(PHASES, 0.0)
+        self.step_seconds = []
+        self.samples = 0
+        if not self.traced:
+            os.makedirs(self.trace_dir, exist_ok=True)
+            activities = [torch.profiler.ProfilerActivity.CPU]
+            if self.device.type == 'cuda':
+                activities.append(torch.profiler.ProfilerActivity.CUDA)
+            self.trace = torch.profiler.profile(
+                activities=activities,
+                schedule=torch.profiler.schedule(wait=1, warmup=1, active=self.trace_steps, repeat=1),
+                on_trace_ready=torch.profiler.tensorboard_trace_handler(self.trace_dir, worker_name=str(stage)),
+                record_shapes=True)
+            self.trace.__enter__()
+            self.trace_remaining = self.trace_steps + 2
+            self.traced = True
+        self._sync()
+        self.epoch_start = self.last_step = time.perf_counter()
+
+    def iterate(self, loader):
+        """Yield from loader, timing the wait for each batch as 'data'"""
+        iterator = iter(loader)
+        while True:
+            with self.phase('data'):
+                try:
+                    batch = next(iterator)
+                except StopIteration:
+                    return
+            yield batch
+
+    def phase(self, name):
+        return _Phase(self, name)
+
+    def step(self, batch_size):
+        """Mark the end of a training step over batch_size samples"""
+        now = time.perf_counter()
+        self.step_seconds.append(now - self.last_step)
+        self.last_step = now
+        self.samples += batch_size
+        if self.trace is not None:
+            self.trace.step()
+            self.trace_remaining -= 1
+            if self.trace_remaining <= 0:
+                self._stop_trace()
+
+    def _stop_trace(self):
+        self.trace.__exit__(None, None, None)
+        self.trace = None
+        print(f"Profiler trace written to {self.trace_dir}")
+
+    def end_epoch(self):
+        """Close the epoch, store and return its summary"""
+        self._sync()
+        elapsed = time.perf_counter() - self.epoch_start
+        if self.trace is not None:
+            self._stop_trace()
+        steps = np.asarray(self.step_seconds) * 1000
+        phases = dict(self.phase_seconds)
+        phases['other'] = max(0.0, elapsed - sum(phases.values()))
+        summary = {
+            'stage': self.stage,
+            'epoch': self.epoch + 1,
+            'seconds': elapsed,
+            'steps': len(steps),
+            'samples': self.samples,
+            'samples_per_sec': self.samples / max(elapsed, 1e-9),
+            'step_ms': ({f'p{p}': float(v) for p, v in zip(STEP_PERCENTILES, np.percentile(steps, STEP_PERCENTILES))}
+                        if len(steps) else {}),
+            'phase_seconds': phases,
+            'phase_share': {k: v / max(elapsed, 1e-9) for k, v in phases.items()},
+        }
+        self.epochs.append(summary)
+        return summary
+
+    @staticmethod
+    def format(summary):
+        """One-line text form of an epoch summary"""
+        steps = ' '.join(f"{k} {v:.2f}" for k, v in summary['step_ms'].items())
+        shares = ' '.join(f"{k} {v * 100:.0f}%" for k, v in summary['phase_share'].items())
+        return f"  profile: {summary['samples_per_sec']:,.0f} samples/s | step ms {steps} | {shares}"
+
+    def save(self, path):
+        """Write every epoch summary to a JSON file"""
+        path = str(path)
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump({'schema_version': SCHEMA_VERSION, 'phases': list(PHASES) + ['other'],
+                       'epochs': self.epochs}, f, indent=2)